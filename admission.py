@@ -0,0 +1,181 @@
+"""
+Controle de admissão das requisições de chat.
+
+Cada requisição admitida dispara de 3 a 5 chamadas ao Gemini; sem limite, um pico
+esgota a cota e deixa todas as requisições lentas ao mesmo tempo. Aqui cada
+requisição ocupa uma vaga enquanto executa, com um limite global e um por api_key.
+Sem vaga, ela espera numa fila limitada até um prazo; fila cheia ou prazo esgotado
+viram Rejeitada (429 com Retry-After no main).
+
+Roda só no event loop (sem locks): entrar() e liberar() não podem ser chamados de
+outras threads.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+
+
+from metrics import registro
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_PER_KEY = int(os.getenv("ADMISSION_MAX_PER_KEY", "32"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+ESPERA = registro.histograma(
+    "eta_admission_wait_seconds", "Tempo na fila de admissão até a vaga (ou a rejeição).", ["outcome"]
+)
+ADMISSOES = registro.contador(
+    "eta_admission_total", "Requisições admitidas ou rejeitadas (fila cheia/prazo esgotado).", ["outcome"]
+)
+
+
+class Rejeitada(Exception):
+    """Requisição não admitida; `retry_after` é a sugestão (s) para o cliente tentar de novo."""
+
+    def __init__(self, motivo, retry_after):
+        super().__init__(motivo)
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+class Vaga:
+    """Vaga ocupada por uma requisição; liberar() pode ser chamado mais de uma vez."""
+
+    def __init__(self, controle, chave):
+        self._controle = controle
+        self.chave = chave
+        self.inicio = time.perf_counter()
+        self.espera = 0.0
+        self._liberada = False
+
+    def liberar(self):
+        if not self._liberada:
+            self._liberada = True
+            self._controle._sair(self)
+
+
+class _Pedido:
+    __slots__ = ("chave", "futuro", "entrada")
+
+    def __init__(self, chave, futuro):
+        self.chave = chave
+        self.futuro = futuro
+        self.entrada = time.perf_counter()
+
+
+class ControleAdmissao:
+    """Limites de execução simultânea (global e por chave) com fila FIFO limitada."""
+
+    def __init__(self, limite_global=ADMISSION_MAX_CONCURRENT, limite_por_chave=ADMISSION_MAX_PER_KEY,
+                 tamanho_fila=ADMISSION_QUEUE_SIZE, espera_max=ADMISSION_QUEUE_TIMEOUT):
+        # 0 desliga o respectivo limite
+        self.limite_global = limite_global
+        self.limite_por_chave = limite_por_chave
+        self.tamanho_fila = tamanho_fila
+        self.espera_max = espera_max
+        self.em_execucao = 0
+        self._por_chave = Counter()
+        self._fila = deque()
+        # Média móvel da duração das requisições, usada no Retry-After
+        self.duracao_media = 1.0
+        self.admitidas = 0
+        self.rejeitadas_fila = 0
+        self.rejeitadas_prazo = 0
+        self.espera_max_observada = 0.0
+
+    def _cabe(self, chave) -> bool:
+        if self.limite_global and self.em_execucao >= self.limite_global:
+            return False
+        return not (self.limite_por_chave and self._por_chave[chave] >= self.limite_por_chave)
+
+    def _ocupar(self, chave, espera) -> Vaga:
+        self.em_execucao += 1
+        self._por_chave[chave] += 1
+        self.admitidas += 1
+        self.espera_max_observada = max(self.espera_max_observada, espera)
+        ESPERA.observar(espera, outcome="admitted")
+        ADMISSOES.inc(outcome="admitted")
+        vaga = Vaga(self, chave)
+        vaga.espera = espera
+        return vaga
+
+    def retry_after(self) -> int:
+        """Segundos estimados até a fila atual escoar (entre 1 e 60)."""
+        vazao = self.limite_global or max(self.em_execucao, 1)
+        return max(1, min(60, math.ceil(self.duracao_media * (len(self._fila) + 1) / vazao)))
+
+    def _rejeitar(self, motivo, outcome, espera):
+        ESPERA.observar(espera, outcome=outcome)
+        ADMISSOES.inc(outcome=outcome)
+        raise Rejeitada(motivo, self.retry_after())
+
+    async def entrar(self, chave) -> Vaga:
+        """Ocupa uma vaga para `chave`, esperando na fila até o prazo se preciso."""
+        # Quem está na fila e cabe já foi despachado: os que restam esperam pela própria chave
+        if self._cabe(chave):
+            return self._ocupar(chave, 0.0)
+        if len(self._fila) >= self.tamanho_fila:
+            self.rejeitadas_fila += 1
+            self._rejeitar("Fila de atendimento cheia.", "rejected_full", 0.0)
+
+        pedido = _Pedido(chave, asyncio.get_running_loop().create_future())
+        self._fila.append(pedido)
+        try:
+            vaga = await asyncio.wait_for(asyncio.shield(pedido.futuro), self.espera_max)
+        except asyncio.TimeoutError:
+            if pedido.futuro.done():
+                return pedido.futuro.result()
+            self._fila.remove(pedido)
+            self.rejeitadas_prazo += 1
+            self._rejeitar("Tempo de espera na fila esgotado.", "rejected_timeout", time.perf_counter() - pedido.entrada)
+        except asyncio.CancelledError:
+            # Cliente desistiu: devolve a vaga se ela chegou a ser concedida
+            if pedido.futuro.done() and not pedido.futuro.cancelled():
+                pedido.futuro.result().liberar()
+            else:
+                pedido.futuro.cancel()
+                if pedido in self._fila:
+                    self._fila.remove(pedido)
+            raise
+        return vaga
+
+    def _sair(self, vaga):
+        self.em_execucao -= 1
+        self._por_chave[vaga.chave] -= 1
+        if self._por_chave[vaga.chave] <= 0:
+            del self._por_chave[vaga.chave]
+        self.duracao_media = 0.9 * self.duracao_media + 0.1 * (time.perf_counter() - vaga.inicio)
+        self._despachar()
+
+    def _despachar(self):
+        """Concede vagas aos primeiros da fila que cabem (uma chave no limite não trava as outras)."""
+        for pedido in list(self._fila):
+            if self.limite_global and self.em_execucao >= self.limite_global:
+                break
+            if pedido.futuro.done():
+                self._fila.remove(pedido)
+                continue
+            if self._cabe(pedido.chave):
+                self._fila.remove(pedido)
+                pedido.futuro.set_result(self._ocupar(pedido.chave, time.perf_counter() - pedido.entrada))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.em_execucao,
+            "max_concurrent": self.limite_global,
+            "max_per_key": self.limite_por_chave,
+            "keys_in_flight": len(self._por_chave),
+            "queue_depth": len(self._fila),
+            "queue_size": self.tamanho_fila,
+            "admitted": self.admitidas,
+            "rejected_full": self.rejeitadas_fila,
+            "rejected_timeout": self.rejeitadas_prazo,
+            "wait_time_max": self.espera_max_observada,
+            "avg_duration": self.duracao_media,
+        }
+
+
+controle_admissao = ControleAdmissao()
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respostas do fluxo RAG por similaridade semântica da pergunta.
+    Guarda (embedding da pergunta, saída do rag + juiz, _ids dos documentos usados) por
+    escopo (api_key); uma nova pergunta do mesmo escopo com cosseno >= limiar reaproveita
+    a resposta. Só entram respostas não personalizadas (sem histórico do rag); a
+    reformulação final, que usa o contexto de cada usuário, continua sendo feita.
+    Entradas expiram pelo TTL e são descartadas quando algum documento-fonte muda ou some.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, limiar=ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.limiar = limiar
+        self._entradas = OrderedDict()
+        self._matriz = None
+        self._chaves = []
+        self._escopos = []
+        self._proxima = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def _remover_expiradas(self):
+        agora = time.monotonic()
+        expiradas = [c for c, e in self._entradas.items() if e["expira"] <= agora]
+        for chave in expiradas:
+            del self._entradas[chave]
+        if expiradas:
+            self._matriz = None
+
+    def _indice(self):
+        if self._matriz is None:
+            self._chaves = list(self._entradas)
+            self._escopos = [self._entradas[c]["escopo"] for c in self._chaves]
+            self._matriz = (
+                np.vstack([self._entradas[c]["vetor"] for c in self._chaves])
+                if self._chaves else np.zeros((0, 0), dtype=np.float32)
+            )
+        return self._chaves, self._escopos, self._matriz
+
+    def buscar(self, vetor, escopo=None):
+        """Retorna a resposta em cache mais próxima do mesmo escopo, se passar do limiar."""
+        with self._lock:
+            self._remover_expiradas()
+            chaves, escopos, matriz = self._indice()
+            if not chaves:
+                self.misses += 1
+                return None
+            scores = matriz @ np.asarray(vetor, dtype=np.float32)
+            scores[[e != escopo for e in escopos]] = -np.inf
+            melhor = int(np.argmax(scores))
+            if scores[melhor] < self.limiar:
+                self.misses += 1
+                return None
+            chave = chaves[melhor]
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return self._entradas[chave]["resposta"]
+
+    def guardar(self, vetor, resposta, doc_ids, escopo=None):
+        with self._lock:
+            self._entradas[self._proxima] = {
+                "escopo": escopo,
+                "vetor": np.asarray(vetor, dtype=np.float32),
+                "resposta": resposta,
+                "docs": {str(d) for d in doc_ids},
+                "expira": time.monotonic() + self.ttl,
+            }
+            self._proxima += 1
+            while len(self._entradas) > self.maxsize:
+                self._entradas.popitem(last=False)
+            self._matriz = None
+
+    def invalidar_documentos(self, doc_ids):
+        """Remove as respostas que usaram algum dos documentos alterados."""
+        alterados = {str(d) for d in doc_ids}
+        with self._lock:
+            afetadas = [c for c, e in self._entradas.items() if e["docs"] & alterados]
+            for chave in afetadas:
+                del self._entradas[chave]
+            if afetadas:
+                self._matriz = None
+                self.invalidacoes += len(afetadas)
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+            self._matriz = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entradas),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidacoes,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache()
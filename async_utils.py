@@ -0,0 +1,20 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+SYNC_POOL_SIZE = int(os.getenv("SYNC_POOL_SIZE", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=SYNC_POOL_SIZE, thread_name_prefix="sync-io")
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Executa uma função bloqueante (psycopg2, redis-py, pymongo) no pool de threads
+    limitado, sem travar o event loop. O contexto (contextvars) é propagado.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    chamada = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor, chamada)
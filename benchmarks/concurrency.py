@@ -0,0 +1,139 @@
+"""
+Mede a vazão do /chat em um único worker variando o número de requisições simultâneas.
+
+As chains, a sessão e a busca vetorial são substituídas por versões que apenas
+esperam (asyncio.sleep / time.sleep), simulando a latência do Gemini, do Redis e do
+Postgres. Com o pipeline assíncrono a vazão deve crescer quase linearmente com a
+concorrência, até o limite do pool de threads (SYNC_POOL_SIZE).
+
+Uso:
+    python benchmarks/concurrency.py --latencia 0.2 --requisicoes 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+
+import main
+
+
+class ChainFalsa:
+    def __init__(self, resposta, latencia):
+        self.resposta = resposta
+        self.latencia = latencia
+
+    async def ainvoke(self, entrada, config=None):
+        await asyncio.sleep(self.latencia)
+        return self.resposta
+
+
+def chains_falsas(latencia):
+    return {
+        "router_chain": ChainFalsa("ROUTE=rag\nPERGUNTA_ORIGINAL=O que é floculação?", latencia),
+        "rag_chain": ChainFalsa("Floculação é a aglutinação de partículas.", latencia),
+        "judge_chain": ChainFalsa("CORRETA", latencia),
+        "mgr_assist_chain": ChainFalsa({"output": "ok"}, latencia),
+        "curador_chain": ChainFalsa({"output": ""}, latencia),
+        "router_classifier": ChainFalsa("ROUTE=rag", latencia),
+        "llm_flash": None,
+    }
+
+
+class GenaiProibido:
+    """No lugar do cliente genai: qualquer uso é um erro (etapa sem substituto falso)."""
+
+    def __init__(self):
+        self.usos = 0
+
+    def __getattr__(self, nome):
+        self.usos += 1
+        raise RuntimeError("o benchmark chegou ao cliente genai real")
+
+
+genai_proibido = GenaiProibido()
+
+
+def instalar_falsos(latencia, latencia_io):
+    chains = chains_falsas(latencia)
+
+    def sessao(email):
+        time.sleep(latencia_io)
+        return 1
+
+    def memorias(session_id):
+        time.sleep(latencia_io)
+        return []
+
+    def embeddings_sync(textos, usar_cache=True):
+        time.sleep(latencia_io)
+        return [np.ones(8, dtype=np.float32) / np.sqrt(8) for _ in textos]
+
+    async def embeddings(textos, usar_cache=True):
+        await asyncio.sleep(latencia_io)
+        return [np.ones(8, dtype=np.float32) / np.sqrt(8) for _ in textos]
+
+    def busca(query_embedding, k=3, backend=None):
+        time.sleep(latencia_io)
+        return []
+
+    main.get_session_id = sessao
+    main.get_memories = memorias
+    main.agerar_embeddings = embeddings
+    # Exemplos do pré-roteador e memórias também são embutidos: nada pode chegar ao genai real.
+    # Com vetores iguais o pré-roteador empata entre as rotas e tudo passa pelo roteador LLM.
+    main.pre_router._gerar_embeddings = embeddings_sync
+    main.memory_index._gerar_embeddings = embeddings_sync
+    main.resources.genai.definir(genai_proibido)
+    main.buscar_por_embedding = busca
+    # Mede o pipeline completo, não o cache de respostas
+    main.answer_cache.limiar = 2.0
+    main.initialize_system = lambda api_key: chains
+
+
+async def rodada(cliente, concorrencia, total):
+    """Retorna (req/s, requisições com erro)."""
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def uma():
+        async with semaforo:
+            r = await cliente.post(
+                "/chat",
+                params={"email": "bench@teste.com"},
+                headers={"Authorization": f"Bearer {main.API_TOKEN}"},
+                json={"user_message": "O que é floculação?", "api_key": "bench"},
+            )
+            return r.status_code == 200
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(uma() for _ in range(total)))
+    return total / (time.perf_counter() - inicio), resultados.count(False)
+
+
+async def executar(args) -> int:
+    instalar_falsos(args.latencia, args.latencia_io)
+    transporte = httpx.ASGITransport(app=main.app)
+    erros = 0
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        for concorrencia in args.concorrencias:
+            rps, falhas = await rodada(cliente, concorrencia, args.requisicoes)
+            erros += falhas
+            print(f"concorrência={concorrencia:<4} vazão={rps:8.1f} req/s erros={falhas}")
+    if genai_proibido.usos:
+        print(f"⚠️ {genai_proibido.usos} chamada(s) ao cliente genai real (falhas silenciosas no pipeline)")
+    return erros + genai_proibido.usos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia", type=float, default=0.2, help="latência simulada de cada chamada LLM (s)")
+    parser.add_argument("--latencia-io", type=float, default=0.01, help="latência simulada de Redis/Postgres (s)")
+    parser.add_argument("--requisicoes", type=int, default=64)
+    parser.add_argument("--concorrencias", type=int, nargs="+", default=[1, 4, 16, 64])
+    if asyncio.run(executar(parser.parse_args())):
+        sys.exit("❌ Benchmark com erros: a medição não é comparável")
@@ -0,0 +1,324 @@
+"""
+Substitutos locais dos serviços externos, usados pelos benchmarks:
+
+- ModeloFalso: chat model determinístico com latência configurável. Reconhece cada
+  chain pelo prompt de sistema e responde no formato que o main.py espera
+  (ROUTE=..., RESPOSTA_FINAL=..., CORRETA, chamadas de tools dos agentes).
+- EmbedderFalso: imita o genai.Client (models.embed_content e aio.models.embed_content)
+  com vetores pseudoaleatórios derivados do texto.
+- ColecaoFalsa: coleção de Q&A em memória para o backend vetorial "local".
+- conectar_sqlite: conexão SQLite com a interface de psycopg2 usada pelo db_pool,
+  traduzindo %s, ILIKE, NOW(), CAST(... AS DATE) e "= ANY(%s)" com uma lista.
+"""
+import asyncio
+import datetime
+import hashlib
+import re
+import sqlite3
+import time
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from pre_router import saida_sintetica
+
+# Mensagens do benchmark carregam a rota esperada: "... #rota=m,r"
+TAG_ROTA = re.compile(r"#rota=([mrg,]+)")
+
+
+# Chat model
+
+def _tool_call(nome, args):
+    return {"name": nome, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+
+
+class ModeloFalso(BaseChatModel):
+    """Chat model sem rede: espera `latencia` segundos e responde conforme a chain."""
+
+    latencia: float = 0.1
+
+    @property
+    def _llm_type(self) -> str:
+        return "modelo-falso"
+
+    def bind_tools(self, tools, **kwargs):
+        # As respostas já seguem o formato de tool calling; não há o que vincular
+        return self
+
+    def _responder(self, messages) -> AIMessage:
+        sistema = str(messages[0].content) if messages else ""
+        humanas = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        entrada = str(messages[humanas[-1]].content) if humanas else ""
+        usou_tool = bool(humanas) and any(isinstance(m, ToolMessage) for m in messages[humanas[-1] + 1:])
+
+        if "Juiz.AI" in sistema:
+            return AIMessage(content="CORRETA")
+        if "PERSONA RAG" in sistema:
+            return AIMessage(content=f"RESPOSTA_FINAL=Segundo a base, {entrada[:80]}\nFONTES_RESUMIDAS=Q&A da base")
+        if "ETA.Assist" in sistema:
+            if not usou_tool:
+                return AIMessage(content="", tool_calls=[_tool_call("listar_tarefas", {"nivel": "Alta"})])
+            return AIMessage(content="Estas são as tarefas de prioridade alta encontradas.")
+        if "Curador.AI" in sistema:
+            sessao = re.search(r"SessionID:(\S+)", entrada)
+            if sessao and not usou_tool:
+                conteudo = entrada.split("\nSessionID:")[0][:200]
+                return AIMessage(content="", tool_calls=[
+                    _tool_call("registrar_memoria", {"session_id": sessao.group(1), "content": conteudo})
+                ])
+            return AIMessage(content="Memória registrada.")
+        if "Você resume conversas" in sistema:
+            return AIMessage(content="Resumo: o usuário consultou tarefas e processos da ETA.")
+
+        # Roteador: reformulação final ou decisão de rota
+        if entrada.startswith("RESPOSTA_FINAL="):
+            return AIMessage(content=entrada.split("\nORIGEM=")[0][len("RESPOSTA_FINAL="):])
+        mensagem = entrada.split("Mensagem:", 1)[-1].strip()
+        tag = TAG_ROTA.search(mensagem)
+        if tag is None:
+            return AIMessage(content="Posso ajudar com tarefas, avisos e dúvidas sobre ETAs.")
+        return AIMessage(content=saida_sintetica(tag.group(1), mensagem))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latencia)
+        return ChatResult(generations=[ChatGeneration(message=self._responder(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latencia)
+        return ChatResult(generations=[ChatGeneration(message=self._responder(messages))])
+
+
+# Embeddings
+
+def vetor_falso(texto, dim) -> np.ndarray:
+    """Vetor determinístico (não normalizado) para o texto."""
+    semente = int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(semente).standard_normal(dim).astype(np.float32)
+
+
+class _Modelos:
+    def __init__(self, latencia, dim):
+        self.latencia = latencia
+        self.dim = dim
+        self.chamadas = 0
+        self.textos = 0
+
+    def _resultado(self, contents, config):
+        dim = getattr(config, "output_dimensionality", None) or self.dim
+        if len(contents) > 100:
+            # Mesmo limite do embed_content real
+            raise ValueError(f"embed_content aceita no máximo 100 textos, recebeu {len(contents)}")
+        self.chamadas += 1
+        self.textos += len(contents)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=vetor_falso(t, dim)) for t in contents])
+
+    def embed_content(self, model, contents, config=None):
+        time.sleep(self.latencia)
+        return self._resultado(contents, config)
+
+
+class _ModelosAsync(_Modelos):
+    async def embed_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latencia)
+        return self._resultado(contents, config)
+
+
+class EmbedderFalso:
+    """Mesma interface do genai.Client usada em vector_search."""
+
+    def __init__(self, latencia=0.02, dim=512):
+        self.models = _Modelos(latencia, dim)
+        self.aio = SimpleNamespace(models=_ModelosAsync(latencia, dim))
+
+
+# Coleção de Q&A
+
+class ColecaoFalsa:
+    """Coleção com o find() usado pelo LocalIndex (todos os docs ou updated_at > x)."""
+
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def find(self, filtro=None, projecao=None):
+        desde = ((filtro or {}).get("updated_at") or {}).get("$gt")
+        if desde is not None and desde.tzinfo is not None:
+            # Como o servidor: o filtro aware é comparado em UTC com os datetimes gravados
+            desde = desde.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        for doc in self.docs:
+            if desde is None or (doc.get("updated_at") and doc["updated_at"] > desde):
+                yield dict(doc)
+
+
+def documentos_qa(quantidade, dim=512):
+    # Sem fuso, como o pymongo devolve por padrão
+    agora = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    docs = []
+    for i in range(quantidade):
+        pergunta = f"Pergunta técnica {i} sobre tratamento de água"
+        vetor = vetor_falso(pergunta, dim)
+        docs.append({
+            "_id": f"qa{i}",
+            "question": pergunta,
+            "answer": f"Resposta técnica {i}.",
+            "embedding": (vetor / np.linalg.norm(vetor)).tolist(),
+            "updated_at": agora,
+        })
+    return docs
+
+
+# PostgreSQL -> SQLite
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS funcionario (id_funcionario INTEGER PRIMARY KEY, nome TEXT, email TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS prioridade (id_prioridade INTEGER PRIMARY KEY, nivel TEXT);
+CREATE TABLE IF NOT EXISTS status (id_status INTEGER PRIMARY KEY, status TEXT);
+CREATE TABLE IF NOT EXISTS tarefa (
+    id_tarefa INTEGER PRIMARY KEY,
+    descricao TEXT,
+    data_criacao TIMESTAMP,
+    data_conclusao TIMESTAMP,
+    id_prioridade INTEGER REFERENCES prioridade(id_prioridade),
+    id_funcionario INTEGER REFERENCES funcionario(id_funcionario),
+    id_status INTEGER REFERENCES status(id_status)
+);
+CREATE TABLE IF NOT EXISTS avisos (
+    id_aviso INTEGER PRIMARY KEY,
+    descricao TEXT,
+    data_ocorrencia TIMESTAMP,
+    id_eta INTEGER,
+    id_prioridade INTEGER REFERENCES prioridade(id_prioridade),
+    id_status INTEGER REFERENCES status(id_status)
+);
+"""
+
+TRADUCOES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bILIKE\b", re.IGNORECASE), "LIKE"),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"CAST\((\w+) AS DATE\)", re.IGNORECASE), r"DATE(\1)"),
+]
+
+
+def traduzir(query: str) -> str:
+    for padrao, troca in TRADUCOES:
+        query = padrao.sub(troca, query)
+    return query
+
+
+def _expandir_any(query, params):
+    """"coluna = ANY(%s)" com uma lista vira "coluna IN (%s, %s, ...)" (o SQLite não tem arrays)."""
+    partes = query.split("%s")
+    novos = []
+    saida = partes[0]
+    for parte, valor in zip(partes[1:], params):
+        if isinstance(valor, (list, tuple)) and re.search(r"=\s*ANY\($", saida, re.IGNORECASE):
+            saida = re.sub(r"=\s*ANY\($", "IN (", saida, flags=re.IGNORECASE)
+            saida += ", ".join(["%s"] * len(valor)) if valor else "NULL"
+            novos.extend(valor)
+        else:
+            saida += "%s"
+            novos.append(valor)
+        saida += parte
+    return saida, novos
+
+
+def _parametro(valor):
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    return valor
+
+
+class CursorSQLite:
+    def __init__(self, cursor, latencia):
+        self._cursor = cursor
+        self._latencia = latencia
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query, params=()):
+        if self._latencia:
+            time.sleep(self._latencia)
+        query, params = _expandir_any(query, list(params or ()))
+        self._cursor.execute(traduzir(query), [_parametro(p) for p in params])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoSQLite:
+    """O subconjunto da conexão psycopg2 usado pelo db_pool e pelas tools."""
+
+    def __init__(self, caminho, latencia=0.0):
+        self._conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False)
+        self._latencia = latencia
+        self.closed = 0
+
+    def cursor(self):
+        return CursorSQLite(self._conn.cursor(), self._latencia)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self.closed = 1
+
+
+def conectar_sqlite(caminho, latencia=0.0):
+    return ConexaoSQLite(caminho, latencia)
+
+
+def criar_banco_sqlite(caminho, funcionarios=50, tarefas_por_funcionario=5, avisos=20):
+    """Cria o esquema de tarefas/avisos e popula com dados sintéticos."""
+    prioridades = ["Alta", "Média", "Baixa"]
+    conn = sqlite3.connect(caminho)
+    try:
+        conn.executescript(ESQUEMA)
+        conn.executemany("INSERT INTO prioridade VALUES (?, ?)", list(enumerate(prioridades, 1)))
+        conn.executemany("INSERT INTO status VALUES (?, ?)", list(enumerate(["pendente", "andamento", "concluida"], 1)))
+        conn.executemany(
+            "INSERT INTO funcionario VALUES (?, ?, ?)",
+            [(i, f"Funcionário {i}", email_funcionario(i)) for i in range(1, funcionarios + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO tarefa (descricao, data_criacao, id_prioridade, id_funcionario, id_status) "
+            "VALUES (?, CURRENT_TIMESTAMP, ?, ?, 1)",
+            [
+                (f"Verificar filtro {j} da ETA", j % 3 + 1, i)
+                for i in range(1, funcionarios + 1)
+                for j in range(tarefas_por_funcionario)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO avisos (descricao, data_ocorrencia, id_eta, id_prioridade, id_status) "
+            "VALUES (?, CURRENT_TIMESTAMP, ?, ?, ?)",
+            [(f"Turbidez elevada no ponto {i}", i % 5 + 1, i % 3 + 1, i % 3 + 1) for i in range(avisos)],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def email_funcionario(i) -> str:
+    return f"bench{i}@eta.com"
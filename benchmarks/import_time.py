@@ -0,0 +1,83 @@
+"""
+Confere o custo de importar o main (cold start de cada worker do uvicorn).
+
+Importa o módulo em um processo novo com a rede bloqueada (qualquer socket aberto
+ou resolução DNS durante a importação é uma falha) e com -X importtime, e falha
+se o tempo passar do orçamento. Mostra os módulos com maior tempo acumulado.
+
+Uso:
+    python benchmarks/import_time.py --orcamento 3.0
+    python benchmarks/import_time.py --modulo chains --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado no processo filho: bloqueia a rede e mede a importação
+CODIGO = """
+import socket, sys, time
+
+def sem_rede(*args, **kwargs):
+    raise RuntimeError("acesso à rede durante a importação")
+
+socket.socket.connect = sem_rede
+socket.socket.connect_ex = sem_rede
+socket.getaddrinfo = sem_rede
+socket.create_connection = sem_rede
+inicio = time.perf_counter()
+import {modulo}
+print(time.perf_counter() - inicio)
+"""
+
+
+def medir(modulo):
+    """Retorna (segundos, [(acumulado_us, módulo)]) de uma importação em processo novo."""
+    env = dict(os.environ)
+    env.setdefault("API_TOKEN", "import-time")
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CODIGO.format(modulo=modulo)],
+        cwd=RAIZ, env=env, capture_output=True, text=True,
+    )
+    linhas = r.stderr.splitlines()
+    if r.returncode != 0:
+        erro = [l for l in linhas if not l.startswith("import time:")]
+        raise SystemExit(f"❌ Falha ao importar {modulo}:\n" + "\n".join(erro[-15:]))
+    modulos = []
+    for linha in linhas:
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha[len("import time:"):].split("|")
+        modulos.append((int(acumulado), nome.strip()))
+    return float(r.stdout.strip().splitlines()[-1]), modulos
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulo", default="main")
+    parser.add_argument("--orcamento", type=float, default=3.0, help="tempo máximo de importação (s)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="usa a mediana de N processos")
+    parser.add_argument("--top", type=int, default=10, help="módulos mais lentos exibidos")
+    args = parser.parse_args()
+
+    medicoes = [medir(args.modulo) for _ in range(args.repeticoes)]
+    tempo = statistics.median(t for t, _ in medicoes)
+    _, modulos = medicoes[-1]
+
+    # Só os módulos de topo (importados diretamente pelo projeto) dão uma visão útil
+    locais = {os.path.splitext(n)[0] for n in os.listdir(RAIZ) if n.endswith(".py")}
+    print(f"Módulos mais lentos (tempo acumulado, importação de {args.modulo}):")
+    for acumulado, nome in sorted(modulos, reverse=True)[: args.top]:
+        marca = "*" if nome in locais else " "
+        print(f"  {marca} {acumulado / 1000:8.1f}ms  {nome}")
+    print(f"\nimport {args.modulo}: {tempo:.3f}s (mediana de {args.repeticoes}), orçamento {args.orcamento:.3f}s")
+    if tempo > args.orcamento:
+        raise SystemExit("❌ Importação acima do orçamento")
+    print("✅ Dentro do orçamento")
+
+
+if __name__ == "__main__":
+    main_cli()
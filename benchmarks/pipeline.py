@@ -0,0 +1,219 @@
+"""
+Benchmark do pipeline completo do /chat, sem Gemini, Atlas, Redis nem PostgreSQL.
+
+Roda o main.app de verdade (roteamento, chains LangChain, agentes com tools, caches,
+pool de conexões, histórico e memórias) trocando apenas as bordas por substitutos
+locais (benchmarks/fakes.py): chat model falso com latência configurável, embedder
+falso, fakeredis, índice vetorial em memória e SQLite no lugar do PostgreSQL.
+
+Para cada nível de concorrência e cada rota (r, g, m, m,r, m,g) mede p50/p95/p99 e
+requisições/s. O resultado é salvo em JSON (com o commit atual) para comparar
+execuções entre commits com --comparar.
+
+Uso:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/pipeline.py --latencia-llm 0.1 --requisicoes 50 --concorrencias 1 8 32
+    python benchmarks/pipeline.py --comparar benchmarks/results/pipeline-<commit>.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import functools
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import httpx
+import numpy as np
+
+import fakes
+
+ROTAS = {
+    "r": "O que é floculação no processo {i}? #rota=r",
+    "g": "Liste as tarefas de prioridade alta da equipe {i} #rota=g",
+    "m": "Lembre que prefiro relatórios semanais, nota {i} #rota=m",
+    "m,r": "Lembre que trabalho na ETA {i}; o que é decantação? #rota=m,r",
+    "m,g": "Lembre que supervisiono a equipe {i} e liste as tarefas #rota=m,g",
+}
+
+
+def commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "desconhecido"
+
+
+def preparar(args):
+    """Configura o ambiente, importa o main e instala os substitutos locais."""
+    os.environ.setdefault("API_TOKEN", "bench")
+    os.environ.setdefault("api_key", "bench")
+    os.environ["VECTOR_BACKEND"] = "local"
+
+    import fakeredis
+    import chains
+    import db_pool
+    import main
+    import metrics
+    import pre_router
+    import redis_client
+    import resources
+    import vector_search
+
+    # Conferências em segundo plano do pré-roteador distorcem a medição
+    pre_router.PRE_ROUTER_SHADOW_RATE = 0.0
+
+    resources.genai.definir(fakes.EmbedderFalso(args.latencia_embedding, vector_search.EMBEDDING_DIM))
+    resources.mongo.definir({
+        vector_search.COLLECTION_QA: fakes.ColecaoFalsa(fakes.documentos_qa(args.documentos, vector_search.EMBEDDING_DIM))
+    })
+    redis_client.definir_cliente(fakeredis.FakeRedis())
+
+    caminho = os.path.join(tempfile.mkdtemp(prefix="bench-"), "eta.db")
+    fakes.criar_banco_sqlite(caminho, funcionarios=args.usuarios)
+    db_pool.configurar(fabrica=functools.partial(fakes.conectar_sqlite, caminho, args.latencia_sql))
+
+    def create_llm(api_key, model="gemini-2.5-flash", temperature=0.95):
+        latencia = args.latencia_llm_flash if model == "gemini-2.0-flash" else args.latencia_llm
+        return fakes.ModeloFalso(latencia=latencia, callbacks=[metrics.MetricasLLM(model)])
+
+    chains.create_llm = create_llm
+    return main
+
+
+def percentis(latencias) -> dict:
+    if not latencias:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "media_ms": None}
+    ms = np.asarray(latencias) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "media_ms": float(ms.mean())}
+
+
+async def rodada(main, cliente, rota, concorrencia, total, contador, usuarios):
+    semaforo = asyncio.Semaphore(concorrencia)
+    latencias, erros, origens = [], 0, {}
+
+    async def uma():
+        nonlocal erros
+        async with semaforo:
+            i = next(contador)
+            inicio = time.perf_counter()
+            try:
+                r = await cliente.post(
+                    "/chat",
+                    params={"email": fakes.email_funcionario(i % usuarios + 1)},
+                    headers={"Authorization": f"Bearer {main.API_TOKEN}"},
+                    # Mensagens únicas: mede o pipeline, não o cache de respostas/embeddings
+                    json={"user_message": ROTAS[rota].format(i=i), "api_key": "bench"},
+                )
+                r.raise_for_status()
+            except Exception:
+                erros += 1
+                return
+            latencias.append(time.perf_counter() - inicio)
+            origem = r.json()["origem"]
+            origens[origem] = origens.get(origem, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma() for _ in range(total)))
+    duracao = time.perf_counter() - inicio
+    return {
+        "rota": rota,
+        "concorrencia": concorrencia,
+        "requisicoes": total,
+        "erros": erros,
+        "rps": (total - erros) / duracao,
+        **percentis(latencias),
+        "origens": origens,
+    }
+
+
+async def executar(args):
+    main = preparar(args)
+    saida = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+    resultados = []
+    contador = itertools.count()
+    transporte = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+            with saida:
+                # Aquecimento: constrói as chains e carrega caches antes de medir
+                for rota in args.rotas:
+                    await rodada(main, cliente, rota, 1, 1, contador, args.usuarios)
+            for concorrencia in args.concorrencias:
+                for rota in args.rotas:
+                    with saida:
+                        resultado = await rodada(main, cliente, rota, concorrencia, args.requisicoes, contador, args.usuarios)
+                    resultados.append(resultado)
+                    print(
+                        f"rota={rota:<4} concorrência={concorrencia:<4} vazão={resultado['rps']:8.1f} req/s "
+                        f"p50={resultado['p50_ms'] or 0:8.1f}ms p95={resultado['p95_ms'] or 0:8.1f}ms "
+                        f"p99={resultado['p99_ms'] or 0:8.1f}ms erros={resultado['erros']}"
+                    )
+        # Espera curadorias e compactações em segundo plano antes de desligar
+        await asyncio.sleep(args.latencia_llm * 3)
+    return resultados
+
+
+def comparar(atual, caminho_base):
+    with open(caminho_base, encoding="utf-8") as arquivo:
+        base = json.load(arquivo)
+    anteriores = {(r["rota"], r["concorrencia"]): r for r in base["resultados"]}
+    print(f"\nComparação com {base['commit']} ({caminho_base}):")
+    for r in atual:
+        b = anteriores.get((r["rota"], r["concorrencia"]))
+        if not b or not b["p95_ms"] or not r["p95_ms"]:
+            continue
+        print(
+            f"rota={r['rota']:<4} concorrência={r['concorrencia']:<4} "
+            f"p95 {(r['p95_ms'] / b['p95_ms'] - 1) * 100:+6.1f}%  vazão {(r['rps'] / b['rps'] - 1) * 100:+6.1f}%"
+        )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia-llm", type=float, default=0.1, help="latência do modelo dos agentes (s)")
+    parser.add_argument("--latencia-llm-flash", type=float, default=0.05, help="latência do modelo flash (s)")
+    parser.add_argument("--latencia-embedding", type=float, default=0.02, help="latência do embed_content (s)")
+    parser.add_argument("--latencia-sql", type=float, default=0.002, help="latência de cada comando SQL (s)")
+    parser.add_argument("--requisicoes", type=int, default=50, help="requisições por rota e concorrência")
+    parser.add_argument("--concorrencias", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rotas", nargs="+", default=list(ROTAS), choices=list(ROTAS))
+    parser.add_argument("--usuarios", type=int, default=50, help="funcionários (sessões) distintos")
+    parser.add_argument("--documentos", type=int, default=1000, help="documentos de Q&A no índice local")
+    parser.add_argument("--saida", help="arquivo JSON (padrão: benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--verboso", action="store_true", help="mostra a saída dos agentes")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(executar(args))
+
+    commit = commit_atual()
+    caminho = args.saida or os.path.join(RAIZ, "benchmarks", "results", f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "commit": commit,
+            "data": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "parametros": vars(args),
+            "resultados": resultados,
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em {caminho}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any
+
+BRANCH_TIMEOUT = float(os.getenv("BRANCH_TIMEOUT", "60"))
+CURADOR_TIMEOUT = float(os.getenv("CURADOR_TIMEOUT", "15"))
+
+# Tarefas que seguem rodando após o timeout (ex: curadoria gravando memórias)
+_em_segundo_plano = set()
+
+
+@dataclass
+class ResultadoRamo:
+    nome: str
+    valor: Any = None
+    erro: BaseException | None = None
+    duracao: float = 0.0
+    expirou: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.erro is None and not self.expirou
+
+
+async def _executar_ramo(nome, coro, timeout, segundo_plano):
+    inicio = time.perf_counter()
+    tarefa = asyncio.ensure_future(coro)
+    try:
+        if segundo_plano:
+            # shield: o timeout libera a resposta, mas a tarefa continua até terminar
+            valor = await asyncio.wait_for(asyncio.shield(tarefa), timeout)
+        else:
+            valor = await asyncio.wait_for(tarefa, timeout)
+        return ResultadoRamo(nome, valor=valor, duracao=time.perf_counter() - inicio)
+    except asyncio.TimeoutError:
+        if segundo_plano:
+            _em_segundo_plano.add(tarefa)
+            tarefa.add_done_callback(_em_segundo_plano.discard)
+        return ResultadoRamo(nome, duracao=time.perf_counter() - inicio, expirou=True)
+    except Exception as e:
+        return ResultadoRamo(nome, erro=e, duracao=time.perf_counter() - inicio)
+
+
+async def executar_ramos(ramos: dict, timeouts: dict | None = None, segundo_plano=(), ao_concluir=None) -> dict:
+    """
+    Executa ramos independentes ao mesmo tempo e junta os resultados.
+    ramos: nome -> corrotina. Cada ramo tem seu próprio timeout; ramos em
+    segundo_plano não são cancelados quando expiram, apenas deixam de ser esperados.
+    ao_concluir(resultado), se informado, é aguardado assim que cada ramo termina.
+    """
+    timeouts = timeouts or {}
+    nomes = list(ramos)
+
+    async def executar(nome):
+        resultado = await _executar_ramo(nome, ramos[nome], timeouts.get(nome, BRANCH_TIMEOUT), nome in segundo_plano)
+        if ao_concluir is not None:
+            await ao_concluir(resultado)
+        return resultado
+
+    resultados = await asyncio.gather(*(executar(nome) for nome in nomes))
+    return dict(zip(nomes, resultados))
+
+
+def server_timing(tempos: dict) -> str:
+    """Formata os tempos (segundos) no padrão do header Server-Timing."""
+    return ", ".join(f"{nome};dur={duracao * 1000:.1f}" for nome, duracao in tempos.items())
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache LRU com limite de itens e expiração por TTL, seguro entre threads.
+    Cada item pode ter uma expiração própria (ex: meia-noite local).
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._dados = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chave, default=None):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                self.misses += 1
+                return default
+            valor, expira = item
+            if expira is not None and expira <= time.monotonic():
+                del self._dados[chave]
+                self.misses += 1
+                return default
+            self._dados.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def set(self, chave, valor, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expira = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._dados[chave] = (valor, expira)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.maxsize:
+                self._dados.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, chave, default=None):
+        with self._lock:
+            item = self._dados.pop(chave, None)
+            return default if item is None else item[0]
+
+    def peek(self, chave, default=None):
+        """Retorna o valor sem alterar a ordem LRU nem os contadores."""
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None or (item[1] is not None and item[1] <= time.monotonic()):
+                return default
+            return item[0]
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._dados)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+    def __contains__(self, chave):
+        return self.peek(chave) is not None
+
+    def __len__(self):
+        return len(self._dados)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._dados),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -1,11 +1,11 @@
-from langchain_community.chat_message_histories import ChatMessageHistory
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from dotenv import load_dotenv
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain.agents import create_tool_calling_agent,AgentExecutor
-from datetime import datetime
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+import hashlib
+import threading
+import time
 from prompts import system_prompt_judge,system_prompt_rag,system_prompt_roteador,fewshots_roteador,system_prompt_eta_gerente,fewshots_eta_gerente,system_prompt_curador
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
@@ -18,19 +18,11 @@ from langchain_core.prompts import (
 )
 from pg_tools import TOOLS
 from redis_tools import REDIS_TOOLS
-load_dotenv()
+from cache import TTLCache
+from history_store import history_store
+from metrics import MetricasLLM
 
 TZ=ZoneInfo('America/Sao_Paulo')
-load_dotenv()
-api_key = os.getenv('api_key')
-
-today=datetime.now(TZ).date()
-store={}
-def get_session_history(session_id) -> ChatMessageHistory:
-    """Retorna ou cria um histórico de chat da sessão."""
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
 
 
 def get_today_iso():
@@ -40,10 +32,13 @@ def get_today_iso():
 
 def create_llm(api_key: str, model: str = "gemini-2.5-flash", temperature: float = 0.95):
     """Cria e retorna uma instância do modelo generativo."""
+    # Importado aqui: o SDK custa ~0,6s e não é necessário para importar o app
+    from langchain_google_genai import ChatGoogleGenerativeAI
     return ChatGoogleGenerativeAI(
         model=model,
         temperature=temperature,
-        google_api_key=api_key
+        google_api_key=api_key,
+        callbacks=[MetricasLLM(model)]
     )
 
 
@@ -61,18 +56,27 @@ def build_judge_chain(llm_flash):
     return prompt | llm_flash | StrOutputParser()
 
 
-def build_router_chain(llm_flash):
-    prompt = ChatPromptTemplate.from_messages([
+def build_router_prompt():
+    return ChatPromptTemplate.from_messages([
         system_prompt_roteador,
         fewshots_roteador,
         MessagesPlaceholder("chat_history"),
         ("human", "{input}")
     ]).partial(today_local=get_today_iso())
 
+
+def build_router_classifier(llm_flash):
+    """Roteador sem histórico, usado para conferir o pré-roteador sem poluir as sessões."""
+    return build_router_prompt() | llm_flash | StrOutputParser()
+
+
+def build_router_chain(llm_flash):
+    prompt = build_router_prompt()
+
     chain = prompt | llm_flash | StrOutputParser()
     return RunnableWithMessageHistory(
         chain,
-        get_session_history=get_session_history,
+        get_session_history=history_store.para_chain("router"),
         input_messages_key="input",
         history_messages_key="chat_history"
     )
@@ -88,7 +92,7 @@ def build_rag_chain(llm_flash):
     chain = prompt | llm_flash | StrOutputParser()
     return RunnableWithMessageHistory(
         chain,
-        get_session_history=get_session_history,
+        get_session_history=history_store.para_chain("rag"),
         input_messages_key="input",
         history_messages_key="chat_history"
     )
@@ -108,7 +112,7 @@ def build_mgr_assist_chain(llm, tools=TOOLS):
 
     return RunnableWithMessageHistory(
         executor,
-        get_session_history=get_session_history,
+        get_session_history=history_store.para_chain("gerente"),
         input_messages_key="input",
         history_messages_key="chat_history"
     )
@@ -127,14 +131,14 @@ def build_curador_chain(llm, tools=REDIS_TOOLS):
 
     return RunnableWithMessageHistory(
         executor,
-        get_session_history=get_session_history,
+        get_session_history=history_store.para_chain("curador"),
         input_messages_key="input",
         history_messages_key="chat_history"
     )
 
 
-def initialize_system(api_key: str):
-    """Inicializa todo o sistema com a chave API informada."""
+def build_system(api_key: str):
+    """Constrói todos os clientes e chains para a chave API informada."""
 
     llm = create_llm(api_key)
     llm_flash = create_llm_flash(api_key)
@@ -142,9 +146,90 @@ def initialize_system(api_key: str):
     return {
         "judge_chain": build_judge_chain(llm_flash),
         "router_chain": build_router_chain(llm_flash),
+        "router_classifier": build_router_classifier(llm_flash),
         "rag_chain": build_rag_chain(llm_flash),
         "mgr_assist_chain": build_mgr_assist_chain(llm),
         "curador_chain": build_curador_chain(llm),
         "llm": llm,
         "llm_flash": llm_flash
-    }
\ No newline at end of file
+    }
+
+
+# Registro de chains por chave API:
+
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "32"))
+CHAIN_CACHE_TTL = float(os.getenv("CHAIN_CACHE_TTL", "3600"))
+
+
+def seconds_until_midnight() -> float:
+    """Segundos até a próxima meia-noite local (America/Sao_Paulo)."""
+    agora = datetime.now(TZ)
+    meia_noite = datetime.combine(agora.date() + timedelta(days=1), datetime.min.time(), tzinfo=TZ)
+    return max((meia_noite - agora).total_seconds(), 1.0)
+
+
+class ChainRegistry:
+    """
+    Mantém os sistemas já construídos por hash da chave API.
+    As entradas expiram pelo TTL ou na meia-noite local, o que vier primeiro,
+    para que o partial today_local seja sempre o do dia.
+    """
+
+    def __init__(self, maxsize: int = CHAIN_CACHE_SIZE, ttl: float = CHAIN_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.builds = 0
+        self.build_time_total = 0.0
+        self.build_time_max = 0.0
+
+    @staticmethod
+    def key_for(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def _lock_for(self, chave: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(chave, threading.Lock())
+
+    def get(self, api_key: str) -> dict:
+        chave = self.key_for(api_key)
+        sistema = self._cache.get(chave)
+        if sistema is not None:
+            return sistema
+
+        with self._lock_for(chave):
+            # Outra thread pode ter construído enquanto esperávamos
+            sistema = self._cache.peek(chave)
+            if sistema is not None:
+                return sistema
+
+            inicio = time.perf_counter()
+            sistema = build_system(api_key)
+            duracao = time.perf_counter() - inicio
+
+            self.builds += 1
+            self.build_time_total += duracao
+            self.build_time_max = max(self.build_time_max, duracao)
+            self._cache.set(chave, sistema, ttl=min(self._cache.ttl, seconds_until_midnight()))
+            return sistema
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        dados = self._cache.stats()
+        dados.update({
+            "builds": self.builds,
+            "build_time_total": self.build_time_total,
+            "build_time_avg": self.build_time_total / self.builds if self.builds else 0.0,
+            "build_time_max": self.build_time_max,
+        })
+        return dados
+
+
+registry = ChainRegistry()
+
+
+def initialize_system(api_key: str):
+    """Retorna o sistema da chave API, reutilizando clientes e prompts já construídos."""
+    return registry.get(api_key)
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+import tracing
+
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera."""
+
+
+def conectar():
+    """Abre uma nova conexão com o PostgreSQL usando as variáveis de ambiente."""
+    return psycopg2.connect(
+        dbname=os.getenv('database'),
+        user=os.getenv('user'),
+        password=os.getenv('senha'),
+        host=os.getenv('host'),
+        port=os.getenv('porta')
+    )
+
+
+class ConnectionPool:
+    """
+    Pool de conexões limitado a `maxconn`, seguro entre threads.
+    Quando todas estão em uso, quem pede espera até `timeout` segundos.
+    Conexões fechadas ou que falharam por erro de rede são descartadas.
+    """
+
+    def __init__(self, fabrica=conectar, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX, timeout=PG_POOL_TIMEOUT):
+        self._fabrica = fabrica
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._livres = []
+        self._lock = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(maxconn)
+        self.em_uso = 0
+        self.aguardando = 0
+        self.checkouts = 0
+        self.criadas = 0
+        self.descartadas = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        for _ in range(minconn):
+            try:
+                self._livres.append(self._nova())
+            except Exception:
+                break
+
+    def _nova(self):
+        conn = self._fabrica()
+        self.criadas += 1
+        return conn
+
+    def obter(self):
+        inicio = time.perf_counter()
+        with self._lock:
+            self.aguardando += 1
+        try:
+            ok = self._vagas.acquire(timeout=self.timeout)
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._lock:
+                self.aguardando -= 1
+                self.espera_total += espera
+                self.espera_max = max(self.espera_max, espera)
+        if not ok:
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"Nenhuma conexão livre após {self.timeout}s.")
+
+        try:
+            conn = None
+            with self._lock:
+                while self._livres and conn is None:
+                    conn = self._livres.pop()
+                    if conn.closed:
+                        self.descartadas += 1
+                        conn = None
+            if conn is None:
+                conn = self._nova()
+        except Exception:
+            self._vagas.release()
+            raise
+
+        with self._lock:
+            self.em_uso += 1
+            self.checkouts += 1
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        try:
+            if not descartar and not conn.closed:
+                # Garante que nenhuma transação aberta volte para o pool
+                conn.rollback()
+        except Exception:
+            descartar = True
+
+        with self._lock:
+            self.em_uso -= 1
+            if descartar or conn.closed:
+                self.descartadas += 1
+            else:
+                self._livres.append(conn)
+        if descartar and not conn.closed:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._vagas.release()
+
+    @contextmanager
+    def conexao(self):
+        conn = self.obter()
+        descartar = False
+        try:
+            yield tracing.envolver_conexao(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            descartar = True
+            raise
+        finally:
+            self.devolver(conn, descartar=descartar)
+
+    @contextmanager
+    def transacao(self):
+        """Conexão com commit ao final do bloco (rollback se houver exceção)."""
+        with self.conexao() as conn:
+            yield conn
+            conn.commit()
+
+    def fechar(self):
+        with self._lock:
+            livres, self._livres = self._livres, []
+        for conn in livres:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "max": self.maxconn,
+            "in_use": self.em_uso,
+            "idle": len(self._livres),
+            "waiters": self.aguardando,
+            "checkouts": self.checkouts,
+            "created": self.criadas,
+            "discarded": self.descartadas,
+            "timeouts": self.timeouts,
+            "wait_time_total": self.espera_total,
+            "wait_time_max": self.espera_max,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Retorna o pool do processo, criado no primeiro uso."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def configurar(fabrica=conectar, **kwargs) -> ConnectionPool:
+    """Substitui o pool do processo (ex: outra fábrica de conexões em benchmarks)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+        _pool = ConnectionPool(fabrica=fabrica, **kwargs)
+    return _pool
+
+
+def conexao():
+    return get_pool().conexao()
+
+
+def transacao():
+    return get_pool().transacao()
+
+
+def stats() -> dict:
+    return get_pool().stats()
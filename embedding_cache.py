@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+import numpy as np
+from cache import TTLCache
+from redis_client import connect_redis
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_REDIS = os.getenv("EMBEDDING_CACHE_REDIS", "true").lower() not in ("0", "false", "no")
+EMBEDDING_CACHE_TTL_DAYS = float(os.getenv("EMBEDDING_CACHE_TTL_DAYS", "7"))
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normalização usada na chave: caixa e espaços não mudam o embedding em cache."""
+    return " ".join(str(texto).casefold().split())
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings em dois níveis, chaveado por (texto normalizado, modelo, dimensão):
+    1. LRU em memória do processo;
+    2. uma chave por texto no Redis (emb:{modelo}:{dim}:{sha1}), compartilhada entre
+       workers, com o vetor em float32 compacto e expiração própria (EMBEDDING_CACHE_TTL_DAYS).
+    Falhas do Redis apenas desativam o segundo nível naquela chamada.
+    """
+
+    def __init__(self, maxsize=EMBEDDING_CACHE_SIZE, usar_redis=EMBEDDING_CACHE_REDIS, ttl_dias=EMBEDDING_CACHE_TTL_DAYS):
+        self._local = TTLCache(maxsize=maxsize)
+        self.usar_redis = usar_redis
+        self.ttl_redis = max(1, int(ttl_dias * 86400))
+        self.redis_hits = 0
+        self.redis_erros = 0
+
+    @staticmethod
+    def _campo(texto):
+        return hashlib.sha1(normalizar_texto(texto).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _chave_redis(modelo, dimensao, campo):
+        return f"emb:{modelo}:{dimensao}:{campo}"
+
+    def buscar(self, textos, modelo, dimensao):
+        """Retorna uma lista alinhada a `textos`, com None onde não há cache."""
+        campos = [self._campo(t) for t in textos]
+        vetores = [self._local.get((c, modelo, dimensao)) for c in campos]
+
+        faltantes = [i for i, v in enumerate(vetores) if v is None]
+        if faltantes and self.usar_redis:
+            try:
+                blobs = connect_redis().mget([self._chave_redis(modelo, dimensao, campos[i]) for i in faltantes])
+            except Exception:
+                self.redis_erros += 1
+                blobs = [None] * len(faltantes)
+            for i, blob in zip(faltantes, blobs):
+                if blob:
+                    vetor = np.frombuffer(blob, dtype=np.float32)
+                    vetores[i] = vetor
+                    self._local.set((campos[i], modelo, dimensao), vetor)
+                    self.redis_hits += 1
+        return vetores
+
+    def guardar(self, textos, vetores, modelo, dimensao):
+        mapa = {}
+        for texto, vetor in zip(textos, vetores):
+            campo = self._campo(texto)
+            vetor = np.asarray(vetor, dtype=np.float32)
+            self._local.set((campo, modelo, dimensao), vetor)
+            mapa[campo] = vetor.tobytes()
+
+        if mapa and self.usar_redis:
+            try:
+                pipe = connect_redis().pipeline(transaction=False)
+                for campo, blob in mapa.items():
+                    pipe.set(self._chave_redis(modelo, dimensao, campo), blob, ex=self.ttl_redis)
+                pipe.execute()
+            except Exception:
+                self.redis_erros += 1
+
+    def stats(self) -> dict:
+        dados = self._local.stats()
+        dados.update({"redis_hits": self.redis_hits, "redis_errors": self.redis_erros})
+        return dados
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import threading
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import HumanMessage, SystemMessage
+from cache import TTLCache
+
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "3000"))
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "2000"))
+HISTORY_TTL = float(os.getenv("HISTORY_TTL", "3600"))
+HISTORY_COMPACT_TOKENS = int(os.getenv("HISTORY_COMPACT_TOKENS", "1500"))
+HISTORY_KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))
+
+PROMPT_RESUMO = (
+    "Você resume conversas de um assistente de Estações de Tratamento de Água. "
+    "Combine o resumo anterior (se houver) com as novas mensagens em um único resumo curto, "
+    "em português, mantendo fatos, decisões, pedidos pendentes e dados do usuário. "
+    "Não invente nada. Responda apenas com o resumo."
+)
+
+
+def eh_resumo(mensagem) -> bool:
+    return isinstance(mensagem, SystemMessage) and mensagem.additional_kwargs.get("resumo", False)
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa barata (~4 caracteres por token), suficiente para limitar o prompt."""
+    return len(texto) // 4 + 4
+
+
+def contar_tokens(mensagem) -> int:
+    conteudo = mensagem.content if isinstance(mensagem.content, str) else str(mensagem.content)
+    return estimar_tokens(conteudo)
+
+
+class BoundedChatHistory(ChatMessageHistory):
+    """Histórico que descarta as mensagens mais antigas ao passar do limite de mensagens ou tokens."""
+
+    max_messages: int = HISTORY_MAX_MESSAGES
+    max_tokens: int = HISTORY_MAX_TOKENS
+
+    def add_message(self, message) -> None:
+        super().add_message(message)
+        self.aparar()
+
+    def tokens(self) -> int:
+        return sum(contar_tokens(m) for m in self.messages)
+
+    def aparar(self):
+        # O resumo (se houver) fica sempre na primeira posição e não é descartado
+        inicio = 1 if self.messages and eh_resumo(self.messages[0]) else 0
+        total = self.tokens()
+        while len(self.messages) > inicio and (len(self.messages) > self.max_messages or total > self.max_tokens):
+            total -= contar_tokens(self.messages.pop(inicio))
+
+
+class HistoryStore:
+    """
+    Históricos de conversa por (sessão do usuário, chain), com limite de tamanho
+    por histórico e remoção das sessões ociosas (LRU + TTL).
+    """
+
+    def __init__(self, max_sessions=HISTORY_MAX_SESSIONS, ttl=HISTORY_TTL,
+                 max_messages=HISTORY_MAX_MESSAGES, max_tokens=HISTORY_MAX_TOKENS):
+        self._historicos = TTLCache(maxsize=max_sessions, ttl=ttl)
+        self._lock = threading.Lock()
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self._compactando = set()
+        self._tarefas = set()
+        self.compactacoes = 0
+        self.falhas_compactacao = 0
+
+    def obter(self, session_id, chain: str) -> BoundedChatHistory:
+        chave = (str(session_id), chain)
+        with self._lock:
+            historico = self._historicos.get(chave)
+            if historico is None:
+                historico = BoundedChatHistory(max_messages=self.max_messages, max_tokens=self.max_tokens)
+            # Regrava a cada acesso para renovar o TTL de sessões ativas
+            self._historicos.set(chave, historico)
+        return historico
+
+    def para_chain(self, chain: str):
+        """get_session_history para o RunnableWithMessageHistory de uma chain."""
+        return lambda session_id: self.obter(session_id, chain)
+
+    def limpar(self, session_id):
+        with self._lock:
+            for chain in {c for s, c in self._historicos.keys() if s == str(session_id)}:
+                self._historicos.pop((str(session_id), chain))
+
+    @staticmethod
+    def precisa_compactar(historico) -> bool:
+        antigas = [m for m in historico.messages if not eh_resumo(m)]
+        return historico.tokens() > HISTORY_COMPACT_TOKENS and len(antigas) > HISTORY_KEEP_MESSAGES
+
+    async def compactar(self, session_id, chain: str, llm):
+        """
+        Dobra as mensagens mais antigas em um resumo (SystemMessage no topo do histórico),
+        mantendo as últimas HISTORY_KEEP_MESSAGES intactas.
+        """
+        chave = (str(session_id), chain)
+        historico = self._historicos.peek(chave)
+        if historico is None or not self.precisa_compactar(historico):
+            return
+
+        mensagens = list(historico.messages)
+        resumo_anterior = mensagens[0] if eh_resumo(mensagens[0]) else None
+        corpo = mensagens[1:] if resumo_anterior else mensagens
+        dobrar = corpo[:-HISTORY_KEEP_MESSAGES]
+        if not dobrar:
+            return
+
+        texto = "\n".join(f"{m.type}: {m.content}" for m in dobrar)
+        if resumo_anterior is not None:
+            texto = f"Resumo anterior: {resumo_anterior.content}\n\nNovas mensagens:\n{texto}"
+        resposta = await llm.ainvoke([SystemMessage(content=PROMPT_RESUMO), HumanMessage(content=texto)])
+        resumo = SystemMessage(content=f"Resumo da conversa anterior: {resposta.content}", additional_kwargs={"resumo": True})
+
+        with self._lock:
+            atuais = historico.messages
+            dobradas = len(dobrar) + (1 if resumo_anterior else 0)
+            # Só troca se o início do histórico não mudou enquanto o resumo era gerado
+            if len(atuais) >= dobradas and all(a is b for a, b in zip(atuais, mensagens[:dobradas])):
+                historico.messages = [resumo] + atuais[dobradas:]
+                self.compactacoes += 1
+
+    def agendar_compactacao(self, session_id, llm):
+        """Agenda em segundo plano a compactação dos históricos da sessão que passaram do limite."""
+        for chain in {c for s, c in self._historicos.keys() if s == str(session_id)}:
+            chave = (str(session_id), chain)
+            historico = self._historicos.peek(chave)
+            if historico is None or chave in self._compactando or not self.precisa_compactar(historico):
+                continue
+            self._compactando.add(chave)
+            tarefa = asyncio.ensure_future(self.compactar(session_id, chain, llm))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(lambda t, chave=chave: self._fim_compactacao(t, chave))
+
+    def _fim_compactacao(self, tarefa, chave):
+        self._tarefas.discard(tarefa)
+        self._compactando.discard(chave)
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            self.falhas_compactacao += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            historicos = [self._historicos.peek(c) for c in self._historicos.keys()]
+        historicos = [h for h in historicos if h is not None]
+        mensagens = sum(len(h.messages) for h in historicos)
+        tokens = sum(h.tokens() for h in historicos)
+        return {
+            "histories": len(historicos),
+            "messages": mensagens,
+            "tokens": tokens,
+            "avg_tokens": tokens / len(historicos) if historicos else 0.0,
+            "bytes": sum(len(str(m.content)) for h in historicos for m in h.messages),
+            "evictions": self._historicos.evictions,
+            "compactions": self.compactacoes,
+            "compaction_failures": self.falhas_compactacao,
+        }
+
+
+history_store = HistoryStore()
@@ -0,0 +1,219 @@
+"""
+Ingestão em lote de pares pergunta/resposta na coleção de Q&A.
+
+Lê CSV ou JSONL em streaming (colunas question/answer, ou pergunta/resposta, e um id
+opcional), gera os embeddings em lotes via gerar_embeddings com concorrência limitada e
+retentativas, e grava com bulk_write (upsert). Só a pergunta é embutida: documentos cuja
+pergunta, modelo e dimensão de embedding não mudaram não são reembutidos (uma resposta
+editada é apenas atualizada) e documentos sem nenhuma mudança são pulados. O progresso é salvo em um checkpoint para que
+uma execução interrompida continue de onde parou.
+
+Uso:
+    python ingest.py perguntas.jsonl --lote 100 --concorrencia 4
+    python ingest.py perguntas.csv --checkpoint .ingest.json
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
+from dotenv import load_dotenv
+# Antes dos módulos do projeto, que leem o ambiente na importação
+load_dotenv()
+from pymongo import UpdateOne
+
+from vector_search import gerar_embeddings, get_collection, EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_MAX_LOTE
+
+LOTE_PADRAO = EMBEDDING_MAX_LOTE
+TENTATIVAS = 5
+
+
+def ler_registros(caminho, formato=None):
+    """Gera dicts {id, question, answer} a partir de um CSV ou JSONL, sem carregar o arquivo todo."""
+    formato = formato or ("csv" if caminho.lower().endswith(".csv") else "jsonl")
+    with open(caminho, encoding="utf-8", newline="") as arquivo:
+        linhas = csv.DictReader(arquivo) if formato == "csv" else (json.loads(l) for l in arquivo if l.strip())
+        for linha in linhas:
+            pergunta = (linha.get("question") or linha.get("pergunta") or "").strip()
+            resposta = (linha.get("answer") or linha.get("resposta") or "").strip()
+            if pergunta and resposta:
+                yield {"id": linha.get("id") or None, "question": pergunta, "answer": resposta}
+
+
+def hash_conteudo(registro) -> str:
+    return hashlib.sha256(f"{registro['question']}\x00{registro['answer']}".encode("utf-8")).hexdigest()
+
+
+def hash_embedding(pergunta, modelo, dimensao) -> str:
+    """Identifica o vetor: só o texto embutido (a pergunta), o modelo e a dimensão."""
+    return hashlib.sha256(f"{modelo}\x00{dimensao}\x00{pergunta}".encode("utf-8")).hexdigest()
+
+
+def filtro(registro) -> dict:
+    return {"qa_id": str(registro["id"])} if registro["id"] else {"question": registro["question"]}
+
+
+def com_retentativas(funcao, *args):
+    """Backoff exponencial com jitter para erros transitórios (quota, rede)."""
+    for tentativa in range(TENTATIVAS):
+        try:
+            return funcao(*args)
+        except Exception:
+            if tentativa == TENTATIVAS - 1:
+                raise
+            time.sleep(min(30, 2 ** tentativa) + random.random())
+
+
+class Checkpoint:
+    """Guarda quantos registros do arquivo já foram concluídos, em ordem."""
+
+    def __init__(self, caminho, origem):
+        self.caminho = caminho
+        self.origem = os.path.abspath(origem)
+        self.concluidos = 0
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        if caminho and os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as arquivo:
+                dados = json.load(arquivo)
+            if dados.get("origem") == self.origem:
+                self.concluidos = dados.get("concluidos", 0)
+
+    def concluir(self, inicio, quantidade):
+        """Lotes terminam fora de ordem; só avança até o último lote contíguo."""
+        with self._lock:
+            self._pendentes[inicio] = quantidade
+            while self.concluidos in self._pendentes:
+                self.concluidos += self._pendentes.pop(self.concluidos)
+            self._salvar()
+
+    def _salvar(self):
+        if not self.caminho:
+            return
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"origem": self.origem, "concluidos": self.concluidos}, arquivo)
+        os.replace(temporario, self.caminho)
+
+    def limpar(self):
+        if self.caminho and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+
+def processar_lote(collection, registros, forcar=False) -> dict:
+    """Embute e grava um lote; retorna contadores."""
+    for r in registros:
+        r["content_hash"] = hash_conteudo(r)
+
+    alterados, so_resposta = registros, []
+    if not forcar:
+        existentes = {}
+        projecao = {"qa_id": 1, "question": 1, "content_hash": 1, "embedding_model": 1, "embedding_dim": 1}
+        for doc in collection.find({"$or": [filtro(r) for r in registros]}, projecao):
+            existentes[doc.get("qa_id") or doc.get("question")] = doc
+        alterados = []
+        for r in registros:
+            doc = existentes.get(str(r["id"]) if r["id"] else r["question"])
+            if not doc or hash_embedding(doc.get("question"), doc.get("embedding_model"), doc.get("embedding_dim")) != (
+                hash_embedding(r["question"], EMBEDDING_MODEL, EMBEDDING_DIM)
+            ):
+                alterados.append(r)
+            elif doc.get("content_hash") != r["content_hash"]:
+                so_resposta.append(r)
+
+    agora = datetime.now(timezone.utc)
+    operacoes = [
+        # Mesmo vetor: só a resposta (e o updated_at, para os índices e caches perceberem)
+        UpdateOne(filtro(r), {"$set": {"answer": r["answer"], "content_hash": r["content_hash"], "updated_at": agora}})
+        for r in so_resposta
+    ]
+    if alterados:
+        vetores = com_retentativas(gerar_embeddings, [r["question"] for r in alterados], False)
+        for r, vetor in zip(alterados, vetores):
+            campos = {
+                "question": r["question"],
+                "answer": r["answer"],
+                "embedding": [float(x) for x in vetor],
+                "content_hash": r["content_hash"],
+                "embedding_model": EMBEDDING_MODEL,
+                "embedding_dim": EMBEDDING_DIM,
+                "updated_at": agora,
+            }
+            if r["id"]:
+                campos["qa_id"] = str(r["id"])
+            operacoes.append(UpdateOne(filtro(r), {"$set": campos}, upsert=True))
+    if operacoes:
+        com_retentativas(lambda: collection.bulk_write(operacoes, ordered=False))
+
+    return {
+        "lidos": len(registros),
+        "embutidos": len(alterados),
+        "atualizados": len(so_resposta),
+        "pulados": len(registros) - len(alterados) - len(so_resposta),
+    }
+
+
+def ingerir(caminho, formato=None, lote=LOTE_PADRAO, concorrencia=4, checkpoint=None, forcar=False, log=print) -> dict:
+    """Executa a ingestão completa e retorna as estatísticas (inclui documentos/s)."""
+    collection = get_collection()
+    progresso = Checkpoint(checkpoint, caminho)
+    registros = ler_registros(caminho, formato)
+    inicio_arquivo = progresso.concluidos
+    if inicio_arquivo:
+        log(f"Retomando a partir do registro {inicio_arquivo}.")
+        registros = islice(registros, inicio_arquivo, None)
+
+    totais = {"lidos": 0, "embutidos": 0, "atualizados": 0, "pulados": 0}
+    lock = threading.Lock()
+    vagas = threading.Semaphore(concorrencia * 2)
+    inicio = time.perf_counter()
+
+    def executar(posicao, itens):
+        try:
+            resultado = processar_lote(collection, itens, forcar)
+            with lock:
+                for chave, valor in resultado.items():
+                    totais[chave] += valor
+                decorrido = time.perf_counter() - inicio
+                log(f"{totais['lidos']} lidos | {totais['embutidos']} embutidos | "
+                    f"{totais['atualizados']} só resposta | {totais['pulados']} pulados | {totais['lidos'] / decorrido:.1f} docs/s")
+            progresso.concluir(posicao, len(itens))
+        finally:
+            vagas.release()
+
+    posicao = inicio_arquivo
+    futuros = []
+    with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="ingest") as executor:
+        while itens := list(islice(registros, lote)):
+            vagas.acquire()
+            futuros.append(executor.submit(executar, posicao, itens))
+            posicao += len(itens)
+        for futuro in futuros:
+            futuro.result()
+
+    decorrido = time.perf_counter() - inicio
+    progresso.limpar()
+    totais["segundos"] = decorrido
+    totais["docs_por_segundo"] = totais["lidos"] / decorrido if decorrido else 0.0
+    return totais
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("arquivo", help="CSV ou JSONL com question/answer (ou pergunta/resposta) e id opcional")
+    parser.add_argument("--formato", choices=["csv", "jsonl"], help="padrão: pela extensão do arquivo")
+    parser.add_argument("--lote", type=int, default=LOTE_PADRAO, help="textos por chamada de embedding")
+    parser.add_argument("--concorrencia", type=int, default=4, help="lotes processados em paralelo")
+    parser.add_argument("--checkpoint", default=".ingest_checkpoint.json", help="arquivo de progresso para retomar")
+    parser.add_argument("--forcar", action="store_true", help="reembute mesmo documentos sem alteração")
+    args = parser.parse_args()
+
+    resultado = ingerir(args.arquivo, args.formato, args.lote, args.concorrencia, args.checkpoint, args.forcar)
+    print(json.dumps(resultado, indent=2))
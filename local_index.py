@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+LOCAL_INDEX_REFRESH = float(os.getenv("LOCAL_INDEX_REFRESH", "30"))
+LOCAL_INDEX_FULL_RELOAD = float(os.getenv("LOCAL_INDEX_FULL_RELOAD", "3600"))
+LOCAL_INDEX_CHANGE_STREAM = os.getenv("LOCAL_INDEX_CHANGE_STREAM", "false").lower() in ("1", "true", "yes")
+
+PROJECAO = {"question": 1, "answer": 1, "embedding": 1, "updated_at": 1}
+
+
+def em_utc(valor):
+    """O pymongo devolve datetimes sem fuso (em UTC); aqui todos viram aware em UTC."""
+    if valor is not None and valor.tzinfo is None:
+        return valor.replace(tzinfo=timezone.utc)
+    return valor
+
+
+class LocalIndex:
+    """
+    Espelho em memória da coleção de Q&A: os embeddings ficam em uma matriz float32
+    contígua. Como os vetores já são normalizados (L2), o top-k é um único produto
+    matriz-vetor seguido de argpartition.
+
+    A atualização é incremental: documentos com `updated_at` mais novo que o último
+    visto (ou eventos do change stream, se habilitado) substituem/adicionam linhas.
+    Um recarregamento completo periódico detecta remoções e documentos sem `updated_at`.
+    Ouvintes registrados recebem os _ids alterados a cada atualização.
+    """
+
+    def __init__(self, get_collection):
+        self._get_collection = get_collection
+        self._ids = []
+        self._docs = []
+        self._posicao = {}
+        self._matriz = np.zeros((0, 0), dtype=np.float32)
+        self._ultimo_update = None
+        self._carregado_em = None
+        self._lock = threading.Lock()
+        self._ouvintes = []
+        self._thread = None
+        self._parar = threading.Event()
+
+    @property
+    def carregado(self) -> bool:
+        return self._carregado_em is not None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def registrar_ouvinte(self, callback):
+        """callback(ids_alterados) é chamado após cada atualização com mudanças."""
+        self._ouvintes.append(callback)
+
+    def _notificar(self, ids):
+        if not ids:
+            return
+        for callback in self._ouvintes:
+            try:
+                callback(ids)
+            except Exception as e:
+                print(f"⚠️ Ouvinte do índice local falhou: {e}")
+
+    @staticmethod
+    def _separar(doc):
+        vetor = np.asarray(doc.get("embedding") or (), dtype=np.float32)
+        meta = {"_id": doc["_id"], "question": doc.get("question"), "answer": doc.get("answer")}
+        return meta, vetor
+
+    def carregar(self):
+        """Recarrega a coleção inteira."""
+        inicio = datetime.now(timezone.utc)
+        ids, docs, vetores = [], [], []
+        ultimo = None
+        for doc in self._get_collection().find({}, PROJECAO):
+            meta, vetor = self._separar(doc)
+            if vetor.size == 0:
+                continue
+            ids.append(doc["_id"])
+            docs.append(meta)
+            vetores.append(vetor)
+            atualizado = em_utc(doc.get("updated_at"))
+            if atualizado and (ultimo is None or atualizado > ultimo):
+                ultimo = atualizado
+
+        matriz = np.vstack(vetores) if vetores else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            anteriores = {id_: self._docs[i] for id_, i in self._posicao.items()}
+            self._ids, self._docs, self._matriz = ids, docs, np.ascontiguousarray(matriz)
+            self._posicao = {id_: i for i, id_ in enumerate(ids)}
+            self._ultimo_update = ultimo or inicio
+            self._carregado_em = time.monotonic()
+
+        # Inserções, remoções e edições percebidas pelo recarregamento completo
+        atuais = dict(zip(ids, docs))
+        alterados = [id_ for id_ in anteriores.keys() | atuais.keys() if anteriores.get(id_) != atuais.get(id_)]
+        if anteriores:
+            self._notificar(alterados)
+
+    def _aplicar(self, docs, removidos=()):
+        """Substitui/adiciona as linhas de `docs` e retira `removidos`, trocando o snapshot de uma vez."""
+        removidos = set(removidos)
+        with self._lock:
+            ids, metas, matriz = list(self._ids), list(self._docs), self._matriz.copy()
+            posicao = dict(self._posicao)
+            novos_ids, novas_metas, novos_vetores = [], [], []
+            for doc in docs:
+                meta, vetor = self._separar(doc)
+                if vetor.size == 0:
+                    continue
+                if doc["_id"] in posicao:
+                    i = posicao[doc["_id"]]
+                    matriz[i] = vetor
+                    metas[i] = meta
+                else:
+                    posicao[doc["_id"]] = len(ids) + len(novos_ids)
+                    novos_ids.append(doc["_id"])
+                    novas_metas.append(meta)
+                    novos_vetores.append(vetor)
+                atualizado = em_utc(doc.get("updated_at"))
+                if atualizado and (self._ultimo_update is None or atualizado > self._ultimo_update):
+                    self._ultimo_update = atualizado
+
+            if novos_ids:
+                ids += novos_ids
+                metas += novas_metas
+                adicionais = np.vstack(novos_vetores)
+                matriz = adicionais if matriz.size == 0 else np.vstack([matriz, adicionais])
+
+            if removidos:
+                manter = [i for i, id_ in enumerate(ids) if id_ not in removidos]
+                ids = [ids[i] for i in manter]
+                metas = [metas[i] for i in manter]
+                matriz = matriz[manter]
+                posicao = {id_: i for i, id_ in enumerate(ids)}
+
+            # Buscas em andamento continuam com o snapshot anterior
+            self._ids, self._docs, self._posicao = ids, metas, posicao
+            self._matriz = np.ascontiguousarray(matriz)
+
+        alterados = [d["_id"] for d in docs] + list(removidos)
+        self._notificar(alterados)
+        return alterados
+
+    def atualizar(self):
+        """Busca apenas os documentos alterados desde a última atualização."""
+        if not self.carregado:
+            self.carregar()
+            return []
+        docs = list(self._get_collection().find({"updated_at": {"$gt": self._ultimo_update}}, PROJECAO))
+        return self._aplicar(docs) if docs else []
+
+    def buscar(self, query_vector, k=3):
+        """Top-k por similaridade de cosseno, no mesmo formato do $vectorSearch."""
+        if not self.carregado:
+            self.carregar()
+        with self._lock:
+            matriz, docs = self._matriz, self._docs
+        n = len(docs)
+        if n == 0:
+            return []
+
+        q = np.asarray(query_vector, dtype=np.float32)
+        scores = matriz @ q
+        k = min(k, n)
+        topo = np.argpartition(-scores, k - 1)[:k]
+        topo = topo[np.argsort(-scores[topo])]
+        # O vectorSearchScore do Atlas para cosseno é (1 + cos) / 2
+        return [dict(docs[i], score=float((1.0 + scores[i]) / 2.0)) for i in topo]
+
+    def _loop_polling(self):
+        ultimo_completo = time.monotonic()
+        while not self._parar.wait(LOCAL_INDEX_REFRESH):
+            try:
+                if not self.carregado or time.monotonic() - ultimo_completo > LOCAL_INDEX_FULL_RELOAD:
+                    self.carregar()
+                    ultimo_completo = time.monotonic()
+                else:
+                    self.atualizar()
+            except Exception as e:
+                print(f"⚠️ Falha ao atualizar índice local: {e}")
+
+    def _loop_change_stream(self):
+        while not self._parar.is_set():
+            try:
+                if not self.carregado:
+                    self.carregar()
+                with self._get_collection().watch(full_document="updateLookup") as stream:
+                    for evento in stream:
+                        if self._parar.is_set():
+                            break
+                        if evento["operationType"] == "delete":
+                            self._aplicar([], removidos=[evento["documentKey"]["_id"]])
+                        elif evento.get("fullDocument"):
+                            self._aplicar([evento["fullDocument"]])
+            except Exception as e:
+                print(f"⚠️ Change stream do índice local interrompido: {e}")
+                if self._parar.wait(LOCAL_INDEX_REFRESH):
+                    break
+                try:
+                    self.carregar()
+                except Exception as e:
+                    print(f"⚠️ Falha ao recarregar índice local: {e}")
+
+    def iniciar(self):
+        """
+        Carrega o índice e inicia a atualização em segundo plano. Se a primeira carga
+        falhar (ex: Mongo fora do ar no start), a thread sobe mesmo assim e tenta de novo.
+        """
+        if self._thread is not None:
+            return
+        try:
+            self.carregar()
+        except Exception as e:
+            print(f"⚠️ Índice local não carregado na inicialização: {e}")
+        alvo = self._loop_change_stream if LOCAL_INDEX_CHANGE_STREAM else self._loop_polling
+        self._thread = threading.Thread(target=alvo, name="local-index", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._ids),
+            "dimension": int(self._matriz.shape[1]) if self._matriz.ndim == 2 and self._matriz.size else 0,
+            "bytes": int(self._matriz.nbytes),
+        }
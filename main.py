@@ -1,24 +1,78 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, HTTPException, status
+# Único load_dotenv do servidor: antes dos módulos do projeto, que leem o ambiente na importação
+load_dotenv()
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-from vector_search import buscar_similares
-from chains import initialize_system
-from utils import get_session_id, get_memories
+from vector_search import gerar_embeddings, agerar_embeddings, buscar_por_embedding, local_index, registrar_ouvinte, iniciar_monitoramento, parar_monitoramento, VECTOR_BACKEND
+from answer_cache import answer_cache
+from history_store import history_store
+from memory_index import memory_index
+from pre_router import PreRouter, extrair_rota, saida_sintetica
+from dataclasses import dataclass
+from typing import Any, Optional
+from chains import initialize_system, registry
+from utils import get_session_id, get_memories, get_session_ids, get_memories_batch
+from async_utils import run_sync
+from branches import executar_ramos, server_timing, CURADOR_TIMEOUT
+from reference_cache import reference_cache
+from session_cache import session_cache
+from embedding_cache import embedding_cache, normalizar_texto
+from singleflight import SingleFlight, chave_canonica
+from admission import Rejeitada, controle_admissao
+from langchain_core.messages import AIMessage, HumanMessage
+from memory_store import memory_store
+import db_pool
+import redis_client
+import resources
+import singleflight
+import memoize
+import metrics
+import tracing
+from metrics import medir, medido
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import weakref
+import time
 from datetime import datetime
 
 
-load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
 
 if not API_TOKEN:
     raise ValueError("⚠️ ERRO: variável de ambiente API_TOKEN não encontrada!")
 
+# /chat/batch: itens por chamada e itens processados ao mesmo tempo
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Cria os clientes externos e aquece os caches na subida do worker; falhas não impedem o start."""
+    await resources.aquecer()
+    try:
+        await run_sync(reference_cache.carregar)
+    except Exception as e:
+        print(f"⚠️ Cache de referência não carregado na inicialização: {e}")
+    if VECTOR_BACKEND == "local":
+        try:
+            await run_sync(local_index.iniciar)
+        except Exception as e:
+            print(f"⚠️ Índice vetorial local não carregado na inicialização: {e}")
+    registrar_ouvinte(answer_cache.invalidar_documentos)
+    iniciar_monitoramento()
+    yield
+    local_index.parar()
+    parar_monitoramento()
+
 
-app = FastAPI(title="ETA ChatBot API")
+app = FastAPI(title="ETA ChatBot API", lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -35,6 +89,33 @@ app.add_middleware(
 
 security = HTTPBearer()
 
+pre_router = PreRouter(gerar_embeddings)
+
+# Etapas de leitura coalescidas entre requisições simultâneas (nunca curador/gerente)
+_voos_rag = SingleFlight("rag")
+_voos_juiz = SingleFlight("juiz")
+
+# stats() dos componentes, exportados como gauges no /metrics
+for componente, stats in {
+    "resources": resources.stats,
+    "chain_registry": registry.stats,
+    "db_pool": db_pool.stats,
+    "redis_pool": redis_client.stats,
+    "session_cache": session_cache.stats,
+    "embedding_cache": embedding_cache.stats,
+    "answer_cache": answer_cache.stats,
+    "reference_cache": reference_cache.stats,
+    "pre_router": pre_router.stats,
+    "history_store": history_store.stats,
+    "memory_store": memory_store.stats,
+    "memory_index": memory_index.stats,
+    "local_index": local_index.stats,
+    "singleflight": singleflight.stats,
+    "admission": controle_admissao.stats,
+    "tool_memo": memoize.stats,
+}.items():
+    metrics.registrar_coletor(componente, stats)
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verifica se o token Bearer é válido"""
     token = credentials.credentials
@@ -57,158 +138,346 @@ class ChatResponse(BaseModel):
     origem: str
 
 
-def fluxo_rag(chains, user_message):
-    documents = buscar_similares(user_message)
-    resposta = chains["rag_chain"].invoke(
-        {
-            "input": f"Mensagem do usuário: {user_message}\nDocumentos mais recomendados: {documents}"
-        },
-        config={"configurable": {"session_id": "RAG_SESSION"}},
+class ItemLote(BaseModel):
+    email: str
+    user_message: str
+
+
+class ChatBatchInput(BaseModel):
+    api_key: str
+    itens: list[ItemLote]
+    # Itens processados em paralelo (limitado a BATCH_CONCURRENCY)
+    concorrencia: Optional[int] = None
+
+
+class ResultadoItem(BaseModel):
+    email: str
+    resposta: Optional[str] = None
+    origem: Optional[str] = None
+    status: int = 200
+    erro: Optional[str] = None
+
+
+class ChatBatchResponse(BaseModel):
+    resultados: list[ResultadoItem]
+
+
+@dataclass
+class ResultadoFluxo:
+    origem: str
+    conteudo: Any
+    # True quando o conteúdo ainda deve passar pela reformulação final do router_chain
+    reformular: bool
+
+
+def config_sessao(session_id):
+    """Config das chains com histórico; inclui os callbacks do trace quando a requisição é rastreada."""
+    return {"configurable": {"session_id": str(session_id)}, "callbacks": tracing.callbacks()}
+
+
+def pergunta_original(resposta_roteador):
+    """Extrai a PERGUNTA_ORIGINAL da saída do roteador (ou o texto todo, se não houver)."""
+    for linha in str(resposta_roteador).split("\n"):
+        if linha.startswith("PERGUNTA_ORIGINAL="):
+            return linha.split("=", 1)[1].strip()
+    return str(resposta_roteador).strip()
+
+
+async def fluxo_rag(chains, session_id, user_message, documents=None, query_embedding=None):
+    """
+    Pergunta ao rag_chain com os documentos recuperados. A mesma pergunta com os mesmos
+    documentos e o mesmo histórico do rag (na prática, histórico vazio), feita ao mesmo
+    tempo por outros usuários (mesma api_key), é respondida uma única vez; cada seguidora
+    grava a troca no próprio histórico.
+    """
+    if documents is None:
+        if query_embedding is None:
+            [query_embedding] = await agerar_embeddings([pergunta_original(user_message)])
+        documents = await run_sync(buscar_por_embedding, query_embedding)
+    chain = chains["rag_chain"]
+    entrada = f"Mensagem do usuário: {user_message}\nDocumentos mais recomendados: {documents}"
+
+    def gravar_historico(resposta):
+        history_store.obter(session_id, "rag").add_messages([HumanMessage(content=entrada), AIMessage(content=str(resposta))])
+
+    # O prompt inclui o histórico de quem pergunta: só coalesce quem tem o mesmo contexto
+    historico = [(m.type, m.content) for m in history_store.obter(session_id, "rag").messages]
+    chave = chave_canonica(id(chain), normalizar_texto(user_message), [str(d.get("_id")) for d in documents], historico)
+    return await _voos_rag.executar(
+        chave,
+        lambda: chain.ainvoke({"input": entrada}, config=config_sessao(session_id)),
+        ao_seguir=gravar_historico,
     )
-    return resposta
 
 
-def fluxo_assesor(chains, user_message):
-    resposta = chains["router_chain"].invoke(
+@medido("roteador_llm")
+async def fluxo_assesor(chains, session_id, user_message):
+    resposta = await chains["router_chain"].ainvoke(
         {"input": user_message},
-        config={"configurable": {"session_id": "ROUTER_SESSION"}},
+        config=config_sessao(session_id),
     )
-    if "ROUTE=" in resposta:
-        route = str(resposta).split("ROUTE=")[1].split("\n")[0]
-        if "," in route:
-            if "rag" in route:
-                return "m,r", resposta
-            elif "gerente" in route:
-                return "m,g", resposta
-        else:
-            if "rag" in route:
-                return "r", resposta
-            elif "gerente" in route:
-                return "g", resposta
-            else:
-                return "m", resposta
-    else:
-        return resposta
+    return extrair_rota(resposta), resposta
+
+
+async def classificar_llm(chains, user_message):
+    """Rota escolhida pelo LLM, sem gravar no histórico (conferência do pré-roteador)."""
+    resposta = await chains["router_classifier"].ainvoke(
+        {"input": user_message, "chat_history": []},
+        config={"callbacks": tracing.callbacks()},
+    )
+    return extrair_rota(resposta)
 
 
-def fluxo_juiz(chains, pergunta, resposta):
-    avaliacao = chains["judge_chain"].invoke({
-        "usuario": pergunta,
-        "resposta": resposta
-    })
+async def rotear(chains, session_id, user_input, user_message, vetor):
+    """Tenta o pré-roteador local; na dúvida (ou em falha) usa o roteador LLM."""
+    rota = None
+    if vetor is not None:
+        try:
+            rota = await run_sync(pre_router.classificar, user_message, vetor)
+        except Exception:
+            rota = None
+
+    if rota is not None:
+        pre_router.talvez_conferir(user_message, rota, lambda: classificar_llm(chains, user_input))
+        return rota, saida_sintetica(rota, user_message)
+
+    rota, resultado = await fluxo_assesor(chains, session_id, user_input)
+    # "m" também cobre fora_escopo no parser, então não vira exemplo
+    if vetor is not None and rota in ("r", "g", "m,r", "m,g"):
+        pre_router.registrar_trafego(user_message, vetor, rota, pergunta_original(resultado))
+    return rota, resultado
+
+
+async def fluxo_juiz(chains, pergunta, resposta):
+    chain = chains["judge_chain"]
+    chave = chave_canonica(id(chain), normalizar_texto(pergunta), normalizar_texto(resposta))
+    avaliacao = await _voos_juiz.executar(
+        chave,
+        lambda: chain.ainvoke({"usuario": pergunta, "resposta": resposta}, config={"callbacks": tracing.callbacks()}),
+    )
     return avaliacao
 
 
-def fluxo_curador(chains, pergunta):
-    curadoria = chains["curador_chain"].invoke(
+async def fluxo_curador(chains, session_id, pergunta):
+    curadoria = await chains["curador_chain"].ainvoke(
         {"input": pergunta},
-        config={"configurable": {"session_id": "CURADOR_SESSION"}},
+        config=config_sessao(session_id),
     )
     return curadoria
 
 
-from fastapi import HTTPException, status
+async def fluxo_gerente(chains, session_id, pergunta):
+    # Tools de leitura repetidas com os mesmos argumentos nesta execução não voltam ao Postgres
+    with memoize.escopo():
+        resposta = await chains["mgr_assist_chain"].ainvoke(
+            {"input": pergunta},
+            config=config_sessao(session_id),
+        )
+    return resposta
 
-@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_token)])
-async def chat_endpoint(data: ChatInput, email: str):
-    """Endpoint principal que executa o fluxo completo"""
-    try:
-        user_input = data.user_message
-        api_key = data.api_key
-        
-        try:
-            session_id = get_session_id(email)
-        except Exception:
-            raise HTTPException(
-                status_code=404,
-                detail="Sessão não encontrada para este usuário."
-            )
 
-        try:
-            memorias = get_memories(session_id)
-        except Exception:
-            raise HTTPException(
-                status_code=500,
-                detail="Erro ao recuperar memórias da sessão."
-            )
+def texto_saida(resultado):
+    """AgentExecutor retorna um dict com 'output'; as demais chains retornam texto."""
+    if isinstance(resultado, dict):
+        return resultado.get("output", "")
+    return resultado
 
-    except HTTPException:
-        raise
-    except Exception as e:
+
+async def reformular(chains, session_id, conteudo, origem):
+    final = await chains["router_chain"].ainvoke(
+        {"input": f"RESPOSTA_FINAL={conteudo}\nORIGEM={origem}"},
+        config=config_sessao(session_id),
+    )
+    return final
+
+
+async def reformular_stream(chains, session_id, conteudo, origem):
+    """Mesma reformulação final, emitindo os tokens à medida que são gerados."""
+    async for pedaco in chains["router_chain"].astream(
+        {"input": f"RESPOSTA_FINAL={conteudo}\nORIGEM={origem}"},
+        config=config_sessao(session_id),
+    ):
+        yield pedaco
+
+
+async def preparar_sessao(email):
+    """Resolve a sessão e as memórias do usuário (I/O bloqueante no pool de threads)."""
+    try:
+        session_id = await run_sync(get_session_id, email)
+    except Exception:
         raise HTTPException(
-            status_code=400,
-            detail=f"Erro na leitura dos dados de entrada: {str(e)}"
+            status_code=404,
+            detail="Sessão não encontrada para este usuário."
         )
 
     try:
-        chains = initialize_system(api_key)
+        memorias = await run_sync(get_memories, session_id)
     except Exception:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="API Key inválida ou erro ao inicializar componentes."
+            status_code=500,
+            detail="Erro ao recuperar memórias da sessão."
         )
+    return session_id, memorias
 
-    user_input = f"Memorias:{memorias}\nMensagem:{user_input}"
 
-    try:
-        resultado = fluxo_assesor(chains, user_input)
-        rota = resultado[0]
-        resposta = "\n".join(str(resultado[1]).split("\n")[1:])
+def resultado_ramo(ramo):
+    """Retorna o valor do ramo principal ou propaga sua falha."""
+    if ramo.expirou:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Tempo esgotado no ramo '{ramo.nome}'."
+        )
+    if ramo.erro is not None:
+        raise ramo.erro
+    return ramo.valor
 
-        # --- Fluxos ---
-        if rota == "m,r":
-            curadoria = fluxo_curador(chains, f"{resposta}\nSessionID:{session_id}")
-            resposta_rag = fluxo_rag(chains, resposta)
-            conteudo = f"{curadoria}\n{resposta_rag}"
 
-            final = chains["router_chain"].invoke(
-                {"input": f"RESPOSTA_FINAL={conteudo}\nORIGEM=curadoria_rag"},
-                config={"configurable": {"session_id": "ROUTER_SESSION"}},
-            )
-            return ChatResponse(resposta=final, origem="CURADORIA_RAG")
+async def fluxo_combinado(chains, session_id, resposta, nome, ramo_principal, tempos, notificar):
+    """Executa curadoria e o ramo principal em paralelo; a curadoria não segura a resposta."""
+    async def ramo_concluido(ramo):
+        await notificar("etapa", {"etapa": ramo.nome, "duracao": ramo.duracao, "ok": ramo.ok})
+
+    ramos = await executar_ramos(
+        {
+            "curador": tracing.rastreado("curador", fluxo_curador(chains, session_id, f"{resposta}\nSessionID:{session_id}")),
+            nome: tracing.rastreado(nome, ramo_principal),
+        },
+        timeouts={"curador": CURADOR_TIMEOUT},
+        segundo_plano={"curador"},
+        ao_concluir=ramo_concluido,
+    )
+    for ramo in ramos.values():
+        tempos[ramo.nome] = ramo.duracao
+        metrics.observar(ramo.nome, ramo.duracao, ramo.ok)
+
+    principal = texto_saida(resultado_ramo(ramos[nome]))
+    curadoria = ramos["curador"]
+    if curadoria.ok:
+        return f"{texto_saida(curadoria.valor)}\n{principal}"
+    return principal
+
+
+async def _sem_notificacao(evento, dados):
+    pass
+
+
+async def executar_fluxo(chains, session_id, memorias, user_message, tempos=None, notificar=None, vetor_mensagem=None,
+                         chave_api=None):
+    """
+    Roteia a mensagem e executa os ramos necessários.
+    Retorna um ResultadoFluxo.
+    Os tempos de cada etapa (segundos) são gravados em `tempos`; `notificar(evento, dados)`
+    é chamado ao fim de cada etapa (usado pelo /chat/stream). `vetor_mensagem` evita
+    gerar de novo um embedding já calculado (ex: em lote no /chat/batch). `chave_api`
+    (registry.key_for) delimita o cache de respostas.
+    """
+    tempos = {} if tempos is None else tempos
+    notificar = notificar or _sem_notificacao
+
+    # O embedding da mensagem serve ao pré-roteador e à seleção de memórias
+    if vetor_mensagem is None:
+        try:
+            with medir("embedding_mensagem"):
+                [vetor_mensagem] = await agerar_embeddings([user_message])
+        except Exception:
+            vetor_mensagem = None
+    with medir("selecao_memorias"):
+        memorias_relevantes = await run_sync(memory_index.selecionar, session_id, memorias or [], vetor_mensagem)
+    user_input = f"Memorias:\n{memorias_relevantes}\nMensagem:{user_message}"
+
+    async def etapa(nome, coro):
+        inicio = time.perf_counter()
+        with medir(nome):
+            valor = await coro
+        tempos[nome] = time.perf_counter() - inicio
+        await notificar("etapa", {"etapa": nome, "duracao": tempos[nome], "ok": True})
+        return valor
+
+    inicio = time.perf_counter()
+    with medir("roteador"):
+        rota, resultado = await rotear(chains, session_id, user_input, user_message, vetor_mensagem)
+        metrics.definir_rota(rota)
+    tempos["roteador"] = time.perf_counter() - inicio
+    await notificar("rota", {"rota": rota, "duracao": tempos["roteador"]})
+    resposta = "\n".join(str(resultado).split("\n")[1:])
+
+    inicio = time.perf_counter()
+    try:
+        if rota == "m,r":
+            conteudo = await fluxo_combinado(chains, session_id, resposta, "rag", fluxo_rag(chains, session_id, resposta), tempos, notificar)
+            return ResultadoFluxo("CURADORIA_RAG", conteudo, True)
 
         elif rota == "m,g":
-            curadoria = fluxo_curador(chains, f"{resposta}\nSessionID:{session_id}")
-            resposta_gerente = chains["mgr_assist_chain"].invoke(
-                {"input": resposta},
-                config={"configurable": {"session_id": "GERENTE_SESSION"}},
-            )
-            conteudo = f"{curadoria}\n{resposta_gerente}"
-
-            final = chains["router_chain"].invoke(
-                {"input": f"RESPOSTA_FINAL={conteudo}\nORIGEM=curadoria_gerente"},
-                config={"configurable": {"session_id": "ROUTER_SESSION"}},
-            )
-            return ChatResponse(resposta=final, origem="CURADORIA_GERENTE")
+            conteudo = await fluxo_combinado(chains, session_id, resposta, "gerente", fluxo_gerente(chains, session_id, resposta), tempos, notificar)
+            return ResultadoFluxo("CURADORIA_GERENTE", conteudo, True)
 
         elif rota == "r":
-            resposta_rag = fluxo_rag(chains, resposta)
-            juiz = fluxo_juiz(chains, resposta, resposta_rag)
+            [query_embedding] = await etapa("embedding", agerar_embeddings([pergunta_original(resposta)]))
+            # O cache guarda a saída do rag + juiz, que ainda é reformulada para cada usuário
+            em_cache = answer_cache.buscar(query_embedding, chave_api)
+            if em_cache is not None:
+                return ResultadoFluxo("RAG_CACHE", em_cache, True)
+
+            # Só respostas dadas sem histórico do rag não dependem de quem perguntou
+            sem_historico = not history_store.obter(session_id, "rag").messages
+            documents = await etapa("busca_vetorial", run_sync(buscar_por_embedding, query_embedding))
+            resposta_rag = await etapa("rag", fluxo_rag(chains, session_id, resposta, documents=documents))
+            juiz = await etapa("juiz", fluxo_juiz(chains, resposta, resposta_rag))
             conteudo = f"{resposta_rag}\nAvaliação: {juiz}"
-
-            final = chains["router_chain"].invoke(
-                {"input": f"RESPOSTA_FINAL={conteudo}\nORIGEM=rag"},
-                config={"configurable": {"session_id": "ROUTER_SESSION"}},
-            )
-            return ChatResponse(resposta=final, origem="RAG")
+            if sem_historico:
+                answer_cache.guardar(query_embedding, conteudo, [d["_id"] for d in documents], chave_api)
+            return ResultadoFluxo("RAG", conteudo, True)
 
         elif rota == "g":
-            resposta_gerente = chains["mgr_assist_chain"].invoke(
-                {"input": resposta},
-                config={"configurable": {"session_id": "GERENTE_SESSION"}},
-            )
-            final = chains["router_chain"].invoke(
-                {"input": f"RESPOSTA_FINAL={resposta_gerente}\nORIGEM=gerente"},
-                config={"configurable": {"session_id": "ROUTER_SESSION"}},
-            )
-            return ChatResponse(resposta=final, origem="GERENTE")
+            resposta_gerente = await etapa("gerente", fluxo_gerente(chains, session_id, resposta))
+            return ResultadoFluxo("GERENTE", texto_saida(resposta_gerente), True)
 
         elif rota == "m":
-            final = fluxo_curador(chains, f"{resposta}\nSessionID:{session_id}")
-            return ChatResponse(resposta=final, origem="CURADORIA")
+            final = await etapa("curador", fluxo_curador(chains, session_id, f"{resposta}\nSessionID:{session_id}"))
+            return ResultadoFluxo("CURADORIA", texto_saida(final), False)
 
         else:
-            return ChatResponse(resposta=resultado, origem="ASSISTENTE")
+            return ResultadoFluxo("ASSISTENTE", resultado, False)
+    finally:
+        tempos["ramos"] = time.perf_counter() - inicio
+
+
+async def preparar_requisicao(data: ChatInput, email: str):
+    """Resolve sessão, memórias e chains da requisição, com os mesmos erros HTTP do /chat."""
+    try:
+        session_id, memorias = await preparar_sessao(email)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Erro na leitura dos dados de entrada: {str(e)}"
+        )
+
+    try:
+        chains = await run_sync(initialize_system, data.api_key)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="API Key inválida ou erro ao inicializar componentes."
+        )
+    return session_id, memorias, chains
+
+
+async def responder(chains, session_id, memorias, user_message, tempos, vetor_mensagem=None, chave_api=None) -> ChatResponse:
+    """Fluxo completo de uma mensagem, com a reformulação final; falhas viram HTTPException."""
+    try:
+        fluxo = await executar_fluxo(chains, session_id, memorias, user_message, tempos,
+                                     vetor_mensagem=vetor_mensagem, chave_api=chave_api)
+        conteudo = fluxo.conteudo
+        if fluxo.reformular:
+            inicio = time.perf_counter()
+            with medir("reformulacao"):
+                conteudo = await reformular(chains, session_id, conteudo, fluxo.origem.lower())
+            tempos["reformulacao"] = time.perf_counter() - inicio
+        history_store.agendar_compactacao(session_id, chains["llm_flash"])
+        return ChatResponse(resposta=conteudo, origem=fluxo.origem)
 
     except HTTPException:
         raise
@@ -220,6 +489,213 @@ async def chat_endpoint(data: ChatInput, email: str):
         )
 
 
+async def admitir(api_key):
+    """Reserva a vaga de execução da requisição; fila cheia ou espera esgotada viram 429."""
+    try:
+        return await controle_admissao.entrar(registry.key_for(api_key))
+    except Rejeitada as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"{e.motivo} Tente novamente em {e.retry_after}s.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_token)])
+async def chat_endpoint(data: ChatInput, email: str, request: Request, response: Response):
+    """Endpoint principal que executa o fluxo completo.
+    Com o header X-Trace: 1 (ou cpu) a requisição é rastreada; veja GET /traces/{request_id}."""
+    metrics.iniciar_requisicao()
+    request_id = tracing.novo_request_id(request.headers.get("X-Request-ID"))
+    response.headers["X-Request-ID"] = request_id
+    async with tracing.rastrear(request_id, request.headers.get("X-Trace"), "/chat"):
+        with metrics.medir_requisicao("/chat"):
+            vaga = await admitir(data.api_key)
+            try:
+                session_id, memorias, chains = await preparar_requisicao(data, email)
+
+                tempos = {}
+                resposta = await responder(chains, session_id, memorias, data.user_message, tempos,
+                                           chave_api=registry.key_for(data.api_key))
+                response.headers["Server-Timing"] = server_timing(tempos)
+                return resposta
+            finally:
+                vaga.liberar()
+
+
+def evento_sse(evento, dados):
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.post("/chat/stream", dependencies=[Depends(verify_token)])
+async def chat_stream_endpoint(data: ChatInput, email: str, request: Request):
+    """
+    Mesmo fluxo do /chat, via Server-Sent Events.
+    Eventos: rota, etapa (a cada etapa concluída), origem, token (resposta final
+    em pedaços), fim (tempos das etapas) e erro.
+    """
+    metrics.iniciar_requisicao()
+    inicio_requisicao = time.perf_counter()
+    request_id = tracing.novo_request_id(request.headers.get("X-Request-ID"))
+    trace = tracing.iniciar(request_id, request.headers.get("X-Trace"), "/chat/stream")
+    vaga = None
+    try:
+        vaga = await admitir(data.api_key)
+        session_id, memorias, chains = await preparar_requisicao(data, email)
+    except HTTPException as e:
+        if vaga is not None:
+            vaga.liberar()
+        metrics.observar_requisicao("/chat/stream", time.perf_counter() - inicio_requisicao, e.status_code)
+        await tracing.finalizar(trace)
+        raise
+
+    async def gerar():
+        fila = asyncio.Queue()
+        tempos = {}
+        codigo = 500
+
+        async def notificar(evento, dados):
+            await fila.put(evento_sse(evento, dados))
+
+        async def rodar():
+            try:
+                return await executar_fluxo(chains, session_id, memorias, data.user_message, tempos, notificar,
+                                            chave_api=registry.key_for(data.api_key))
+            finally:
+                await fila.put(None)
+
+        tarefa = asyncio.create_task(rodar())
+        try:
+            while (item := await fila.get()) is not None:
+                yield item
+
+            fluxo = tarefa.result()
+            yield evento_sse("origem", {"origem": fluxo.origem})
+
+            if fluxo.reformular:
+                inicio = time.perf_counter()
+                pedacos = []
+                with medir("reformulacao"):
+                    async for pedaco in reformular_stream(chains, session_id, fluxo.conteudo, fluxo.origem.lower()):
+                        pedacos.append(pedaco)
+                        yield evento_sse("token", {"texto": pedaco})
+                tempos["reformulacao"] = time.perf_counter() - inicio
+                final = "".join(pedacos)
+            else:
+                final = fluxo.conteudo
+                yield evento_sse("token", {"texto": final})
+
+            history_store.agendar_compactacao(session_id, chains["llm_flash"])
+
+            codigo = 200
+            yield evento_sse("fim", {"tempos": tempos})
+
+        except Exception as e:
+            codigo = getattr(e, "status_code", 500)
+            detalhe = e.detail if isinstance(e, HTTPException) else str(e)
+            yield evento_sse("erro", {"detail": f"Erro interno ao processar fluxo: {detalhe}"})
+        finally:
+            if not tarefa.done():
+                tarefa.cancel()
+            vaga.liberar()
+            metrics.observar_requisicao("/chat/stream", time.perf_counter() - inicio_requisicao, codigo)
+            await tracing.finalizar(trace)
+
+    corpo = gerar()
+    # Se o cliente cair antes do primeiro evento o gerador nem começa; a vaga volta na coleta
+    weakref.finalize(corpo, asyncio.get_running_loop().call_soon_threadsafe, vaga.liberar).atexit = False
+    return StreamingResponse(
+        corpo,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id},
+    )
+
+
+@app.post("/chat/batch", response_model=ChatBatchResponse, dependencies=[Depends(verify_token)])
+async def chat_batch_endpoint(data: ChatBatchInput, request: Request, response: Response):
+    """
+    Processa vários pares (email, mensagem) em uma chamada, com o mesmo fluxo do /chat.
+    Sessões e memórias são lidas em lote, os embeddings das mensagens saem de uma única
+    chamada e os itens rodam em paralelo (cada um ocupa uma vaga do controle de admissão).
+    Os resultados vêm na ordem dos itens; a falha de um item não derruba os demais.
+    """
+    metrics.iniciar_requisicao()
+    request_id = tracing.novo_request_id(request.headers.get("X-Request-ID"))
+    response.headers["X-Request-ID"] = request_id
+    if len(data.itens) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"O lote aceita no máximo {BATCH_MAX_ITEMS} itens."
+        )
+    async with tracing.rastrear(request_id, request.headers.get("X-Trace"), "/chat/batch"):
+        with metrics.medir_requisicao("/chat/batch"):
+            try:
+                chains = await run_sync(initialize_system, data.api_key)
+            except Exception:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="API Key inválida ou erro ao inicializar componentes."
+                )
+
+            try:
+                sessoes = await run_sync(get_session_ids, [item.email for item in data.itens])
+                memorias = await run_sync(get_memories_batch, list(sessoes.values()))
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Erro ao recuperar as sessões do lote: {str(e)}"
+                )
+
+            # Embeddings de todas as mensagens de uma vez (lotes de até 100 em paralelo); em falha, cada item gera o seu
+            try:
+                with medir("embedding_lote"):
+                    vetores = await agerar_embeddings([item.user_message for item in data.itens])
+            except Exception:
+                vetores = [None] * len(data.itens)
+
+            semaforo = asyncio.Semaphore(max(1, min(data.concorrencia or BATCH_CONCURRENCY, BATCH_CONCURRENCY)))
+            chave = registry.key_for(data.api_key)
+
+            async def processar(indice, item):
+                # Cada item roda em sua própria task: a rota das métricas é a dele
+                metrics.iniciar_requisicao()
+                session_id = sessoes.get(item.email)
+                if session_id is None:
+                    return ResultadoItem(email=item.email, status=404, erro="Sessão não encontrada para este usuário.")
+                async with semaforo:
+                    try:
+                        vaga = await controle_admissao.entrar(chave)
+                    except Rejeitada as e:
+                        return ResultadoItem(email=item.email, status=429, erro=f"{e.motivo} Tente novamente em {e.retry_after}s.")
+                    try:
+                        resposta = await tracing.rastreado(
+                            f"item_{indice}",
+                            responder(chains, session_id, memorias.get(session_id, 0), item.user_message, {}, vetores[indice], chave),
+                        )
+                        return ResultadoItem(email=item.email, resposta=resposta.resposta, origem=resposta.origem)
+                    except HTTPException as e:
+                        return ResultadoItem(email=item.email, status=e.status_code, erro=str(e.detail))
+                    finally:
+                        vaga.liberar()
+
+            resultados = await asyncio.gather(*(processar(i, item) for i, item in enumerate(data.itens)))
+            return ChatBatchResponse(resultados=resultados)
+
+
+@app.get("/metrics", dependencies=[Depends(verify_token)])
+def metrics_endpoint():
+    """Métricas no formato texto do Prometheus."""
+    return Response(content=metrics.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/traces/{request_id}", dependencies=[Depends(verify_token)])
+def trace_endpoint(request_id: str):
+    """Trace (formato Chrome trace / Perfetto) de uma requisição rastreada."""
+    caminho = tracing.caminho_trace(request_id)
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Trace não encontrado.")
+    return FileResponse(caminho, media_type="application/json")
+
 
 @app.get("/health")
 def health_check():
@@ -0,0 +1,94 @@
+"""
+Memoização das tools de leitura dentro de uma execução do agente.
+
+O AgentExecutor costuma repetir a mesma tool com os mesmos argumentos enquanto
+raciocina (ex: verificar_avisos duas vezes); cada repetição voltaria ao Postgres.
+Dentro de escopo() o resultado de cada (tool, argumentos canônicos) é reaproveitado
+até o fim do escopo, e qualquer tool de escrita descarta tudo o que foi guardado.
+Fora de um escopo as tools executam normalmente.
+"""
+import contextvars
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from metrics import resposta_de_erro
+from singleflight import argumentos_canonicos, chave_canonica
+
+# Dict mutável: as tools rodam em threads com cópias do contexto e todas enxergam o mesmo escopo
+_escopo = contextvars.ContextVar("memo_tools", default=None)
+
+_lock = threading.Lock()
+_acertos = Counter()
+_execucoes = Counter()
+_invalidacoes = Counter()
+
+
+class _Escopo:
+    def __init__(self):
+        self.valores = {}
+        self.lock = threading.Lock()
+
+
+@contextmanager
+def escopo():
+    """Abre um escopo de memoização (uma execução do agente)."""
+    token = _escopo.set(_Escopo())
+    try:
+        yield
+    finally:
+        _escopo.reset(token)
+
+
+def memoizado(nome):
+    """Reaproveita o resultado da tool de leitura `nome` dentro do escopo corrente.
+    Respostas de erro ("Erro ...") não são guardadas."""
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltorio(*args, **kwargs):
+            atual = _escopo.get()
+            if atual is None:
+                return func(*args, **kwargs)
+            chave = chave_canonica(nome, argumentos_canonicos(func, args, kwargs))
+            with atual.lock:
+                if chave in atual.valores:
+                    with _lock:
+                        _acertos[nome] += 1
+                    return atual.valores[chave]
+            resultado = func(*args, **kwargs)
+            with _lock:
+                _execucoes[nome] += 1
+            if not resposta_de_erro(resultado):
+                with atual.lock:
+                    atual.valores[chave] = resultado
+            return resultado
+        return envoltorio
+    return decorador
+
+
+def invalida(nome):
+    """Tool de escrita: ao terminar, descarta tudo o que foi memoizado no escopo."""
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltorio(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                atual = _escopo.get()
+                if atual is not None:
+                    with atual.lock:
+                        atual.valores.clear()
+                    with _lock:
+                        _invalidacoes[nome] += 1
+        return envoltorio
+    return decorador
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "hits": dict(_acertos),
+            "executions": dict(_execucoes),
+            "invalidations": dict(_invalidacoes),
+        }
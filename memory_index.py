@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from cache import TTLCache
+from history_store import estimar_tokens
+from redis_client import connect_redis
+from vector_search import gerar_embeddings
+
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+MEMORY_RECENT = int(os.getenv("MEMORY_RECENT", "3"))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "400"))
+MEMORY_INDEX_SESSIONS = int(os.getenv("MEMORY_INDEX_SESSIONS", "1024"))
+MEMORY_TTL_DAYS = float(os.getenv("MEMORY_TTL_DAYS", "0"))  # 0 = sem expiração
+
+
+def texto_memoria(memoria) -> str:
+    """Texto de uma memória, seja no formato {'timestamp', 'data'} ou texto puro."""
+    if isinstance(memoria, dict) and "data" in memoria:
+        memoria = memoria["data"]
+    if isinstance(memoria, str):
+        return memoria
+    return json.dumps(memoria, ensure_ascii=False)
+
+
+def hash_memoria(texto: str) -> str:
+    return hashlib.sha1(" ".join(texto.casefold().split()).encode("utf-8")).hexdigest()
+
+
+def chave_vetores(session_id):
+    return f"memvec:{session_id}"
+
+
+class MemoryIndex:
+    """
+    Índice vetorial de memórias por sessão. Cada memória é embutida ao ser gravada
+    (hash Redis memvec:{session_id}: hash do conteúdo -> float32) e, a cada mensagem,
+    só as mais relevantes (top-k) e as mais recentes entram no prompt, dentro de um
+    orçamento fixo de tokens.
+    O memory_store remove os vetores das memórias descartadas (LTRIM, remoção,
+    compactação) junto com a própria memória; ver descartar() e substituir().
+    """
+
+    def __init__(self, gerar_embeddings, maxsize=MEMORY_INDEX_SESSIONS):
+        self._gerar_embeddings = gerar_embeddings
+        self._vetores = TTLCache(maxsize=maxsize)
+
+    def _locais(self, session_id) -> dict:
+        vetores = self._vetores.get(str(session_id))
+        if vetores is None:
+            vetores = {}
+            self._vetores.set(str(session_id), vetores)
+        return vetores
+
+    def indexar(self, session_id, textos):
+        """Gera e grava os embeddings das memórias novas da sessão."""
+        textos = [t for t in textos if t]
+        if not textos:
+            return
+        vetores = self._gerar_embeddings(textos)
+        mapa = {hash_memoria(t): np.asarray(v, dtype=np.float32) for t, v in zip(textos, vetores)}
+        with connect_redis().pipeline(transaction=False) as pipe:
+            pipe.hset(chave_vetores(session_id), mapping={h: v.tobytes() for h, v in mapa.items()})
+            if MEMORY_TTL_DAYS > 0:
+                pipe.expire(chave_vetores(session_id), int(MEMORY_TTL_DAYS * 86400))
+            pipe.execute()
+        self._locais(session_id).update(mapa)
+
+    def descartar(self, session_id, hashes):
+        """Esquece localmente os vetores de memórias removidas (o HDEL é do memory_store)."""
+        locais = self._locais(session_id)
+        for h in hashes:
+            locais.pop(h, None)
+
+    def substituir(self, session_id, mapa):
+        """Troca os vetores locais da sessão por `mapa` (hash -> vetor), após a compactação."""
+        self._vetores.set(str(session_id), dict(mapa))
+
+    def vetores(self, session_id, textos):
+        locais = self._locais(session_id)
+        hashes = [hash_memoria(t) for t in textos]
+
+        faltantes = [h for h in dict.fromkeys(hashes) if h not in locais]
+        if faltantes:
+            blobs = connect_redis().hmget(chave_vetores(session_id), faltantes)
+            for h, blob in zip(faltantes, blobs):
+                if blob:
+                    locais[h] = np.frombuffer(blob, dtype=np.float32)
+
+        # Memórias gravadas antes do índice existir são embutidas agora, uma única vez
+        sem_vetor = list(dict.fromkeys(t for t, h in zip(textos, hashes) if h not in locais))
+        if sem_vetor:
+            self.indexar(session_id, sem_vetor)
+        return [locais[h] for h in hashes]
+
+    def selecionar(self, session_id, memorias, vetor_mensagem, k=MEMORY_TOP_K, recentes=MEMORY_RECENT,
+                   max_tokens=MEMORY_MAX_TOKENS):
+        """Retorna as memórias relevantes para a mensagem, já serializadas de forma compacta."""
+        if not memorias:
+            return ""
+        textos = [texto_memoria(m) for m in memorias]
+        n = len(textos)
+        escolhidas = set(range(max(0, n - recentes), n))
+
+        prioridade = list(reversed(sorted(escolhidas)))
+        if vetor_mensagem is not None and n > len(escolhidas):
+            try:
+                matriz = np.vstack(self.vetores(session_id, textos))
+                scores = matriz @ np.asarray(vetor_mensagem, dtype=np.float32)
+                ranking = [int(i) for i in np.argsort(-scores) if int(i) not in escolhidas][:k]
+                prioridade = ranking + prioridade
+                escolhidas.update(ranking)
+            except Exception:
+                pass
+
+        # Respeita o orçamento de tokens, descartando primeiro as menos prioritárias
+        incluidas, total = set(), 0
+        for i in prioridade:
+            linha = self._linha(memorias[i], textos[i])
+            custo = estimar_tokens(linha)
+            if total + custo > max_tokens:
+                continue
+            incluidas.add(i)
+            total += custo
+        return "\n".join(self._linha(memorias[i], textos[i]) for i in sorted(incluidas))
+
+    @staticmethod
+    def _linha(memoria, texto):
+        data = memoria.get("timestamp", "")[:10] if isinstance(memoria, dict) else ""
+        return f"- {texto} ({data})" if data else f"- {texto}"
+
+    def stats(self) -> dict:
+        return self._vetores.stats()
+
+
+memory_index = MemoryIndex(gerar_embeddings)
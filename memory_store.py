@@ -0,0 +1,286 @@
+import json
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import redis
+from memory_index import MEMORY_TTL_DAYS, chave_vetores, hash_memoria, memory_index, texto_memoria
+from redis_client import connect_redis
+from session_cache import chave_versao, session_cache
+
+MEMORY_MAX_PER_SESSION = int(os.getenv("MEMORY_MAX_PER_SESSION", "200"))
+MEMORY_MERGE_THRESHOLD = float(os.getenv("MEMORY_MERGE_THRESHOLD", "0.93"))
+MEMORY_COMPACT_EVERY = int(os.getenv("MEMORY_COMPACT_EVERY", "20"))
+
+# Formato binário: MAGIC | flags | timestamp (uint32, epoch) | conteúdo
+# 0xB1 nunca inicia um texto UTF-8 válido, então não se confunde com o JSON antigo.
+MAGIC = 0xB1
+FLAG_JSON = 0x01
+FLAG_ZLIB = 0x02
+CABECALHO = struct.Struct("<BBI")
+COMPRIMIR_ACIMA = 128
+
+
+def chave_lista(session_id):
+    return f"memorys:{session_id}"
+
+
+def chave_hashes(session_id):
+    return f"memhash:{session_id}"
+
+
+def codificar(conteudo, timestamp: datetime | None = None) -> bytes:
+    timestamp = timestamp or datetime.now(timezone.utc)
+    flags = 0
+    if isinstance(conteudo, str):
+        dados = conteudo.encode("utf-8")
+    else:
+        dados = json.dumps(conteudo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        flags |= FLAG_JSON
+    if len(dados) > COMPRIMIR_ACIMA:
+        comprimido = zlib.compress(dados, 6)
+        if len(comprimido) < len(dados):
+            dados, flags = comprimido, flags | FLAG_ZLIB
+    return CABECALHO.pack(MAGIC, flags, int(timestamp.timestamp())) + dados
+
+
+def decodificar(valor):
+    """Lê uma entrada no formato binário ou no JSON antigo; retorna {'timestamp', 'data'}."""
+    if isinstance(valor, bytes) and valor[:1] == bytes([MAGIC]):
+        _, flags, epoch = CABECALHO.unpack_from(valor)
+        dados = valor[CABECALHO.size:]
+        if flags & FLAG_ZLIB:
+            dados = zlib.decompress(dados)
+        texto = dados.decode("utf-8")
+        return {
+            "timestamp": datetime.fromtimestamp(epoch, timezone.utc).isoformat(),
+            "data": json.loads(texto) if flags & FLAG_JSON else texto,
+        }
+    valor = valor.decode("utf-8") if isinstance(valor, bytes) else valor
+    try:
+        return json.loads(valor)
+    except json.JSONDecodeError:
+        return valor
+
+
+def decodificar_lista(valores):
+    return [decodificar(v) for v in valores]
+
+
+def _aplicar_limites(pipe, session_id):
+    if MEMORY_MAX_PER_SESSION > 0:
+        pipe.ltrim(chave_lista(session_id), -MEMORY_MAX_PER_SESSION, -1)
+    if MEMORY_TTL_DAYS > 0:
+        segundos = int(MEMORY_TTL_DAYS * 86400)
+        for chave in (chave_lista(session_id), chave_hashes(session_id), chave_vetores(session_id), chave_versao(session_id)):
+            pipe.expire(chave, segundos)
+
+
+class MemoryStore:
+    """
+    Armazenamento das memórias de cada sessão no Redis:
+    - entradas binárias compactas (ver codificar/decodificar), legíveis junto com o JSON antigo;
+    - deduplicação na escrita pelo hash do conteúdo (SET memhash:{session_id});
+    - limite de entradas por sessão (LTRIM) e expiração opcional, aplicados também ao
+      SET de hashes e aos vetores do memory_index (memvec:{session_id});
+    - compactação em segundo plano que funde memórias quase idênticas (cosseno).
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-compact")
+        self._escritas = {}
+        self._agendadas = set()
+        self._lock = threading.Lock()
+        self.gravadas = 0
+        self.duplicadas = 0
+        self.fundidas = 0
+
+    def gravar(self, session_id, conteudos) -> int:
+        """Grava as memórias que ainda não existem na sessão; retorna quantas eram novas."""
+        textos = [texto_memoria(c) for c in conteudos]
+        hashes = [hash_memoria(t) for t in textos]
+        agora = datetime.now(timezone.utc)
+
+        novas, versao = self._anexar(connect_redis(), session_id, list(zip(conteudos, textos, hashes)), agora)
+        self.duplicadas += len(conteudos) - len(novas)
+        if not novas:
+            return 0
+        self.gravadas += len(novas)
+
+        session_cache.anexar_memorias(
+            session_id, versao, [{"timestamp": agora.isoformat(), "data": c} for c, _, _ in novas], limite=MEMORY_MAX_PER_SESSION
+        )
+        try:
+            # Com mais novas que o limite, as primeiras já saíram no LTRIM
+            manter = novas[-MEMORY_MAX_PER_SESSION:] if MEMORY_MAX_PER_SESSION > 0 else novas
+            memory_index.indexar(session_id, [t for _, t, _ in manter])
+        except Exception as e:
+            # A memória já foi gravada; o embedding é refeito na próxima leitura
+            print(f"⚠️ Falha ao indexar memória da sessão {session_id}: {e}")
+
+        self._contar_escritas(session_id, len(novas))
+        return len(novas)
+
+    @staticmethod
+    def _anexar(r, session_id, candidatas, agora):
+        """
+        Deduplicação, RPUSH e LTRIM no limite da sessão em uma única transação: as
+        candidatas (conteudo, texto, hash) cujo hash não está no SET são gravadas junto
+        com o SADD, e as entradas que o LTRIM descarta têm o hash removido do SET e o
+        vetor removido do memvec. Se a
+        transação não acontece, nada fica marcado como registrado. WATCH na lista e no
+        SET: uma escrita concorrente refaz a conta. A versão da sessão (memver) sobe na
+        mesma transação. Retorna (candidatas gravadas, nova versão).
+        """
+        lista, hashes = chave_lista(session_id), chave_hashes(session_id)
+        unicas = list({h: (c, t, h) for c, t, h in candidatas}.values())
+        with r.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(lista, hashes)
+                    existentes = pipe.smismember(hashes, [h for _, _, h in unicas]) if unicas else []
+                    novas = [c for c, existe in zip(unicas, existentes) if not existe]
+                    if not novas:
+                        pipe.unwatch()
+                        return [], None
+                    hashes_novos = [h for _, _, h in novas]
+
+                    excedente = 0
+                    if MEMORY_MAX_PER_SESSION > 0:
+                        excedente = pipe.llen(lista) + len(novas) - MEMORY_MAX_PER_SESSION
+                    descartadas = pipe.lrange(lista, 0, excedente - 1) if excedente > 0 else []
+                    remover = [hash_memoria(texto_memoria(decodificar(v))) for v in descartadas]
+                    # Com mais entradas novas que o limite, parte delas também sai
+                    remover += hashes_novos[:max(0, excedente - len(descartadas))]
+
+                    pipe.multi()
+                    pipe.incr(chave_versao(session_id))
+                    pipe.rpush(lista, *[codificar(c, agora) for c, _, _ in novas])
+                    pipe.sadd(hashes, *hashes_novos)
+                    if remover:
+                        pipe.srem(hashes, *remover)
+                        pipe.hdel(chave_vetores(session_id), *remover)
+                    _aplicar_limites(pipe, session_id)
+                    versao = pipe.execute()[0]
+                    memory_index.descartar(session_id, remover)
+                    return novas, versao
+                except redis.WatchError:
+                    continue
+
+    def ler(self, session_id):
+        return decodificar_lista(connect_redis().lrange(chave_lista(session_id), 0, -1))
+
+    def ler_versionada(self, session_id):
+        """(versão, memórias) da sessão, lidas na mesma transação (para o session_cache)."""
+        return self.ler_varias_versionadas([session_id])[session_id]
+
+    def ler_varias_versionadas(self, session_ids) -> dict:
+        """{session_id: (versão, memórias)} de várias sessões em um único round trip."""
+        session_ids = list(dict.fromkeys(session_ids))
+        with connect_redis().pipeline(transaction=True) as pipe:
+            for session_id in session_ids:
+                pipe.get(chave_versao(session_id))
+                pipe.lrange(chave_lista(session_id), 0, -1)
+            valores = pipe.execute()
+        return {
+            session_id: (int(versao or 0), decodificar_lista(lista))
+            for session_id, versao, lista in zip(session_ids, valores[::2], valores[1::2])
+        }
+
+    def remover_ultima(self, session_id):
+        """Remove a última memória da sessão; retorna a entrada decodificada ou None."""
+        r = connect_redis()
+        ultima = r.rpop(chave_lista(session_id))
+        if not ultima:
+            return None
+        memoria = decodificar(ultima)
+        h = hash_memoria(texto_memoria(memoria))
+        with r.pipeline(transaction=True) as pipe:
+            pipe.incr(chave_versao(session_id))
+            pipe.srem(chave_hashes(session_id), h)
+            pipe.hdel(chave_vetores(session_id), h)
+            versao = pipe.execute()[0]
+        memory_index.descartar(session_id, [h])
+        session_cache.remover_ultima(session_id, versao)
+        return memoria
+
+    def _contar_escritas(self, session_id, quantidade):
+        with self._lock:
+            total = self._escritas.get(str(session_id), 0) + quantidade
+            if total < MEMORY_COMPACT_EVERY or str(session_id) in self._agendadas:
+                self._escritas[str(session_id)] = total
+                return
+            self._escritas[str(session_id)] = 0
+            self._agendadas.add(str(session_id))
+        self._executor.submit(self._compactar_agendada, session_id)
+
+    def _compactar_agendada(self, session_id):
+        try:
+            self.compactar(session_id)
+        except Exception as e:
+            print(f"⚠️ Falha ao compactar memórias da sessão {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._agendadas.discard(str(session_id))
+
+    def compactar(self, session_id) -> int:
+        """
+        Funde memórias quase duplicadas (mantém a mais recente), reescreve a lista no
+        formato binário e reconstrói o conjunto de hashes e os vetores. Usa WATCH: se houver escrita
+        concorrente, a compactação é abandonada e fica para a próxima vez.
+        """
+        r = connect_redis()
+        lista, hashes = chave_lista(session_id), chave_hashes(session_id)
+        with r.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(lista)
+                valores = pipe.lrange(lista, 0, -1)
+                if not valores:
+                    return 0
+                memorias = decodificar_lista(valores)
+                textos = [texto_memoria(m) for m in memorias]
+                vetores = np.vstack(memory_index.vetores(session_id, textos))
+                similaridade = vetores @ vetores.T
+
+                manter = []
+                for i in range(len(memorias) - 1, -1, -1):
+                    if all(similaridade[i, j] < MEMORY_MERGE_THRESHOLD for j in manter):
+                        manter.append(i)
+                manter.sort()
+                if MEMORY_MAX_PER_SESSION > 0:
+                    # O LTRIM de _aplicar_limites não pode descartar entradas cujo hash foi regravado
+                    manter = manter[-MEMORY_MAX_PER_SESSION:]
+
+                def entrada(m):
+                    if isinstance(m, dict) and "timestamp" in m:
+                        return codificar(m.get("data"), datetime.fromisoformat(m["timestamp"]))
+                    return codificar(m)
+
+                mantidos = {hash_memoria(textos[i]): vetores[i] for i in manter}
+                pipe.multi()
+                pipe.incr(chave_versao(session_id))
+                pipe.delete(lista, hashes, chave_vetores(session_id))
+                pipe.rpush(lista, *[entrada(memorias[i]) for i in manter])
+                pipe.sadd(hashes, *mantidos)
+                pipe.hset(chave_vetores(session_id), mapping={h: v.tobytes() for h, v in mantidos.items()})
+                _aplicar_limites(pipe, session_id)
+                pipe.execute()
+            except redis.WatchError:
+                return 0
+
+        memory_index.substituir(session_id, mantidos)
+
+        fundidas = len(memorias) - len(manter)
+        self.fundidas += fundidas
+        session_cache.invalidar(session_id)
+        return fundidas
+
+    def stats(self) -> dict:
+        return {"written": self.gravadas, "duplicates": self.duplicadas, "merged": self.fundidas}
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,319 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import tracing
+
+# Limites (segundos) dos buckets dos histogramas de duração
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Estado da requisição corrente. É um dict mutável para que a rota definida dentro de
+# uma task filha (ex: /chat/stream) também valha para quem a criou.
+_requisicao = contextvars.ContextVar("metricas_requisicao", default=None)
+
+
+def iniciar_requisicao():
+    """Abre o contexto de métricas da requisição; a rota é definida após o roteamento."""
+    _requisicao.set({"rota": "none"})
+
+
+def definir_rota(rota):
+    estado = _requisicao.get()
+    if estado is not None:
+        estado["rota"] = rota or "none"
+
+
+def rota_atual() -> str:
+    estado = _requisicao.get()
+    return estado["rota"] if estado is not None else "none"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar(nomes, valores, extra=None) -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos) -> tuple:
+        return tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+
+    def exportar(self) -> list[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = list(self._valores.items())
+        for chave, valor in sorted(itens):
+            linhas.extend(self._linhas(chave, valor))
+        return linhas
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1.0, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def valor(self, **rotulos) -> float:
+        return self._valores.get(self._chave(rotulos), 0.0)
+
+    def _linhas(self, chave, valor):
+        return [f"{self.nome}{_formatar(self.rotulos, chave)} {_numero(valor)}"]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                serie = self._valores[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def _linhas(self, chave, serie):
+        contagens, soma, total = serie
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+            acumulado += contagem
+            le = f'le="{_numero(limite)}"'
+            linhas.append(f"{self.nome}_bucket{_formatar(self.rotulos, chave, le)} {acumulado}")
+        rotulos = _formatar(self.rotulos, chave)
+        linhas.append(f"{self.nome}_sum{rotulos} {_numero(soma)}")
+        linhas.append(f"{self.nome}_count{rotulos} {total}")
+        return linhas
+
+
+def _achatar(dados, prefixo=""):
+    for chave, valor in dados.items():
+        nome = f"{prefixo}_{chave}" if prefixo else str(chave)
+        if isinstance(valor, dict):
+            yield from _achatar(valor, nome)
+        elif isinstance(valor, bool):
+            yield nome, int(valor)
+        elif isinstance(valor, (int, float)):
+            yield nome, valor
+
+
+def _nome_metrica(texto) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", texto)
+
+
+class Registro:
+    """
+    Conjunto de métricas do processo. Além das métricas próprias, exporta como gauges
+    os valores numéricos dos stats() dos componentes registrados com registrar_coletor.
+    """
+
+    def __init__(self, prefixo="eta"):
+        self.prefixo = prefixo
+        self._metricas = []
+        self._coletores = {}
+
+    def contador(self, nome, descricao, rotulos=()) -> Contador:
+        metrica = Contador(nome, descricao, rotulos)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome, descricao, rotulos=(), buckets=BUCKETS) -> Histograma:
+        metrica = Histograma(nome, descricao, rotulos, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def registrar_coletor(self, componente, stats):
+        """stats() é chamado a cada exportação; falhas apenas omitem o componente."""
+        self._coletores[componente] = stats
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        for componente, stats in self._coletores.items():
+            try:
+                dados = stats()
+            except Exception as e:
+                print(f"⚠️ Falha ao coletar stats de '{componente}': {e}")
+                continue
+            for chave, valor in _achatar(dados):
+                nome = _nome_metrica(f"{self.prefixo}_{componente}_{chave}")
+                linhas.append(f"# TYPE {nome} gauge")
+                linhas.append(f"{nome} {_numero(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+DURACAO_ETAPA = registro.histograma(
+    "eta_stage_duration_seconds", "Duração de cada etapa do pipeline.", ["route", "stage"]
+)
+ETAPAS = registro.contador(
+    "eta_stage_total", "Execuções de cada etapa por resultado (ok/error).", ["route", "stage", "outcome"]
+)
+DURACAO_REQUISICAO = registro.histograma(
+    "eta_request_duration_seconds", "Duração das requisições de chat.", ["endpoint", "route", "status"]
+)
+DURACAO_LLM = registro.histograma(
+    "eta_llm_duration_seconds", "Duração de cada chamada ao modelo.", ["route", "model"]
+)
+TOKENS_LLM = registro.contador(
+    "eta_llm_tokens_total", "Tokens consumidos pelo modelo (input/output).", ["route", "model", "type"]
+)
+
+
+def observar(etapa, duracao, ok=True):
+    rota = rota_atual()
+    DURACAO_ETAPA.observar(duracao, route=rota, stage=etapa)
+    ETAPAS.inc(route=rota, stage=etapa, outcome="ok" if ok else "error")
+
+
+@contextmanager
+def medir(etapa):
+    """Mede o bloco como uma etapa; exceções contam como erro e são propagadas.
+    Em requisições rastreadas a etapa também vira um span do trace."""
+    inicio = time.perf_counter()
+    ok = False
+    try:
+        with tracing.span(etapa):
+            yield
+        ok = True
+    finally:
+        observar(etapa, time.perf_counter() - inicio, ok)
+
+
+def observar_requisicao(endpoint, duracao, status):
+    DURACAO_REQUISICAO.observar(duracao, endpoint=endpoint, route=rota_atual(), status=status)
+
+
+@contextmanager
+def medir_requisicao(endpoint):
+    """Registra duração e status (status_code da exceção, se houver) da requisição."""
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        yield
+        status = 200
+    except Exception as e:
+        status = getattr(e, "status_code", 500)
+        raise
+    finally:
+        observar_requisicao(endpoint, time.perf_counter() - inicio, status)
+
+
+def resposta_de_erro(resultado) -> bool:
+    """As tools capturam exceções e devolvem 'Erro ...' (ou status=error) ao agente."""
+    if isinstance(resultado, dict):
+        return resultado.get("status") == "error"
+    if isinstance(resultado, list) and resultado:
+        resultado = resultado[0]
+    return isinstance(resultado, str) and resultado.startswith("Erro")
+
+
+def medido(etapa, falhou=None):
+    """Decorador de medir() para funções síncronas ou assíncronas.
+    `falhou(resultado)` marca como erro retornos que não são exceções."""
+    def decorador(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def envoltorio(*args, **kwargs):
+                inicio = time.perf_counter()
+                ok = False
+                try:
+                    with tracing.span(etapa):
+                        resultado = await func(*args, **kwargs)
+                    ok = falhou is None or not falhou(resultado)
+                    return resultado
+                finally:
+                    observar(etapa, time.perf_counter() - inicio, ok)
+        else:
+            @functools.wraps(func)
+            def envoltorio(*args, **kwargs):
+                inicio = time.perf_counter()
+                ok = False
+                try:
+                    with tracing.span(etapa):
+                        resultado = func(*args, **kwargs)
+                    ok = falhou is None or not falhou(resultado)
+                    return resultado
+                finally:
+                    observar(etapa, time.perf_counter() - inicio, ok)
+        return envoltorio
+    return decorador
+
+
+class MetricasLLM(BaseCallbackHandler):
+    """Callback dos modelos: duração de cada chamada e tokens de entrada/saída."""
+
+    run_inline = True
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self._inicios = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._inicios[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._inicios[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        rota = rota_atual()
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            DURACAO_LLM.observar(time.perf_counter() - inicio, route=rota, model=self.modelo)
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                uso = getattr(getattr(geracao, "message", None), "usage_metadata", None) or {}
+                if uso.get("input_tokens"):
+                    TOKENS_LLM.inc(uso["input_tokens"], route=rota, model=self.modelo, type="input")
+                if uso.get("output_tokens"):
+                    TOKENS_LLM.inc(uso["output_tokens"], route=rota, model=self.modelo, type="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            DURACAO_LLM.observar(time.perf_counter() - inicio, route=rota_atual(), model=self.modelo)
+
+
+def exportar() -> str:
+    return registro.exportar()
+
+
+def registrar_coletor(componente, stats):
+    registro.registrar_coletor(componente, stats)
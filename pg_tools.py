@@ -1,64 +1,35 @@
 from langchain.tools import tool
 from pydantic import BaseModel, Field
 from typing import Optional
-import psycopg2
-import os
-from dotenv import load_dotenv
-load_dotenv()
 import datetime
 
-host = os.getenv('host')
-porta = os.getenv('porta')
-database = os.getenv('database')
-senha = os.getenv('senha')
-user = os.getenv('user')
-def conectar():
-    conn=psycopg2.connect(
-        dbname=database,
-        user=user,
-        password=senha,
-        host=host,
-        port=porta
-        )
-    return conn
+from db_pool import conexao, transacao
+from reference_cache import reference_cache
+from metrics import medido, resposta_de_erro
+from singleflight import SingleFlight, coalescido
+from memoize import memoizado, invalida
 
+# Só as tools de leitura são coalescidas e memoizadas; as de escrita sempre executam
+# e descartam o que foi memoizado na execução do agente
+_voos_leitura = SingleFlight("pg_tools")
 
 
+def _buscar_id(tabela, valor, descricao):
+    id_ = reference_cache.buscar(tabela, valor)
+    if id_ is None:
+        raise ValueError(f"{descricao} '{valor}' não encontrado(a).")
+    return id_
+
+
+# Resolvidos pelo cache de referência: nenhuma consulta no caminho quente
 def get_prioridade(prioridade:str) -> int:
-    try:
-        conn=conectar()
-        cursor=conn.cursor()
-        query='SELECT id_prioridade FROM prioridade WHERE nivel=%s'
-        cursor.execute(query,(prioridade,))
-        id_prioridade=cursor.fetchone()[0]
-    except Exception as e:
-        conn.rollback()
-        print(f"Exceção: {e}")
-    return id_prioridade
+    return _buscar_id("prioridade", prioridade, "Prioridade")
 
 def get_status(status:str) -> int:
-    try:
-        conn=conectar()
-        cursor=conn.cursor()
-        query='SELECT id_status FROM status WHERE status=%s'
-        cursor.execute(query,(status,))
-        id_status=cursor.fetchone()[0]
-    except Exception as e:
-        conn.rollback()
-        print(f"Exceção: {e}")
-    return id_status
+    return _buscar_id("status", status, "Status")
 
 def get_funcionario(email:str) -> int:
-    try:
-        conn=conectar()
-        cursor=conn.cursor()
-        query='SELECT id_funcionario FROM funcionario WHERE email=%s'
-        cursor.execute(query,(email,))
-        id_funcionario=cursor.fetchone()[0]
-    except Exception as e:
-        conn.rollback()
-        print(f"Exceção: {e}")
-    return id_funcionario
+    return _buscar_id("funcionario", email, "Funcionário")
 
 
 #tool verificar avisos:
@@ -68,30 +39,32 @@ class VerificarAvisosArgs(BaseModel):
     incluir_resolvidos: bool = Field(default=False, description="Se verdadeiro, inclui avisos resolvidos (id_status != 1 ou 2).")
 
 @tool("verificar_avisos", args_schema=VerificarAvisosArgs)
+@medido("tool:verificar_avisos", falhou=resposta_de_erro)
+@memoizado("verificar_avisos")
+@coalescido(_voos_leitura, "verificar_avisos")
 def verificar_avisos(incluir_resolvidos: bool = False) -> list[str]:
     """
     Retorna os avisos ativos do sistema (id_status = 1 ou 2).
     Cada aviso vem com sua descrição, data de ocorrência e prioridade.
     """
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
-        if incluir_resolvidos:
-            cursor.execute("""
-                SELECT descricao, data_ocorrencia, nivel
-                FROM avisos
-                JOIN Prioridade ON Prioridade.id_prioridade = Avisos.id_prioridade
-            """)
-        else:
-            cursor.execute("""
-                SELECT descricao, data_ocorrencia, nivel
-                FROM avisos
-                JOIN Prioridade ON Prioridade.id_prioridade = Avisos.id_prioridade
-                WHERE id_status IN (1, 2)
-            """)
-
-        dados = cursor.fetchall()
+        with conexao() as conn, conn.cursor() as cursor:
+            if incluir_resolvidos:
+                cursor.execute("""
+                    SELECT descricao, data_ocorrencia, nivel
+                    FROM avisos
+                    JOIN Prioridade ON Prioridade.id_prioridade = Avisos.id_prioridade
+                """)
+            else:
+                cursor.execute("""
+                    SELECT descricao, data_ocorrencia, nivel
+                    FROM avisos
+                    JOIN Prioridade ON Prioridade.id_prioridade = Avisos.id_prioridade
+                    WHERE id_status IN (1, 2)
+                """)
+
+            dados = cursor.fetchall()
+
         status = [
             f"Descrição: {d[0]} | Data: {d[1]} | Prioridade: {d[2]}"
             for d in dados
@@ -99,17 +72,8 @@ def verificar_avisos(incluir_resolvidos: bool = False) -> list[str]:
         return status or ["Nenhum aviso ativo encontrado."]
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         return [f"Erro ao verificar avisos: {e}"]
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
-
 
 #tool criar tarefa:
 class CriarTarefaArgs(BaseModel):
@@ -119,6 +83,8 @@ class CriarTarefaArgs(BaseModel):
     status: Optional[str] = Field(default="pendente", description="Status inicial da tarefa (ex: pendente,  andamento, concluida).")
 
 @tool("criar_tarefa", args_schema=CriarTarefaArgs)
+@medido("tool:criar_tarefa", falhou=resposta_de_erro)
+@invalida("criar_tarefa")
 def criar_tarefa(
     descricao: str,
     prioridade: str,
@@ -130,19 +96,16 @@ def criar_tarefa(
     Pode ser chamada tanto manualmente quanto de forma autônoma após a detecção de avisos.
     """
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
         id_prioridade = get_prioridade(prioridade)
         id_status = get_status(status)
         id_funcionario = get_funcionario(funcionario)
 
-        query = """
-            INSERT INTO tarefa (descricao, data_criacao, id_prioridade, id_funcionario, id_status)
-            VALUES (%s, NOW(), %s, %s, %s)
-        """
-        cursor.execute(query, (descricao, id_prioridade, id_funcionario, id_status))
-        conn.commit()
+        with transacao() as conn, conn.cursor() as cursor:
+            query = """
+                INSERT INTO tarefa (descricao, data_criacao, id_prioridade, id_funcionario, id_status)
+                VALUES (%s, NOW(), %s, %s, %s)
+            """
+            cursor.execute(query, (descricao, id_prioridade, id_funcionario, id_status))
 
         return {
             "status": "success",
@@ -156,16 +119,8 @@ def criar_tarefa(
         }
 
     except Exception as e:
-        conn.rollback()
         return {"status": "error", "message": f"Erro ao criar tarefa: {e}"}
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
-
 
 
 class AdicionarAvisosArgs(BaseModel):
@@ -174,6 +129,8 @@ class AdicionarAvisosArgs(BaseModel):
     prioridade: str = Field(..., description="Prioridade do aviso (ex: Alta, Média, Baixa).")
     status: Optional[str] = Field(default="pendente", description="Status inicial do aviso (ex: pendente,  andamento, concluida).")
 @tool("adicionar_avisos", args_schema=AdicionarAvisosArgs)
+@medido("tool:adicionar_avisos", falhou=resposta_de_erro)
+@invalida("adicionar_avisos")
 def adicionar_avisos(
     descricao: str,
     id_eta: int,
@@ -185,18 +142,15 @@ def adicionar_avisos(
     Pode ser usado quando o assistente identificar uma ocorrência relevante que precisa ser registrada.
     """
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
         id_prioridade = get_prioridade(prioridade)
         id_status = get_status(status)
 
-        query = """
-            INSERT INTO avisos (descricao, data_ocorrencia, id_eta, id_prioridade, id_status)
-            VALUES (%s, NOW(), %s, %s, %s)
-        """
-        cursor.execute(query, (descricao, id_eta, id_prioridade, id_status))
-        conn.commit()
+        with transacao() as conn, conn.cursor() as cursor:
+            query = """
+                INSERT INTO avisos (descricao, data_ocorrencia, id_eta, id_prioridade, id_status)
+                VALUES (%s, NOW(), %s, %s, %s)
+            """
+            cursor.execute(query, (descricao, id_eta, id_prioridade, id_status))
 
         return {
             "status": "success",
@@ -210,34 +164,24 @@ def adicionar_avisos(
         }
 
     except Exception as e:
-        conn.rollback()
         return {"status": "error", "message": f"Erro ao adicionar aviso: {e}"}
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
-
 
 class ListarFuncionarioArgs(BaseModel):
     tarefas: Optional[bool] = Field(default=False, description="Se verdadeiro, inclui também as tarefas de cada funcionário.")
 
 @tool("listar_funcionarios", args_schema=ListarFuncionarioArgs)
+@medido("tool:listar_funcionarios", falhou=resposta_de_erro)
+@memoizado("listar_funcionarios")
+@coalescido(_voos_leitura, "listar_funcionarios")
 def listar_funcionarios(tarefas: bool = False) -> list[str]:
     """
     Lista todos os funcionários do sistema.
     Se 'tarefas' for True, inclui também as tarefas atribuídas a cada funcionário,
     com descrição, data de criação e prioridade.
     """
-    conn = None
-    cursor = None
     retorno = []
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
         if tarefas:
             query = '''
             SELECT nome, email, descricao, data_criacao, nivel
@@ -252,8 +196,9 @@ def listar_funcionarios(tarefas: bool = False) -> list[str]:
             FROM funcionario
             ORDER BY nome
             '''
-        cursor.execute(query)
-        dados = cursor.fetchall()
+        with conexao() as conn, conn.cursor() as cursor:
+            cursor.execute(query)
+            dados = cursor.fetchall()
 
         if not dados:
             return ["Nenhum funcionário encontrado."]
@@ -266,19 +211,8 @@ def listar_funcionarios(tarefas: bool = False) -> list[str]:
         return retorno
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         return [f"Erro ao listar funcionários: {e}"]
 
-    finally:
-        try:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-        except:
-            pass
-
 class ListarTarefaArgs(BaseModel):
     desc: Optional[str] = Field(default=None, description="Palavra-chave na descrição da tarefa.")
     email: Optional[str] = Field(default=None, description="E-mail ou nome do funcionário responsável.")
@@ -287,6 +221,9 @@ class ListarTarefaArgs(BaseModel):
     nivel: Optional[str] = Field(default=None, description="Nível de prioridade da tarefa (por exemplo: ALTA, MÉDIA, BAIXA).")
 
 @tool("listar_tarefas", args_schema=ListarTarefaArgs)
+@medido("tool:listar_tarefas", falhou=resposta_de_erro)
+@memoizado("listar_tarefas")
+@coalescido(_voos_leitura, "listar_tarefas")
 def listar_tarefas(
     desc: Optional[str] = None,
     email: Optional[str] = None,
@@ -304,12 +241,7 @@ def listar_tarefas(
 
     Retorna uma lista formatada com as principais informações de cada tarefa.
     """
-    conn = None
-    cursor = None
     try:
-        conn = conectar()
-        cursor = conn.cursor()
-
         base_query = '''
         SELECT descricao, data_criacao, data_conclusao, nivel, email
         FROM tarefa t
@@ -340,8 +272,9 @@ def listar_tarefas(
 
         base_query += " ORDER BY data_criacao DESC"
 
-        cursor.execute(base_query, tuple(params))
-        dados = cursor.fetchall()
+        with conexao() as conn, conn.cursor() as cursor:
+            cursor.execute(base_query, tuple(params))
+            dados = cursor.fetchall()
 
         if not dados:
             return ["Nenhuma tarefa encontrada com os filtros aplicados."]
@@ -353,24 +286,15 @@ def listar_tarefas(
         return tarefas
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         return [f"Erro ao listar tarefas: {e}"]
 
-    finally:
-        try:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-        except:
-            pass
-
 class AtualizarTarefaArgs(BaseModel):
     desc: str = Field(..., description="Palavra-chave presente na descrição da tarefa, como 'verificar' ou 'qualidade da água'.")
     email_func: str = Field(..., description="e-mail do funcionário responsável pela tarefa.")
 
 @tool("atualizar_tarefa", args_schema=AtualizarTarefaArgs)
+@medido("tool:atualizar_tarefa", falhou=resposta_de_erro)
+@invalida("atualizar_tarefa")
 def atualizar_tarefa(desc: str, email_func: str) -> str:
     """
     Marca uma tarefa como concluída no banco de dados, com base em uma palavra-chave na descrição e no e-mail (ou nome) do funcionário.
@@ -378,41 +302,28 @@ def atualizar_tarefa(desc: str, email_func: str) -> str:
     O agente gerente deve chamar esta tool quando detectar que uma tarefa foi finalizada ou concluída,
     mesmo que a descrição mencionada seja apenas parcial.
     """
-    conn = None
-    cursor = None
     try:
-        id_funcionario=get_funcionario(email_func)
-        conn = conectar()
-        cursor = conn.cursor()
-        query = '''
-        UPDATE tarefa
-        SET data_conclusao = NOW()
-        WHERE descricao LIKE %s
-        AND id_funcionario = %s
-        AND data_conclusao IS NULL
-        '''
-        params = [f'%{desc}%',id_funcionario]
-        cursor.execute(query, params)
-        conn.commit()
+        id_funcionario = get_funcionario(email_func)
+        with transacao() as conn, conn.cursor() as cursor:
+            query = '''
+            UPDATE tarefa
+            SET data_conclusao = NOW()
+            WHERE descricao LIKE %s
+            AND id_funcionario = %s
+            AND data_conclusao IS NULL
+            '''
+            params = [f'%{desc}%',id_funcionario]
+            cursor.execute(query, params)
+            atualizadas = cursor.rowcount
 
-        if cursor.rowcount > 0:
+        if atualizadas > 0:
             return f"Tarefa contendo '{desc}' atribuída a '{email_func}' foi marcada como concluída."
         else:
             return f"Nenhuma tarefa ativa encontrada com descrição semelhante a '{desc}' para '{email_func}'."
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         return f"Erro ao atualizar tarefa: {e}"
 
-    finally:
-        try:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-        except:
-            pass
 TOOLS = [
     verificar_avisos,
     criar_tarefa,
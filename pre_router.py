@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from collections import deque
+
+import numpy as np
+from embedding_cache import normalizar_texto
+from prompts import shots_roteador
+
+PRE_ROUTER_ENABLED = os.getenv("PRE_ROUTER_ENABLED", "true").lower() not in ("0", "false", "no")
+PRE_ROUTER_THRESHOLD = float(os.getenv("PRE_ROUTER_THRESHOLD", "0.88"))
+PRE_ROUTER_MARGIN = float(os.getenv("PRE_ROUTER_MARGIN", "0.04"))
+PRE_ROUTER_SHADOW_RATE = float(os.getenv("PRE_ROUTER_SHADOW_RATE", "0.05"))
+PRE_ROUTER_MAX_TRAFEGO = int(os.getenv("PRE_ROUTER_MAX_TRAFEGO", "2000"))
+PRE_ROUTER_EXEMPLOS = os.getenv("PRE_ROUTER_EXEMPLOS")  # JSONL opcional: {"texto": ..., "rota": ...}
+# Mensagens curtas ("sim", "pode criar") só têm rota com o contexto da conversa
+PRE_ROUTER_MIN_PALAVRAS = int(os.getenv("PRE_ROUTER_MIN_PALAVRAS", "4"))
+
+# Verbos das tools do gerente + objetos que elas manipulam
+_VERBOS_GERENTE = r"(cri\w*|adicion\w*|registr\w*|cadastr\w*|list\w*|mostr\w*|exib\w*|ver|veja|verific\w*|consult\w*|atualiz\w*|conclu\w*|finaliz\w*|atribu\w*|marc\w*)"
+_OBJETOS_GERENTE = r"(tarefas?|avisos?|alertas?|funcion[aá]rios?|reuni[aãõo]+e?s?)"
+REGRA_GERENTE = re.compile(rf"\b{_VERBOS_GERENTE}\b.*\b{_OBJETOS_GERENTE}\b", re.IGNORECASE)
+# A regra vale só para pedidos: "Como verificar os alertas de turbidez?" é pergunta de procedimento (rag)
+PERGUNTA_ABERTA = re.compile(r"^\W*(como|qual|quais|o que|oq|por ?que|porqu[eê]|quando|onde|quem|para que)\b", re.IGNORECASE)
+VERBOS_PEDIDO = re.compile(r"\b(pode|podes|poderia|consegue|conseguiria|quero|queria|preciso|gostaria|favor)\b", re.IGNORECASE)
+# Mensagens com fatos pessoais precisam do roteador (decide importância e memória)
+SINAIS_MEMORIA = re.compile(
+    r"\b(lembr\w*|guard\w*|anot\w*|memoriz\w*|meu nome|minha|meu|eu sou|eu trabalho|mudei|prefiro|gosto)\b",
+    re.IGNORECASE,
+)
+
+
+def eh_pedido(mensagem) -> bool:
+    """Imperativo ou pedido ("crie...", "pode listar...?"), e não uma pergunta sobre como fazer."""
+    if PERGUNTA_ABERTA.match(mensagem):
+        return False
+    return not mensagem.rstrip().endswith("?") or bool(VERBOS_PEDIDO.search(mensagem))
+
+
+def extrair_rota(resposta):
+    """Interpreta a linha ROUTE= do roteador; None quando não há rota."""
+    if "ROUTE=" not in resposta:
+        return None
+    route = str(resposta).split("ROUTE=")[1].split("\n")[0]
+    if "," in route:
+        if "rag" in route:
+            return "m,r"
+        elif "gerente" in route:
+            return "m,g"
+        return None
+    if "rag" in route:
+        return "r"
+    elif "gerente" in route:
+        return "g"
+    return "m"
+
+
+def saida_sintetica(rota, mensagem):
+    """Saída no mesmo formato do roteador LLM, para o restante do fluxo."""
+    nomes = {"r": "rag", "g": "gerente", "m": "memoria", "m,r": "rag,memoria", "m,g": "gerente,memoria"}
+    return f"ROUTE={nomes[rota]}\nPERGUNTA_ORIGINAL={mensagem}\nPERSONA=\nCLARIFY="
+
+
+def _exemplos_prompts():
+    exemplos = []
+    for shot in shots_roteador:
+        rota = extrair_rota(shot["ai"])
+        # fora_escopo cai em "m" no parser; não serve como exemplo de memória
+        if rota is None or "fora_escopo" in shot["ai"]:
+            continue
+        exemplos.append((shot["human"], rota))
+    return exemplos
+
+
+def _exemplos_arquivo(caminho):
+    exemplos = []
+    with open(caminho, encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            if linha.strip():
+                item = json.loads(linha)
+                exemplos.append((item["texto"], item["rota"]))
+    return exemplos
+
+
+class PreRouter:
+    """
+    Classificador local na frente do roteador LLM.
+    1. Regras de palavras-chave para os verbos das tools do gerente -> "g".
+    2. Vizinho mais próximo (cosseno) contra exemplos rotulados: shots_roteador,
+       um arquivo opcional e o tráfego já roteado pelo LLM.
+    Só decide com confiança alta (similaridade e margem sobre a segunda rota);
+    caso contrário devolve None e o roteador LLM é usado. Uma amostra das decisões
+    locais é conferida em segundo plano pelo LLM para medir divergências.
+    """
+
+    def __init__(self, gerar_embeddings):
+        self._gerar_embeddings = gerar_embeddings
+        self._base = None
+        self._trafego = deque(maxlen=PRE_ROUTER_MAX_TRAFEGO)
+        self._lock = threading.Lock()
+        self.total = 0
+        self.por_regra = 0
+        self.por_vizinho = 0
+        self.fallback = 0
+        self.conferidas = 0
+        self.divergencias = 0
+        self.trafego_aprendido = 0
+        self.trafego_ignorado = 0
+        self.ultimas_divergencias = deque(maxlen=50)
+        self._tarefas = set()
+
+    def _carregar_base(self):
+        exemplos = _exemplos_prompts()
+        if PRE_ROUTER_EXEMPLOS:
+            exemplos += _exemplos_arquivo(PRE_ROUTER_EXEMPLOS)
+        textos = [t for t, _ in exemplos]
+        vetores = self._gerar_embeddings(textos)
+        return np.vstack(vetores).astype(np.float32), [r for _, r in exemplos]
+
+    def _exemplos(self):
+        if self._base is None:
+            with self._lock:
+                if self._base is None:
+                    self._base = self._carregar_base()
+        matriz, rotas = self._base
+        if self._trafego:
+            trafego = list(self._trafego)
+            matriz = np.vstack([matriz] + [v for v, _ in trafego])
+            rotas = rotas + [r for _, r in trafego]
+        return matriz, rotas
+
+    def _vizinho(self, vetor):
+        matriz, rotas = self._exemplos()
+        scores = matriz @ np.asarray(vetor, dtype=np.float32)
+        melhores = {}
+        for score, rota in zip(scores, rotas):
+            if score > melhores.get(rota, -1.0):
+                melhores[rota] = float(score)
+        ordenadas = sorted(melhores.items(), key=lambda x: x[1], reverse=True)
+        rota, melhor = ordenadas[0]
+        segunda = ordenadas[1][1] if len(ordenadas) > 1 else -1.0
+        if melhor >= PRE_ROUTER_THRESHOLD and melhor - segunda >= PRE_ROUTER_MARGIN:
+            return rota
+        return None
+
+    def classificar(self, mensagem, vetor):
+        """Retorna a rota decidida localmente ou None (usar o roteador LLM)."""
+        self.total += 1
+        if not PRE_ROUTER_ENABLED:
+            self.fallback += 1
+            return None
+
+        tem_memoria = bool(SINAIS_MEMORIA.search(mensagem))
+        if not tem_memoria and eh_pedido(mensagem) and REGRA_GERENTE.search(mensagem):
+            self.por_regra += 1
+            return "g"
+
+        rota = None if tem_memoria else self._vizinho(vetor)
+        if rota is None:
+            self.fallback += 1
+        else:
+            self.por_vizinho += 1
+        return rota
+
+    def registrar_trafego(self, mensagem, vetor, rota, pergunta=None):
+        """
+        Guarda uma decisão do roteador LLM como novo exemplo rotulado, se ela depende só
+        da mensagem: mensagens curtas, com fatos pessoais ou que o roteador reescreveu com
+        o contexto da conversa (PERGUNTA_ORIGINAL diferente da mensagem) ficam de fora.
+        """
+        if rota is None:
+            return
+        contextual = pergunta is not None and normalizar_texto(pergunta) != normalizar_texto(mensagem)
+        if len(mensagem.split()) < PRE_ROUTER_MIN_PALAVRAS or contextual or SINAIS_MEMORIA.search(mensagem):
+            self.trafego_ignorado += 1
+            return
+        self.trafego_aprendido += 1
+        self._trafego.append((np.asarray(vetor, dtype=np.float32).reshape(1, -1), rota))
+
+    def talvez_conferir(self, mensagem, rota_local, conferir):
+        """
+        Com probabilidade PRE_ROUTER_SHADOW_RATE, agenda conferir() (corrotina que retorna
+        a rota do LLM) em segundo plano e contabiliza divergências.
+        """
+        if random.random() >= PRE_ROUTER_SHADOW_RATE:
+            return
+
+        async def comparar():
+            try:
+                rota_llm = await conferir()
+            except Exception:
+                return
+            self.conferidas += 1
+            if rota_llm != rota_local:
+                self.divergencias += 1
+                self.ultimas_divergencias.append({"mensagem": mensagem, "local": rota_local, "llm": rota_llm})
+
+        tarefa = asyncio.ensure_future(comparar())
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    def stats(self) -> dict:
+        rapidas = self.por_regra + self.por_vizinho
+        return {
+            "total": self.total,
+            "fast_path": rapidas,
+            "fast_path_rule": self.por_regra,
+            "fast_path_neighbour": self.por_vizinho,
+            "fallback": self.fallback,
+            "hit_rate": rapidas / self.total if self.total else 0.0,
+            "shadow_checked": self.conferidas,
+            "disagreements": self.divergencias,
+            "disagreement_rate": self.divergencias / self.conferidas if self.conferidas else 0.0,
+            "recent_disagreements": list(self.ultimas_divergencias),
+            "traffic_learned": self.trafego_aprendido,
+            "traffic_skipped": self.trafego_ignorado,
+        }
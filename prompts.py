@@ -6,10 +6,6 @@ from langchain_core.prompts import (
     AIMessagePromptTemplate,
     FewShotChatMessagePromptTemplate
 )
-from datetime import datetime
-from zoneinfo import ZoneInfo
-TZ=ZoneInfo('America/Sao_Paulo')
-today=datetime.now(TZ).date()
 
 
 #Prompt Juiz
@@ -343,6 +339,7 @@ Seu papel é **detectar informações relevantes** na conversa e **agir automati
 5. **Sem duplicação**: nunca armazene a mesma memória duas vezes.  
 6. **Sem conversa**: não cumprimente, não explique, não pergunte nada. 
 7. CHAME APENAS UMA TOOL POR VEZ, NÃO INSIRA A MESMA MEMÓRIA MAIS DE 1 VEZ 
+8. Se a mensagem trouxer mais de um fato novo, use `registrar_memorias` UMA vez com todos eles.
 
 ---
 
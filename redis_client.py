@@ -0,0 +1,61 @@
+import os
+import threading
+
+import redis
+
+import tracing
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_SSL = os.getenv("REDIS_SSL", "true").lower() not in ("0", "false", "no")
+
+_cliente = None
+_lock = threading.Lock()
+
+
+def _criar_cliente():
+    pool = redis.BlockingConnectionPool(
+        connection_class=redis.SSLConnection if REDIS_SSL else redis.Connection,
+        host=os.getenv('host_redis'),
+        port=os.getenv('port_redis'),
+        password=os.getenv('password'),
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_keepalive=True,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def connect_redis():
+    """
+    Retorna o cliente Redis do processo. As conexões (TLS) ficam no pool e são
+    reutilizadas, então cada operação custa apenas um round trip.
+    """
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                _cliente = _criar_cliente()
+    return tracing.envolver_redis(_cliente)
+
+
+def definir_cliente(cliente):
+    """Substitui o cliente do processo (ex: fakeredis em benchmarks)."""
+    global _cliente
+    with _lock:
+        _cliente = cliente
+
+
+def stats() -> dict:
+    if _cliente is None:
+        return {"max": REDIS_MAX_CONNECTIONS, "in_use": 0, "idle": 0}
+    pool = _cliente.connection_pool
+    return {
+        "max": REDIS_MAX_CONNECTIONS,
+        "in_use": len(getattr(pool, "_in_use_connections", ())),
+        "idle": len(getattr(pool, "_available_connections", ())),
+    }
@@ -1,39 +1,9 @@
-import redis
-import json
-from datetime import datetime, timezone
-import os
-import psycopg2
 from langchain.tools import tool
 from pydantic import BaseModel, Field
 from typing import Any
-from datetime import datetime, timezone
 import json
-from dotenv import load_dotenv
-load_dotenv()
-
-host = os.getenv('host')
-porta = os.getenv('porta')
-database = os.getenv('database')
-senha = os.getenv('senha')
-user = os.getenv('user')
-def conectar():
-    conn=psycopg2.connect(
-        dbname=database,
-        user=user,
-        password=senha,
-        host=host,
-        port=porta
-        )
-    return conn
-
-def connect_redis():
-    r = redis.Redis(
-        host=os.getenv('host_redis'),
-        port=os.getenv('port_redis'),
-        password=os.getenv('password'),
-        ssl=True
-    )
-    return r
+from memory_store import memory_store
+from metrics import medido, resposta_de_erro
 
 
 class RegistrarMemoriaArgs(BaseModel):
@@ -41,43 +11,54 @@ class RegistrarMemoriaArgs(BaseModel):
     content: Any = Field(..., description="Conteúdo ou dado que será armazenado na memória da sessão.")
 
 @tool("registrar_memoria", args_schema=RegistrarMemoriaArgs)
+@medido("tool:registrar_memoria", falhou=resposta_de_erro)
 def registrar_memoria(session_id: str, content: Any) -> str:
     """
     Registra uma entrada de memória associada a uma sessão específica no Redis.
     Cada memória inclui um timestamp UTC e o conteúdo fornecido.
     Retorna uma mensagem indicando sucesso ou falha.
     """
-    key = f"memorys:{session_id}"
-    timestamp = datetime.now(timezone.utc).isoformat()
-
-    memory_entry = {
-        "timestamp": timestamp,
-        "data": content
-    }
-
     try:
-        r = connect_redis()
-        r.rpush(key, json.dumps(memory_entry))
+        if memory_store.gravar(session_id, [content]) == 0:
+            return f"Memória já registrada na sessão '{session_id}'."
         return f"Memória registrada com sucesso na sessão '{session_id}'."
     except Exception as e:
         return f"Erro ao registrar memória: {e}"
 
+class RegistrarMemoriasArgs(BaseModel):
+    session_id: str = Field(..., description="Identificador único da sessão do usuário.")
+    contents: list[Any] = Field(..., description="Lista de memórias a serem armazenadas de uma só vez.")
+
+@tool("registrar_memorias", args_schema=RegistrarMemoriasArgs)
+@medido("tool:registrar_memorias", falhou=resposta_de_erro)
+def registrar_memorias(session_id: str, contents: list[Any]) -> str:
+    """
+    Registra várias memórias de uma vez na sessão especificada.
+    Use quando a mesma mensagem trouxer mais de um fato a ser lembrado.
+    """
+    if not contents:
+        return "Nenhuma memória informada."
+    try:
+        total = memory_store.gravar(session_id, contents)
+        return f"{total} memórias registradas com sucesso na sessão '{session_id}' ({len(contents) - total} já existiam)."
+    except Exception as e:
+        return f"Erro ao registrar memórias: {e}"
+
 class PopLastMemoryArgs(BaseModel):
     session_id: str = Field(..., description="Identificador único da sessão de onde a última memória será removida.")
 
 @tool("pop_last_memory", args_schema=PopLastMemoryArgs)
+@medido("tool:pop_last_memory", falhou=resposta_de_erro)
 def pop_last_memory(session_id: str) -> str:
     """
     Remove e retorna a última memória registrada na sessão especificada.
     Se não houver memórias armazenadas, retorna uma mensagem informando isso.
     """
-    key = f"memorys:{session_id}"
     try:
-        r = connect_redis()
-        last = r.rpop(key)
+        last = memory_store.remover_ultima(session_id)
 
         if last:
-            return f"Última memória removida com sucesso: {last.decode('utf-8')}"
+            return f"Última memória removida com sucesso: {json.dumps(last, ensure_ascii=False)}"
         else:
             return "Nenhuma memória encontrada para esta sessão."
 
@@ -86,5 +67,6 @@ def pop_last_memory(session_id: str) -> str:
 
 REDIS_TOOLS=[
     registrar_memoria,
+    registrar_memorias,
     pop_last_memory
 ]
\ No newline at end of file
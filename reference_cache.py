@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+import unicodedata
+
+from db_pool import conexao
+
+REF_CACHE_TTL = float(os.getenv("REF_CACHE_TTL", "300"))
+REF_CACHE_MISS_INTERVAL = float(os.getenv("REF_CACHE_MISS_INTERVAL", "5"))
+
+CONSULTAS = {
+    "prioridade": "SELECT id_prioridade, nivel FROM prioridade",
+    "status": "SELECT id_status, status FROM status",
+    "funcionario": "SELECT id_funcionario, email, nome FROM funcionario",
+}
+
+
+def normalizar_nome(texto) -> str:
+    """Remove acentos, caixa e espaços extras: 'Média ' -> 'media'."""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+class ReferenceCache:
+    """
+    Cópia em memória das tabelas pequenas de referência (prioridade, status, funcionario),
+    indexadas pelo nome normalizado. Recarrega pelo TTL ou quando um nome não é
+    encontrado (no máximo uma vez a cada REF_CACHE_MISS_INTERVAL segundos).
+    """
+
+    def __init__(self, ttl=REF_CACHE_TTL, intervalo_miss=REF_CACHE_MISS_INTERVAL):
+        self.ttl = ttl
+        self.intervalo_miss = intervalo_miss
+        self._tabelas = {nome: {} for nome in CONSULTAS}
+        self._carregado_em = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recargas = 0
+
+    def carregar(self):
+        tabelas = {nome: {} for nome in CONSULTAS}
+        with conexao() as conn, conn.cursor() as cursor:
+            for nome, query in CONSULTAS.items():
+                cursor.execute(query)
+                for id_, *nomes in cursor.fetchall():
+                    for valor in nomes:
+                        if valor is None:
+                            continue
+                        chave = normalizar_nome(valor)
+                        # Nomes repetidos (ex: dois funcionários homônimos) não são resolvidos
+                        if tabelas[nome].get(chave, id_) != id_:
+                            tabelas[nome][chave] = None
+                        else:
+                            tabelas[nome][chave] = id_
+
+        with self._lock:
+            self._tabelas = tabelas
+            self._carregado_em = time.monotonic()
+            self.recargas += 1
+
+    def _expirado(self) -> bool:
+        return self._carregado_em is None or time.monotonic() - self._carregado_em > self.ttl
+
+    def buscar(self, tabela: str, valor):
+        """Retorna o id correspondente ao nome, ou None se não existir."""
+        if self._expirado():
+            self.carregar()
+
+        chave = normalizar_nome(valor)
+        id_ = self._tabelas[tabela].get(chave)
+        if id_ is None and time.monotonic() - self._carregado_em > self.intervalo_miss:
+            self.carregar()
+            id_ = self._tabelas[tabela].get(chave)
+
+        if id_ is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return id_
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.recargas,
+            "rows": {nome: len(valores) for nome, valores in self._tabelas.items()},
+        }
+
+
+reference_cache = ReferenceCache()
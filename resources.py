@@ -0,0 +1,138 @@
+"""
+Clientes dos serviços externos (genai, MongoDB Atlas, Redis e PostgreSQL).
+
+Nenhum deles é criado na importação: cada cliente nasce no primeiro uso ou no
+aquecimento do lifespan do FastAPI. Assim o main é importável sem rede (testes,
+benchmarks) e cada worker do uvicorn sobe mais rápido.
+"""
+import asyncio
+import importlib
+import os
+import threading
+import time
+
+
+import db_pool
+import redis_client
+from async_utils import run_sync
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB = os.getenv("MONGO_DB", "interVireya")
+# Recursos criados (e testados) no start do worker; vazio desliga o aquecimento
+RESOURCES_WARMUP = [n.strip() for n in os.getenv("RESOURCES_WARMUP", "genai,mongo,redis,postgres,llm").split(",") if n.strip()]
+
+
+class Recurso:
+    """Cliente criado uma única vez, no primeiro obter(); seguro entre threads."""
+
+    def __init__(self, nome, fabrica, verificar=None):
+        self.nome = nome
+        self._fabrica = fabrica
+        self._verificar = verificar
+        self._valor = None
+        self._injetado = False
+        self._lock = threading.Lock()
+        self.tempo_criacao = 0.0
+
+    @property
+    def criado(self) -> bool:
+        return self._valor is not None
+
+    def obter(self):
+        if self._valor is None:
+            with self._lock:
+                if self._valor is None:
+                    inicio = time.perf_counter()
+                    self._valor = self._fabrica()
+                    self.tempo_criacao = time.perf_counter() - inicio
+        return self._valor
+
+    async def aobter(self):
+        """obter() sem travar o event loop enquanto o cliente é criado."""
+        if self._valor is not None:
+            return self._valor
+        return await run_sync(self.obter)
+
+    def definir(self, valor):
+        """Substitui o cliente (ex: substitutos locais em benchmarks)."""
+        with self._lock:
+            self._valor = valor
+            self._injetado = valor is not None
+
+    def aquecer(self):
+        """Cria o cliente e, se houver verificação, faz um round trip com o serviço."""
+        valor = self.obter()
+        if self._verificar is not None and not self._injetado:
+            self._verificar(valor)
+
+
+def _criar_genai():
+    from google import genai  # import pesado (~1s); só acontece quando o cliente é usado
+    return genai.Client(api_key=os.getenv('api_key'))
+
+
+def _criar_mongo():
+    # Verificado só na criação: sem MONGO_URI o main continua importável (benchmarks, testes)
+    if not MONGO_URI:
+        raise ValueError("⚠️ ERRO: variável de ambiente MONGO_URI não encontrada!")
+    from pymongo.mongo_client import MongoClient
+    return MongoClient(MONGO_URI)[MONGO_DB]
+
+
+genai = Recurso("genai", _criar_genai)
+mongo = Recurso("mongo", _criar_mongo, verificar=lambda db: db.client.admin.command("ping"))
+
+
+def _aquecer_redis():
+    redis_client.connect_redis().ping()
+
+
+def _aquecer_postgres():
+    with db_pool.conexao() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+def _aquecer_llm():
+    # chains.create_llm importa o SDK do chat model só na primeira chain
+    importlib.import_module("langchain_google_genai")
+
+
+AQUECIMENTO = {
+    "genai": genai.aquecer,
+    "mongo": mongo.aquecer,
+    "redis": _aquecer_redis,
+    "postgres": _aquecer_postgres,
+    "llm": _aquecer_llm,
+}
+
+_tempos_aquecimento = {}
+
+
+async def aquecer(nomes=None) -> dict:
+    """
+    Cria os clientes em paralelo no pool de threads. Falhas são apenas reportadas:
+    o recurso volta a ser tentado no primeiro uso. Retorna {nome: segundos}.
+    """
+    nomes = RESOURCES_WARMUP if nomes is None else nomes
+
+    async def um(nome):
+        inicio = time.perf_counter()
+        try:
+            await run_sync(AQUECIMENTO[nome])
+        except Exception as e:
+            print(f"⚠️ Recurso '{nome}' não aquecido na inicialização: {e}")
+        _tempos_aquecimento[nome] = time.perf_counter() - inicio
+
+    await asyncio.gather(*(um(nome) for nome in nomes if nome in AQUECIMENTO))
+    return dict(_tempos_aquecimento)
+
+
+def stats() -> dict:
+    return {
+        "genai_created": genai.criado,
+        "mongo_created": mongo.criado,
+        "genai_creation_seconds": genai.tempo_criacao,
+        "mongo_creation_seconds": mongo.tempo_criacao,
+        "warmup_seconds": dict(_tempos_aquecimento),
+    }
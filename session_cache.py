@@ -0,0 +1,135 @@
+import os
+import threading
+
+from cache import TTLCache
+from redis_client import connect_redis
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+
+
+def chave_versao(session_id):
+    return f"memver:{session_id}"
+
+
+def _versoes(session_ids) -> list:
+    valores = connect_redis().mget([chave_versao(s) for s in session_ids])
+    return [int(v or 0) for v in valores]
+
+
+class SessionCache:
+    """
+    Contexto de sessão por usuário: email -> id_funcionario e id -> memórias já decodificadas.
+    Cada lista em cache guarda a versão da sessão no Redis (memver:{session_id}, INCR na
+    mesma transação de cada escrita do memory_store); um acerto custa um GET da versão
+    em vez de LRANGE + decodificação, e uma escrita feita por outro worker é percebida
+    na leitura seguinte. O worker que escreve também atualiza a própria lista (write-through).
+    """
+
+    def __init__(self, maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL):
+        self._ids = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._memorias = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.versao_desatualizada = 0
+
+    def get_session_id(self, email, carregar):
+        session_id = self._ids.get(email)
+        if session_id is None:
+            session_id = carregar(email)
+            self._ids.set(email, session_id)
+        return session_id
+
+    def get_session_ids(self, emails, carregar_varios) -> dict:
+        """Versão em lote: `carregar_varios(emails)` recebe só os emails fora do cache
+        e retorna {email: session_id} (emails desconhecidos ficam de fora)."""
+        encontrados = {}
+        faltantes = []
+        for email in dict.fromkeys(emails):
+            session_id = self._ids.get(email)
+            if session_id is None:
+                faltantes.append(email)
+            else:
+                encontrados[email] = session_id
+        if faltantes:
+            for email, session_id in carregar_varios(faltantes).items():
+                self._ids.set(email, session_id)
+                encontrados[email] = session_id
+        return encontrados
+
+    def _guardar(self, session_id, versao, memorias):
+        # Uma leitura lenta não sobrescreve uma versão mais nova já em cache
+        with self._lock:
+            atual = self._memorias.peek(str(session_id))
+            if atual is None or atual[0] <= versao:
+                self._memorias.set(str(session_id), (versao, tuple(memorias)))
+
+    def _validas(self, session_ids) -> dict:
+        """Memórias em cache cuja versão ainda é a do Redis (um MGET para todas)."""
+        em_cache = {s: self._memorias.get(str(s)) for s in session_ids}
+        em_cache = {s: c for s, c in em_cache.items() if c is not None}
+        if not em_cache:
+            return {}
+        validas = {}
+        for (session_id, (versao, memorias)), atual in zip(em_cache.items(), _versoes(list(em_cache))):
+            if versao == atual:
+                validas[session_id] = list(memorias)
+            else:
+                self.versao_desatualizada += 1
+        return validas
+
+    def get_memorias(self, session_id, carregar):
+        """`carregar(session_id)` retorna (versão, memórias) lidas juntas do Redis."""
+        validas = self._validas([session_id])
+        if session_id in validas:
+            return validas[session_id]
+        versao, memorias = carregar(session_id)
+        self._guardar(session_id, versao, memorias)
+        return memorias
+
+    def get_memorias_varias(self, session_ids, carregar_varias) -> dict:
+        """Versão em lote de get_memorias: `carregar_varias(ids)` lê só as sessões fora do
+        cache ou desatualizadas e retorna {session_id: (versão, memórias)}."""
+        session_ids = list(dict.fromkeys(session_ids))
+        resultado = self._validas(session_ids)
+        faltantes = [s for s in session_ids if s not in resultado]
+        if faltantes:
+            for session_id, (versao, memorias) in carregar_varias(faltantes).items():
+                self._guardar(session_id, versao, memorias)
+                resultado[session_id] = memorias
+        return resultado
+
+    def _alterar(self, session_id, versao, funcao):
+        """Aplica `funcao` à lista em cache se ela estava na versão anterior à escrita `versao`."""
+        chave = str(session_id)
+        with self._lock:
+            atual = self._memorias.peek(chave)
+            if atual is None:
+                return
+            if atual[0] == versao - 1:
+                self._memorias.set(chave, (versao, tuple(funcao(list(atual[1])))))
+            else:
+                self._memorias.pop(chave)
+
+    def anexar_memorias(self, session_id, versao, entradas, limite=0):
+        """Anexa à lista em cache; `limite` > 0 descarta as mais antigas, como o LTRIM do Redis."""
+        def anexar(atual):
+            novas = atual + list(entradas)
+            return novas[-limite:] if limite > 0 else novas
+        self._alterar(session_id, versao, anexar)
+
+    def remover_ultima(self, session_id, versao):
+        self._alterar(session_id, versao, lambda atual: atual[:-1])
+
+    def invalidar(self, session_id):
+        with self._lock:
+            self._memorias.pop(str(session_id))
+
+    def stats(self) -> dict:
+        return {
+            "session_ids": self._ids.stats(),
+            "memories": self._memorias.stats(),
+            "stale_versions": self.versao_desatualizada,
+        }
+
+
+session_cache = SessionCache()
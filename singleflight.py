@@ -0,0 +1,184 @@
+"""
+Coalescência de chamadas idênticas concorrentes ("single flight").
+
+Chamadas simultâneas com a mesma chave compartilham uma única execução: a primeira
+(líder) executa e as demais (seguidoras) recebem o mesmo resultado ou a mesma exceção.
+Nada é guardado depois que a execução termina; isso é papel dos caches.
+
+Só deve envolver etapas idempotentes e sem efeitos colaterais (embeddings, busca
+vetorial, RAG, juiz, tools de leitura). Curadoria e tools de escrita nunca.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() not in ("0", "false", "no")
+
+_grupos = {}
+
+
+def chave_canonica(*partes) -> str:
+    """Chave estável para partes serializáveis em JSON (dicts com chaves ordenadas)."""
+    texto = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def argumentos_canonicos(func, args, kwargs) -> dict:
+    """Argumentos nomeados com os defaults aplicados: f(1) e f(x=1) geram a mesma chave."""
+    try:
+        ligados = inspect.signature(func).bind(*args, **kwargs)
+    except TypeError:
+        return {"args": list(args), "kwargs": kwargs}
+    ligados.apply_defaults()
+    return dict(ligados.arguments)
+
+
+class _Voo:
+    __slots__ = ("tarefa", "evento", "valor", "erro", "esperando")
+
+    def __init__(self):
+        self.tarefa = None
+        self.evento = None
+        self.valor = None
+        self.erro = None
+        self.esperando = 0
+
+
+class SingleFlight:
+    """Grupo de chamadas coalescidas; as chaves de grupos diferentes não se misturam."""
+
+    def __init__(self, nome, habilitado=SINGLEFLIGHT_ENABLED):
+        self.nome = nome
+        self.habilitado = habilitado
+        self._voos_async = {}
+        self._voos_sync = {}
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.execucoes = 0
+        self.coalescidas = 0
+        _grupos[nome] = self
+
+    def _contar(self, lider):
+        with self._lock:
+            self.chamadas += 1
+            if lider:
+                self.execucoes += 1
+            else:
+                self.coalescidas += 1
+
+    async def executar(self, chave, fabrica, ao_seguir=None):
+        """
+        Executa `fabrica()` (que retorna uma corrotina) uma vez por chave em voo.
+        `ao_seguir(valor)` é chamado só nas seguidoras (ex: gravar o próprio histórico).
+        A execução roda em uma task própria: se quem a iniciou for cancelado, ela
+        continua para as seguidoras e só é cancelada quando ninguém mais espera.
+        """
+        if not self.habilitado:
+            self._contar(True)
+            return await fabrica()
+
+        voo = self._voos_async.get(chave)
+        lider = voo is None
+        if lider:
+            voo = _Voo()
+            voo.tarefa = asyncio.ensure_future(fabrica())
+            self._voos_async[chave] = voo
+            voo.tarefa.add_done_callback(functools.partial(self._fim_async, chave, voo))
+        self._contar(lider)
+
+        voo.esperando += 1
+        try:
+            valor = await asyncio.shield(voo.tarefa)
+        except asyncio.CancelledError:
+            if not voo.tarefa.done() and voo.esperando == 1:
+                voo.tarefa.cancel()
+            raise
+        finally:
+            voo.esperando -= 1
+        if not lider and ao_seguir is not None:
+            ao_seguir(valor)
+        return valor
+
+    def _fim_async(self, chave, voo, tarefa):
+        if self._voos_async.get(chave) is voo:
+            del self._voos_async[chave]
+        if not tarefa.cancelled():
+            tarefa.exception()  # evita o aviso de exceção não lida quando ninguém mais espera
+
+    def executar_sync(self, chave, func, *args, **kwargs):
+        """Versão para threads: as seguidoras bloqueiam até o líder terminar."""
+        if not self.habilitado:
+            self._contar(True)
+            return func(*args, **kwargs)
+
+        with self._lock:
+            voo = self._voos_sync.get(chave)
+            lider = voo is None
+            if lider:
+                voo = _Voo()
+                voo.evento = threading.Event()
+                self._voos_sync[chave] = voo
+        self._contar(lider)
+
+        if not lider:
+            voo.evento.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.valor
+
+        try:
+            voo.valor = func(*args, **kwargs)
+            return voo.valor
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._voos_sync[chave]
+            voo.evento.set()
+
+    def em_voo(self) -> int:
+        return len(self._voos_async) + len(self._voos_sync)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.habilitado,
+            "calls": self.chamadas,
+            "executions": self.execucoes,
+            "coalesced": self.coalescidas,
+            "coalescing_ratio": self.coalescidas / self.chamadas if self.chamadas else 0.0,
+            "in_flight": self.em_voo(),
+        }
+
+
+def coalescido(grupo: SingleFlight, nome=None):
+    """
+    Decorador para funções síncronas ou assíncronas cujo resultado depende só dos
+    argumentos: chamadas concorrentes com os mesmos argumentos são coalescidas.
+    """
+    def decorador(func):
+        prefixo = nome or func.__name__
+
+        def chave(args, kwargs):
+            return chave_canonica(prefixo, argumentos_canonicos(func, args, kwargs))
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def envoltorio(*args, **kwargs):
+                return await grupo.executar(chave(args, kwargs), lambda: func(*args, **kwargs))
+        else:
+            @functools.wraps(func)
+            def envoltorio(*args, **kwargs):
+                return grupo.executar_sync(chave(args, kwargs), func, *args, **kwargs)
+        return envoltorio
+    return decorador
+
+
+def stats() -> dict:
+    """stats() de todos os grupos, por nome."""
+    return {nome: grupo.stats() for nome, grupo in _grupos.items()}
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture
+def redis_falso():
+    """fakeredis no lugar do Redis compartilhado (redis_client.connect_redis)."""
+    import fakeredis
+    import redis_client
+
+    cliente = fakeredis.FakeRedis()
+    redis_client.definir_cliente(cliente)
+    yield cliente
+    redis_client.definir_cliente(None)
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from admission import ControleAdmissao, Rejeitada
+
+
+def rodar(corrotina):
+    return asyncio.run(corrotina)
+
+
+def test_admite_ate_o_limite_e_despacha_a_fila_ao_liberar():
+    async def cenario():
+        controle = ControleAdmissao(limite_global=2, limite_por_chave=0, tamanho_fila=4, espera_max=1)
+        a = await controle.entrar("k")
+        b = await controle.entrar("k")
+        espera = asyncio.ensure_future(controle.entrar("k"))
+        await asyncio.sleep(0.01)
+        assert not espera.done() and controle.stats()["queue_depth"] == 1
+
+        a.liberar()
+        c = await espera
+        assert c.espera > 0
+        assert controle.em_execucao == 2 and controle.stats()["queue_depth"] == 0
+        b.liberar()
+        c.liberar()
+        c.liberar()  # idempotente
+        return controle
+
+    controle = rodar(cenario())
+    assert controle.em_execucao == 0
+    assert controle.admitidas == 3
+
+
+def test_fila_cheia_rejeita_com_retry_after():
+    async def cenario():
+        controle = ControleAdmissao(limite_global=1, limite_por_chave=0, tamanho_fila=1, espera_max=1)
+        vaga = await controle.entrar("k")
+        espera = asyncio.ensure_future(controle.entrar("k"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Rejeitada) as erro:
+            await controle.entrar("k")
+        vaga.liberar()
+        (await espera).liberar()
+        return controle, erro.value
+
+    controle, erro = rodar(cenario())
+    assert 1 <= erro.retry_after <= 60
+    assert controle.rejeitadas_fila == 1
+    assert controle.em_execucao == 0
+
+
+def test_prazo_esgotado_rejeita_e_sai_da_fila():
+    async def cenario():
+        controle = ControleAdmissao(limite_global=1, limite_por_chave=0, tamanho_fila=4, espera_max=0.05)
+        vaga = await controle.entrar("k")
+        with pytest.raises(Rejeitada):
+            await controle.entrar("k")
+        assert controle.stats()["queue_depth"] == 0
+        vaga.liberar()
+        return controle
+
+    controle = rodar(cenario())
+    assert controle.rejeitadas_prazo == 1
+    assert controle.em_execucao == 0
+
+
+def test_chave_no_limite_nao_trava_as_outras():
+    async def cenario():
+        controle = ControleAdmissao(limite_global=3, limite_por_chave=1, tamanho_fila=4, espera_max=1)
+        a = await controle.entrar("a")
+        espera_a = asyncio.ensure_future(controle.entrar("a"))
+        await asyncio.sleep(0.01)
+        b = await asyncio.wait_for(controle.entrar("b"), 0.5)
+        assert not espera_a.done()
+        a.liberar()
+        (await espera_a).liberar()
+        b.liberar()
+        return controle
+
+    assert rodar(cenario()).em_execucao == 0
+
+
+def test_cancelar_quem_ja_recebeu_a_vaga_devolve_a_vaga():
+    async def cenario():
+        controle = ControleAdmissao(limite_global=1, limite_por_chave=0, tamanho_fila=4, espera_max=1)
+        vaga = await controle.entrar("k")
+        espera = asyncio.ensure_future(controle.entrar("k"))
+        await asyncio.sleep(0.01)
+        # A vaga é concedida ao futuro da fila e o cliente desiste antes de acordar
+        vaga.liberar()
+        espera.cancel()
+        try:
+            concedida = await espera
+        except asyncio.CancelledError:
+            # Cancelamento entregue: a vaga concedida tem que ter voltado
+            assert controle.em_execucao == 0
+        else:
+            # O wait_for pode engolir o cancelamento e entregar a vaga: ela continua de quem a recebeu
+            assert controle.em_execucao == 1
+            concedida.liberar()
+        return controle
+
+    controle = rodar(cenario())
+    assert controle.em_execucao == 0
+    assert controle.stats()["queue_depth"] == 0
+
+
+def test_cancelar_quem_espera_na_fila_remove_o_pedido():
+    async def cenario():
+        controle = ControleAdmissao(limite_global=1, limite_por_chave=0, tamanho_fila=4, espera_max=1)
+        vaga = await controle.entrar("k")
+        espera = asyncio.ensure_future(controle.entrar("k"))
+        await asyncio.sleep(0.01)
+        espera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await espera
+        assert controle.stats()["queue_depth"] == 0
+        vaga.liberar()
+        return controle
+
+    assert rodar(cenario()).em_execucao == 0
@@ -0,0 +1,54 @@
+"""
+/chat/batch com mais mensagens do que o embed_content aceita por chamada (100).
+
+Usa os substitutos locais dos benchmarks (embedder, LLM, Mongo, Redis e SQLite), que
+rejeitam chamadas de embedding acima do limite como o serviço real.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import contextlib
+import io
+import math
+import os
+import sys
+from types import SimpleNamespace
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "benchmarks")]
+
+import httpx  # noqa: E402
+
+import pipeline  # noqa: E402
+
+ITENS = 150
+
+
+def test_lote_acima_do_limite_do_embed_content():
+    args = SimpleNamespace(latencia_llm=0.0, latencia_llm_flash=0.0, latencia_embedding=0.0,
+                           latencia_sql=0.0, usuarios=10, documentos=20, verboso=False)
+    main = pipeline.preparar(args)
+    import resources
+
+    async def executar():
+        async with main.lifespan(main.app):
+            transporte = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transporte, base_url="http://teste", timeout=None) as cliente:
+                modelos = resources.genai.obter().aio.models
+                chamadas, textos = modelos.chamadas, modelos.textos
+                itens = [{"email": f"bench{i % 10 + 1}@eta.com", "user_message": f"Quanto cloro usar no tanque {i}?"}
+                         for i in range(ITENS)]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    r = await cliente.post("/chat/batch", headers={"Authorization": f"Bearer {main.API_TOKEN}"},
+                                           json={"api_key": "teste", "itens": itens})
+                return r, modelos.chamadas - chamadas, modelos.textos - textos
+
+    r, chamadas, textos = asyncio.run(executar())
+    assert r.status_code == 200
+    resultados = r.json()["resultados"]
+    assert len(resultados) == ITENS
+    assert all(x["status"] == 200 for x in resultados)
+    # Um embed_content por lote de até 100; sem a divisão, a chamada única falharia e
+    # cada item geraria o próprio embedding (ITENS chamadas)
+    assert chamadas == math.ceil(ITENS / 100)
+    assert textos == ITENS
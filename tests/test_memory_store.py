@@ -0,0 +1,115 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+import redis
+
+import memory_store
+from memory_index import memory_index
+from memory_store import MAGIC, MemoryStore, chave_hashes, chave_lista, codificar, decodificar
+from session_cache import chave_versao, session_cache
+
+
+def embeddings_falsos(textos):
+    vetores = []
+    for texto in textos:
+        semente = int(hashlib.sha1(texto.encode("utf-8")).hexdigest()[:8], 16)
+        vetor = np.random.default_rng(semente).standard_normal(8).astype(np.float32)
+        vetores.append(vetor / np.linalg.norm(vetor))
+    return vetores
+
+
+@pytest.fixture
+def store(redis_falso, monkeypatch):
+    monkeypatch.setattr(memory_index, "_gerar_embeddings", embeddings_falsos)
+    monkeypatch.setattr(memory_index, "_vetores", type(memory_index._vetores)(maxsize=16))
+    monkeypatch.setattr(session_cache, "_memorias", type(session_cache._memorias)(maxsize=16))
+    return MemoryStore()
+
+
+def dados(store, session_id):
+    return [m["data"] for m in store.ler(session_id)]
+
+
+@pytest.mark.parametrize("conteudo", ["curto", "longo " * 100, {"area": "tratamento", "turno": 2}])
+def test_codificacao_binaria_ida_e_volta(conteudo):
+    instante = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    valor = codificar(conteudo, instante)
+    assert valor[0] == MAGIC
+    assert decodificar(valor) == {"timestamp": instante.isoformat(), "data": conteudo}
+
+
+def test_textos_longos_sao_comprimidos():
+    assert len(codificar("água tratada " * 100)) < len(("água tratada " * 100).encode("utf-8"))
+
+
+def test_le_entradas_no_json_antigo_e_texto_puro():
+    antiga = {"timestamp": "2024-01-01T00:00:00", "data": "prefere o turno da manhã"}
+    assert decodificar(json.dumps(antiga).encode("utf-8")) == antiga
+    assert decodificar(b"texto solto") == "texto solto"
+
+
+def test_deduplica_na_escrita(store):
+    assert store.gravar(1, ["a", "b", "a"]) == 2
+    assert store.gravar(1, ["A ", "c"]) == 1  # mesma normalização do hash
+    assert dados(store, 1) == ["a", "b", "c"]
+    assert store.duplicadas == 2
+
+
+def test_limite_por_sessao_libera_hash_das_descartadas(store, redis_falso, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_MAX_PER_SESSION", 3)
+    for texto in "abcd":
+        store.gravar(2, [texto])
+    assert dados(store, 2) == ["b", "c", "d"]
+    assert redis_falso.scard(chave_hashes(2)) == 3
+    # "a" saiu no LTRIM: pode ser gravada de novo
+    assert store.gravar(2, ["a"]) == 1
+    assert dados(store, 2) == ["c", "d", "a"]
+    assert redis_falso.hlen("memvec:2") == 3
+
+
+def test_escrita_que_falha_nao_marca_a_memoria_como_registrada(store, redis_falso, monkeypatch):
+    original = redis_falso.pipeline
+
+    def falha(*args, **kwargs):
+        raise redis.ConnectionError("queda")
+
+    monkeypatch.setattr(redis_falso, "pipeline", falha)
+    with pytest.raises(redis.ConnectionError):
+        store.gravar(3, ["fato"])
+    monkeypatch.setattr(redis_falso, "pipeline", original)
+
+    assert store.gravar(3, ["fato"]) == 1
+    assert dados(store, 3) == ["fato"]
+
+
+def test_remover_ultima_limpa_hash_e_vetor(store, redis_falso):
+    store.gravar(4, ["x", "y"])
+    assert store.remover_ultima(4)["data"] == "y"
+    assert redis_falso.scard(chave_hashes(4)) == 1
+    assert redis_falso.hlen("memvec:4") == 1
+    assert store.gravar(4, ["y"]) == 1
+
+
+def test_escritas_sobem_a_versao_da_sessao(store, redis_falso):
+    store.gravar(5, ["x"])
+    store.gravar(5, ["y"])
+    store.remover_ultima(5)
+    assert int(redis_falso.get(chave_versao(5))) == 3
+    versao, memorias = store.ler_versionada(5)
+    assert versao == 3 and [m["data"] for m in memorias] == ["x"]
+
+
+def test_compactar_funde_quase_duplicadas(store, redis_falso, monkeypatch):
+    store.gravar(6, ["a", "b", "c"])
+    # Força "a" e "c" a terem o mesmo vetor
+    monkeypatch.setattr(memory_index, "vetores", lambda session_id, textos: [
+        np.ones(8, dtype=np.float32) / np.sqrt(8) if t in ("a", "c") else embeddings_falsos([t])[0] for t in textos
+    ])
+    assert store.compactar(6) == 1
+    assert dados(store, 6) == ["b", "c"]
+    assert redis_falso.scard(chave_hashes(6)) == 2
+    assert redis_falso.hlen("memvec:6") == 2
+    assert redis_falso.llen(chave_lista(6)) == 2
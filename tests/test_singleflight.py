@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, argumentos_canonicos, chave_canonica, coalescido
+
+
+def rodar(corrotina):
+    return asyncio.run(corrotina)
+
+
+def test_chave_canonica_ignora_ordem_das_chaves_e_aplica_defaults():
+    def f(x, y=2):
+        pass
+
+    assert chave_canonica({"a": 1, "b": 2}) == chave_canonica({"b": 2, "a": 1})
+    assert argumentos_canonicos(f, (1,), {}) == argumentos_canonicos(f, (), {"x": 1, "y": 2})
+
+
+def test_chamadas_simultaneas_compartilham_uma_execucao():
+    grupo = SingleFlight("teste_async")
+    execucoes = []
+    seguidoras = []
+
+    async def fabrica():
+        execucoes.append(1)
+        await asyncio.sleep(0.02)
+        return "valor"
+
+    async def cenario():
+        return await asyncio.gather(*(grupo.executar("k", fabrica, ao_seguir=seguidoras.append) for _ in range(5)))
+
+    assert rodar(cenario()) == ["valor"] * 5
+    assert len(execucoes) == 1
+    assert seguidoras == ["valor"] * 4
+    assert grupo.stats()["coalesced"] == 4 and grupo.em_voo() == 0
+
+
+def test_erro_do_lider_chega_a_todas_as_seguidoras():
+    grupo = SingleFlight("teste_erro")
+
+    async def fabrica():
+        await asyncio.sleep(0.01)
+        raise ValueError("falhou")
+
+    async def cenario():
+        return await asyncio.gather(*(grupo.executar("k", fabrica) for _ in range(3)), return_exceptions=True)
+
+    resultados = rodar(cenario())
+    assert all(isinstance(r, ValueError) for r in resultados)
+    assert grupo.execucoes == 1 and grupo.em_voo() == 0
+
+
+def test_lider_cancelado_nao_cancela_as_seguidoras():
+    grupo = SingleFlight("teste_cancelamento")
+
+    async def fabrica():
+        await asyncio.sleep(0.05)
+        return "valor"
+
+    async def cenario():
+        lider = asyncio.ensure_future(grupo.executar("k", fabrica))
+        await asyncio.sleep(0)
+        seguidora = asyncio.ensure_future(grupo.executar("k", fabrica))
+        await asyncio.sleep(0.01)
+        lider.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lider
+        return await seguidora
+
+    assert rodar(cenario()) == "valor"
+    assert grupo.execucoes == 1
+
+
+def test_execucao_cancelada_quando_ninguem_mais_espera():
+    grupo = SingleFlight("teste_abandono")
+    terminou = []
+
+    async def fabrica():
+        await asyncio.sleep(0.05)
+        terminou.append(1)
+
+    async def cenario():
+        unica = asyncio.ensure_future(grupo.executar("k", fabrica))
+        await asyncio.sleep(0.01)
+        unica.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await unica
+        await asyncio.sleep(0.08)
+
+    rodar(cenario())
+    assert terminou == []
+    assert grupo.em_voo() == 0
+
+
+def test_desabilitado_executa_cada_chamada():
+    grupo = SingleFlight("teste_desabilitado", habilitado=False)
+    execucoes = []
+
+    async def fabrica():
+        execucoes.append(1)
+        await asyncio.sleep(0.01)
+        return len(execucoes)
+
+    async def cenario():
+        return await asyncio.gather(*(grupo.executar("k", fabrica) for _ in range(3)))
+
+    assert sorted(rodar(cenario())) == [3, 3, 3]
+    assert len(execucoes) == 3
+    assert grupo.stats()["coalesced"] == 0
+
+
+def test_versao_sync_coalesce_threads_e_propaga_erro():
+    grupo = SingleFlight("teste_sync")
+    execucoes = []
+
+    @coalescido(grupo)
+    def lenta(x):
+        execucoes.append(x)
+        time.sleep(0.05)
+        if x < 0:
+            raise ValueError(x)
+        return x * 2
+
+    resultados, erros = [], []
+
+    def chamar(x):
+        try:
+            resultados.append(lenta(x))
+        except ValueError as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=chamar, args=(x,)) for x in (1, 1, 1, -1, -1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert resultados == [2, 2, 2]
+    assert len(erros) == 2
+    assert sorted(execucoes) == [-1, 1]
+    assert grupo.em_voo() == 0
@@ -0,0 +1,523 @@
+import contextvars
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from async_utils import run_sync
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_DIR = os.getenv("TRACE_DIR", ".traces")
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "200"))
+TRACE_CPU_INTERVAL = float(os.getenv("TRACE_CPU_INTERVAL", "0.005"))
+TRACE_SQL_MAX_CHARS = int(os.getenv("TRACE_SQL_MAX_CHARS", "500"))
+
+REQUEST_ID_VALIDO = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+_trace_atual = contextvars.ContextVar("trace_atual", default=None)
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+_SEM_TRACE = nullcontext()
+
+
+def novo_request_id(recebido=None) -> str:
+    """Usa o X-Request-ID do cliente quando válido; senão gera um."""
+    if recebido and REQUEST_ID_VALIDO.match(recebido):
+        return recebido
+    return uuid.uuid4().hex
+
+
+class AmostradorCPU:
+    """
+    Profiler por amostragem: a cada `intervalo` segundos registra a pilha de todas as
+    threads do processo (inclui outras requisições em andamento). O resultado é o
+    formato "collapsed" (pilha;separada;por;ponto-e-vírgula -> amostras) dos flame graphs.
+    """
+
+    def __init__(self, intervalo=TRACE_CPU_INTERVAL):
+        self.intervalo = intervalo
+        self.amostras = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="cpu-sampler", daemon=True)
+
+    def _loop(self):
+        proprio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            for tid, frame in sys._current_frames().items():
+                if tid == proprio:
+                    continue
+                pilha = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pilha.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    frame = frame.f_back
+                self.amostras[";".join(reversed(pilha))] += 1
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self) -> dict:
+        self._parar.set()
+        self._thread.join()
+        return dict(self.amostras)
+
+
+class Trace:
+    """Spans de uma requisição, exportados no formato Chrome trace (chrome://tracing, Perfetto)."""
+
+    def __init__(self, request_id, perfil_cpu=False):
+        self.request_id = request_id
+        self.inicio = time.perf_counter()
+        self.inicio_epoch = time.time()
+        self.spans = {}
+        self.perfil = None
+        self.amostrador = AmostradorCPU() if perfil_cpu else None
+        self.encerrado = False
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def abrir(self, nome, categoria, pai=None, **atributos):
+        if self.encerrado:
+            return None
+        span = {
+            "id": next(self._ids),
+            "pai": pai,
+            "nome": nome,
+            "categoria": categoria,
+            "inicio": time.perf_counter(),
+            "fim": None,
+            "atributos": atributos,
+        }
+        with self._lock:
+            self.spans[span["id"]] = span
+        return span["id"]
+
+    def fechar(self, span_id, erro=None, **atributos):
+        span = self.spans.get(span_id)
+        if span is None or span["fim"] is not None:
+            return
+        span["fim"] = time.perf_counter()
+        span["atributos"].update(atributos)
+        if erro is not None:
+            span["atributos"]["erro"] = repr(erro)[:300]
+
+    def anotar(self, span_id, **atributos):
+        span = self.spans.get(span_id)
+        if span is not None:
+            span["atributos"].update(atributos)
+
+    @staticmethod
+    def _faixas(spans, agora) -> dict:
+        """
+        Distribui os spans em linhas (tid) do Chrome trace, que aninha eventos pelo tempo:
+        cada span vai para a linha do pai se couber dentro do que está aberto nela,
+        senão para outra linha livre. Ramos paralelos ficam em linhas separadas.
+        """
+        pilhas = []
+        faixas = {}
+        for span in spans:
+            inicio, fim = span["inicio"], span["fim"] if span["fim"] is not None else agora
+            preferida = faixas.get(span["pai"])
+            ordem = ([preferida] if preferida is not None else []) + list(range(len(pilhas)))
+            escolhida = None
+            for faixa in ordem:
+                pilha = pilhas[faixa]
+                while pilha and pilha[-1] <= inicio:
+                    pilha.pop()
+                if not pilha or fim <= pilha[-1]:
+                    escolhida = faixa
+                    break
+            if escolhida is None:
+                pilhas.append([])
+                escolhida = len(pilhas) - 1
+            pilhas[escolhida].append(fim)
+            faixas[span["id"]] = escolhida
+        return faixas
+
+    def chrome(self) -> dict:
+        agora = time.perf_counter()
+        spans = sorted(self.spans.values(), key=lambda s: (s["inicio"], s["id"]))
+        faixas = self._faixas(spans, agora)
+        eventos = []
+        for span in spans:
+            fim = span["fim"] if span["fim"] is not None else agora
+            eventos.append({
+                "name": span["nome"],
+                "cat": span["categoria"],
+                "ph": "X",
+                "ts": round((span["inicio"] - self.inicio) * 1e6, 1),
+                "dur": round((fim - span["inicio"]) * 1e6, 1),
+                "pid": 1,
+                "tid": faixas[span["id"]] + 1,
+                "args": {"span_id": span["id"], "parent_id": span["pai"], "inacabado": span["fim"] is None,
+                         **{k: _serializavel(v) for k, v in span["atributos"].items()}},
+            })
+        dados = {
+            "traceEvents": eventos,
+            "displayTimeUnit": "ms",
+            "otherData": {"request_id": self.request_id, "inicio": self.inicio_epoch},
+        }
+        if self.perfil is not None:
+            dados["otherData"]["cpu_profile"] = {
+                "intervalo": self.amostrador.intervalo,
+                "amostras": sum(self.perfil.values()),
+                "pilhas": self.perfil,
+            }
+        return dados
+
+    def salvar(self, diretorio=TRACE_DIR) -> str:
+        os.makedirs(diretorio, exist_ok=True)
+        caminho = os.path.join(diretorio, f"{self.request_id}.json")
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            json.dump(self.chrome(), arquivo, ensure_ascii=False)
+        _limpar(diretorio)
+        return caminho
+
+
+def _serializavel(valor):
+    if isinstance(valor, (str, int, float, bool)) or valor is None:
+        return valor
+    return str(valor)[:500]
+
+
+def _limpar(diretorio, maximo=TRACE_MAX_FILES):
+    arquivos = [os.path.join(diretorio, n) for n in os.listdir(diretorio) if n.endswith(".json")]
+    if len(arquivos) <= maximo:
+        return
+    arquivos.sort(key=os.path.getmtime)
+    for caminho in arquivos[:len(arquivos) - maximo]:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def caminho_trace(request_id, diretorio=TRACE_DIR):
+    """Arquivo do trace salvo, ou None se o id for inválido ou não existir."""
+    if not REQUEST_ID_VALIDO.match(request_id):
+        return None
+    caminho = os.path.join(diretorio, f"{request_id}.json")
+    return caminho if os.path.exists(caminho) else None
+
+
+# Ciclo de vida
+
+def deve_rastrear(cabecalho) -> tuple[bool, bool]:
+    """(rastrear, perfil_cpu) a partir do header X-Trace ("1"/"true" ou "cpu") e da amostragem."""
+    valor = (cabecalho or "").strip().lower()
+    if valor == "cpu":
+        return True, True
+    if valor in ("1", "true", "yes"):
+        return True, False
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE, False
+
+
+def iniciar(request_id, cabecalho=None, nome="request"):
+    """Abre o trace da requisição, se solicitado ou amostrado. Retorna o Trace ou None."""
+    rastrear, perfil_cpu = deve_rastrear(cabecalho)
+    if not rastrear:
+        return None
+    trace = Trace(request_id, perfil_cpu)
+    _trace_atual.set(trace)
+    _span_atual.set(trace.abrir(nome, "request"))
+    if trace.amostrador is not None:
+        trace.amostrador.iniciar()
+    return trace
+
+
+async def finalizar(trace):
+    """Fecha o span raiz e grava o arquivo. Spans abertos depois disso (ex: curadoria em
+    segundo plano) não entram no trace."""
+    if trace is None or trace.encerrado:
+        return
+    trace.fechar(1)
+    trace.encerrado = True
+    if trace.amostrador is not None:
+        trace.perfil = await run_sync(trace.amostrador.parar)
+    try:
+        await run_sync(trace.salvar)
+    except Exception as e:
+        print(f"⚠️ Falha ao gravar o trace {trace.request_id}: {e}")
+
+
+@asynccontextmanager
+async def rastrear(request_id, cabecalho=None, nome="request"):
+    trace = iniciar(request_id, cabecalho, nome)
+    try:
+        yield trace
+    finally:
+        await finalizar(trace)
+
+
+def ativo() -> bool:
+    return _trace_atual.get() is not None
+
+
+@contextmanager
+def _span(trace, nome, categoria, atributos):
+    span_id = trace.abrir(nome, categoria, _span_atual.get(), **atributos)
+    token = _span_atual.set(span_id)
+    try:
+        yield span_id
+    except BaseException as e:
+        trace.fechar(span_id, erro=e)
+        raise
+    finally:
+        _span_atual.reset(token)
+        trace.fechar(span_id)
+
+
+async def rastreado(nome, coro):
+    """Aguarda a corrotina dentro de um span (ex: ramos executados em paralelo)."""
+    with span(nome):
+        return await coro
+
+
+def span(nome, categoria="stage", **atributos):
+    """Span filho do span corrente; sem trace ativo não faz nada."""
+    trace = _trace_atual.get()
+    if trace is None:
+        return _SEM_TRACE
+    return _span(trace, nome, categoria, atributos)
+
+
+def anotar(**atributos):
+    trace = _trace_atual.get()
+    if trace is not None:
+        trace.anotar(_span_atual.get(), **atributos)
+
+
+# LangChain
+
+class RastreadorLangChain(BaseCallbackHandler):
+    """
+    Spans das chains, chamadas de modelo, tools e passos dos agentes (cada iteração do
+    AgentExecutor aparece como um span agent_step). Usa o parent_run_id do LangChain
+    para montar a árvore sob o span corrente da requisição.
+    """
+
+    run_inline = True
+
+    def __init__(self, trace, pai):
+        self.trace = trace
+        self.pai = pai
+        self._spans = {}
+        self._passos = {}
+        self._tokens = {}
+
+    def _abrir(self, run_id, parent_run_id, nome, categoria, **atributos):
+        pai = self._passos.get(parent_run_id) or self._spans.get(parent_run_id, self.pai)
+        self._spans[run_id] = self.trace.abrir(nome, categoria, pai, **atributos)
+
+    def _fechar(self, run_id, erro=None, **atributos):
+        span_id = self._spans.pop(run_id, None)
+        if span_id is not None:
+            self.trace.fechar(span_id, erro=erro, **atributos)
+
+    @staticmethod
+    def _nome(serialized, kwargs, padrao):
+        if kwargs.get("name"):
+            return kwargs["name"]
+        if serialized:
+            return serialized.get("name") or (serialized.get("id") or [padrao])[-1]
+        return padrao
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._abrir(run_id, parent_run_id, self._nome(serialized, kwargs, "chain"), "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._fechar_passo(run_id)
+        self._fechar(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._fechar_passo(run_id)
+        self._fechar(run_id, erro=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        modelo = (
+            (kwargs.get("invocation_params") or {}).get("model")
+            or (kwargs.get("metadata") or {}).get("ls_model_name")
+            or self._nome(serialized, kwargs, "llm")
+        )
+        self._abrir(run_id, parent_run_id, f"llm {modelo}", "llm", mensagens=sum(len(m) for m in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._abrir(run_id, parent_run_id, self._nome(serialized, kwargs, "llm"), "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        uso = {}
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                uso = getattr(getattr(geracao, "message", None), "usage_metadata", None) or uso
+        self._fechar(run_id, tokens_entrada=uso.get("input_tokens"), tokens_saida=uso.get("output_tokens"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._fechar(run_id, erro=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        nome = self._nome(serialized, kwargs, "tool")
+        self._abrir(run_id, parent_run_id, f"tool {nome}", "tool", entrada=str(input_str)[:300])
+        # Callbacks inline rodam no contexto da própria tool: SQL e Redis dela ficam sob este span
+        self._tokens[run_id] = _span_atual.set(self._spans[run_id])
+
+    def _restaurar(self, run_id):
+        token = self._tokens.pop(run_id, None)
+        if token is not None:
+            try:
+                _span_atual.reset(token)
+            except ValueError:
+                pass
+
+    def on_tool_end(self, output, *, run_id, parent_run_id=None, **kwargs):
+        self._restaurar(run_id)
+        self._fechar(run_id, saida=str(output)[:300])
+        self._fechar_passo(parent_run_id)
+
+    def on_tool_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._restaurar(run_id)
+        self._fechar(run_id, erro=error)
+        self._fechar_passo(parent_run_id)
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        # Um passo do agente vai da ação decidida pelo modelo até o fim da tool
+        self._fechar_passo(run_id)
+        pai = self._spans.get(run_id, self.pai)
+        self._passos[run_id] = self.trace.abrir(f"agent_step {action.tool}", "agent", pai, tool=action.tool)
+
+    def on_agent_finish(self, finish, *, run_id, **kwargs):
+        self._fechar_passo(run_id)
+
+    def _fechar_passo(self, run_id):
+        passo = self._passos.pop(run_id, None)
+        if passo is not None:
+            self.trace.fechar(passo)
+
+
+def callbacks() -> list:
+    """Callbacks para o config das chains: vazio quando a requisição não é rastreada."""
+    trace = _trace_atual.get()
+    if trace is None:
+        return []
+    return [RastreadorLangChain(trace, _span_atual.get())]
+
+
+# Postgres e Redis
+
+def _sql(query) -> str:
+    return " ".join(str(query).split())[:TRACE_SQL_MAX_CHARS]
+
+
+class CursorRastreado:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._span = None
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def execute(self, query, params=None):
+        with span("sql", "sql", sql=_sql(query)) as span_id:
+            self._span = span_id
+            resultado = self._cursor.execute(query, params)
+            anotar(linhas=self._cursor.rowcount)
+            return resultado
+
+    def fetchall(self):
+        linhas = self._cursor.fetchall()
+        self._anotar_linhas(len(linhas))
+        return linhas
+
+    def fetchone(self):
+        linha = self._cursor.fetchone()
+        self._anotar_linhas(0 if linha is None else 1)
+        return linha
+
+    def _anotar_linhas(self, quantidade):
+        trace = _trace_atual.get()
+        if trace is not None and self._span is not None:
+            trace.anotar(self._span, linhas_lidas=quantidade)
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class ConexaoRastreada:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return CursorRastreado(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+
+def envolver_conexao(conn):
+    """Conexão que registra cada comando SQL como span, só em requisições rastreadas."""
+    return ConexaoRastreada(conn) if ativo() else conn
+
+
+class PipelineRastreado:
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def __enter__(self):
+        self._pipe.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._pipe.__exit__(*exc)
+
+    def execute(self, *args, **kwargs):
+        comandos = len(getattr(self._pipe, "command_stack", ()))
+        with span("redis pipeline", "redis", comandos=comandos):
+            return self._pipe.execute(*args, **kwargs)
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._pipe, nome)
+        if not callable(atributo):
+            return atributo
+
+        def chamar(*args, **kwargs):
+            resultado = atributo(*args, **kwargs)
+            # Comandos enfileirados devolvem o próprio pipeline (encadeamento)
+            return self if resultado is self._pipe else resultado
+        return chamar
+
+
+class RedisRastreado:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def pipeline(self, *args, **kwargs):
+        return PipelineRastreado(self._cliente.pipeline(*args, **kwargs))
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._cliente, nome)
+        if not callable(atributo):
+            return atributo
+
+        def chamar(*args, **kwargs):
+            with span(f"redis {nome}", "redis"):
+                return atributo(*args, **kwargs)
+        return chamar
+
+
+def envolver_redis(cliente):
+    """Cliente que registra cada comando Redis como span, só em requisições rastreadas."""
+    return RedisRastreado(cliente) if ativo() else cliente
@@ -1,58 +1,45 @@
-import redis
-import json
-from datetime import datetime, timezone
-import os
-import psycopg2
-from dotenv import load_dotenv
-load_dotenv()
+from db_pool import conexao
+from memory_store import memory_store
+from session_cache import session_cache
+from metrics import medido
 
+def _buscar_session_id(email):
+    with conexao() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT id_funcionario FROM funcionario WHERE email=%s', (email,))
+        dados=cursor.fetchone()
+    if dados is None:
+        raise LookupError(f"Funcionário com email '{email}' não encontrado.")
+    return dados[0]
 
-host = os.getenv('host')
-porta = os.getenv('porta')
-database = os.getenv('database')
-senha = os.getenv('senha')
-user = os.getenv('user')
-def conectar():
-    conn=psycopg2.connect(
-        dbname=database,
-        user=user,
-        password=senha,
-        host=host,
-        port=porta
-        )
-    return conn
+@medido("get_session_id")
+def get_session_id(email):
+    return session_cache.get_session_id(email, _buscar_session_id)
 
-def connect_redis():
-    r = redis.Redis(
-        host=os.getenv('host_redis'),
-        port=os.getenv('port_redis'),
-        password=os.getenv('password'),
-        ssl=True
-    )
-    return r
+def _buscar_session_ids(emails):
+    with conexao() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT email, id_funcionario FROM funcionario WHERE email = ANY(%s)', (list(emails),))
+        return dict(cursor.fetchall())
 
-def get_session_id(email):
+@medido("get_session_ids")
+def get_session_ids(emails):
+    """{email: session_id} de vários usuários com uma única consulta; desconhecidos ficam de fora."""
+    return session_cache.get_session_ids(emails, _buscar_session_ids)
+
+def _carregar_memorias(session_id):
+    return memory_store.ler_versionada(session_id)
+
+# Falhas de leitura retornam 0 em vez de exceção
+@medido("get_memories", falhou=lambda memorias: memorias == 0)
+def get_memories(session_id):
     try:
-        conn=conectar()
-        cursor=conn.cursor()
-        cursor.execute(f'''SELECT id_funcionario FROM funcionario WHERE email='{email}' ''')
-        dados=cursor.fetchone()
+        return session_cache.get_memorias(session_id, _carregar_memorias)
     except Exception as e:
-        conn.rollback()
-    return dados[0]
+        return 0
 
-def get_memories(session_id):
-    key=f'memorys:{session_id}'
+@medido("get_memories_batch")
+def get_memories_batch(session_ids):
+    """{session_id: memórias} de várias sessões em um round trip ao Redis; em falha, {}."""
     try:
-        r = connect_redis()
-        valores = r.lrange(key, 0, -1)
-        valores = [v.decode('utf-8') for v in valores]
-        memoria_objetos = []
-        for v in valores:
-            try:
-                memoria_objetos.append(json.loads(v))
-            except json.JSONDecodeError:
-                memoria_objetos.append(v)
-        return memoria_objetos
+        return session_cache.get_memorias_varias(session_ids, memory_store.ler_varias_versionadas)
     except Exception as e:
-        return 0
\ No newline at end of file
+        return {}